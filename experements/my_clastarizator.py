@@ -11,12 +11,22 @@ Transit-aware clustered shortest path
   route.arrivals[stop_index] = [t0, t1, t2, ...]  # times for successive trips
   length of arrivals[stop_index] должна совпадать для всех stop_index одного route,
   индекс trip_idx относится к одному и тому же физическому рейсу/экземпляру.
+  Внутри Route расписание хранится одной непрерывной матрицей numpy (остановки x рейсы),
+  поиск рейса и проезд по остановкам — old_code/Graphs/Timetable.py.
+
+Запуск примера — из корня репозитория как модуль (скрипт импортирует old_code):
+    python -m experements.my_clastarizator
 """
 
 import heapq
-import bisect
 from collections import defaultdict
 import math
+import time
+
+import numpy as np
+
+from old_code.Graphs import Timetable
+from old_code.Graphs.WeightProfiles import WalkTimeProfile
 
 # -----------------------
 # Базовые структуры
@@ -41,13 +51,16 @@ class Route:
         """
         stops: list of node_ids in order
         travel_times: list len = len(stops)-1, travel_times[i] is time from stops[i] -> stops[i+1]
-        arrivals: list of lists; arrivals[pos][trip_idx] = absolute arrival time of trip_idx at stops[pos]
+        arrivals: list of lists or 2D array; arrivals[pos][trip_idx] = absolute arrival time of trip_idx at stops[pos]
                   for a given route all arrivals[pos] must have same length (#trips)
         """
         self.id = route_id
         self.stops = stops
         self.travel_times = travel_times
-        self.arrivals = arrivals  # 2D list
+        # непрерывная матрица остановки x рейсы: строка - срез без копии, searchsorted по ней - без списков
+        self.arrivals = np.ascontiguousarray(arrivals)
+        if self.arrivals.ndim != 2:
+            self.arrivals = self.arrivals.reshape(len(stops), -1)
 
 # -----------------------
 # Graph container
@@ -59,6 +72,9 @@ class Graph:
         self.routes = {} # route_id -> Route
         # helper: for route quick pos lookup
         self.stop_to_route_pos = {}  # route_id -> {node_id: pos_index}
+        # node_id -> (route_ids, positions, Timetable.StackedRows): строки расписаний всех маршрутов остановки,
+        # ближайший рейс по всем маршрутам - один searchsorted; заводится при первом обращении
+        self.stop_timetables = {}
 
     def add_node(self, node_id, x=0.0, y=0.0):
         if node_id not in self.nodes:
@@ -79,6 +95,52 @@ class Graph:
             self.add_node(stop)
             self.nodes[stop].stop_routes.append(route.id)
             self.stop_to_route_pos[route.id][stop] = i
+            self.stop_timetables.pop(stop, None)
+
+    def get_stop_timetable(self, node_id):
+        timetable = self.stop_timetables.get(node_id)
+        if timetable is None:
+            route_ids = self.nodes[node_id].stop_routes
+            positions = [self.stop_to_route_pos[route_id][node_id] for route_id in route_ids]
+            rows = [self.routes[route_id].arrivals[pos] for route_id, pos in zip(route_ids, positions)]
+            timetable = self.stop_timetables[node_id] = (route_ids, positions, Timetable.StackedRows(rows))
+        return timetable
+
+def add_walk_graph(graph: Graph, walk_graph, profile=None):
+    """
+    Пешеходные рёбра из Graph (old_code/Graphs/Graph.py): node_id - номера узлов того графа (их же
+    возвращает GtfsFeed.snap_stops), вес - время в секундах по профилю (по умолчанию WalkTimeProfile)
+    """
+    weights = (profile or WalkTimeProfile()).compute(walk_graph.edges).tolist()
+    for u, v, data in walk_graph.get_graph().edges(data=True):
+        if u != v:
+            graph.add_undirected_edge(u, v, weights[data['edge_id']])
+    return graph
+
+def add_gtfs_routes(graph: Graph, feed, stop_nodes):
+    """
+    Маршруты из GtfsFeed (old_code/Graphs/GtfsFeed.py): каждый шаблон рейсов — отдельный Route.
+    stop_nodes[номер остановки фида] -> node_id этого графа (например, feed.snap_stops по пешеходному графу),
+    -1 — остановка не привязана и в маршрут не идёт. Времена — секунды от полуночи, поэтому и веса
+    пешеходных рёбер должны быть в секундах.
+    Возвращает список id добавленных маршрутов.
+    """
+    added = []
+    for k, pattern in enumerate(feed.patterns):
+        rows = [pos for pos, stop in enumerate(pattern.stops.tolist()) if stop_nodes[stop] >= 0]
+        if len(rows) < 2 or not pattern.get_num_trips():
+            continue
+        arrivals = pattern.arrivals[rows]
+        departures = pattern.departures[rows]
+        route = Route(
+            f'{feed.route_ids[pattern.route]}:{k}',
+            stops=[int(stop_nodes[stop]) for stop in pattern.stops[rows].tolist()],
+            travel_times=np.median(arrivals[1:] - departures[:-1], axis=1).tolist(),
+            arrivals=arrivals,
+        )
+        graph.add_route(route)
+        added.append(route.id)
+    return added
 
 # -----------------------
 # Dijkstra ограниченный (до k найденных вершин)
@@ -236,17 +298,17 @@ def build_compressed_graph(graph: Graph, clusters, cluster_dist):
 # Модифицированный Dijkstra с учётом поездок по расписанию
 # -----------------------
 
-def next_trip_index(arrivals_list, current_time):
-    """Возвращает индекс trip >= current_time, либо None"""
-    i = bisect.bisect_left(arrivals_list, current_time)
-    if i < len(arrivals_list):
-        return i
-    return None
+def next_trip_index(route: Route, pos, current_time):
+    """Возвращает индекс trip >= current_time на остановке pos, либо None"""
+    trip_idx = Timetable.next_trip(route.arrivals, pos, current_time)
+    return trip_idx if trip_idx != Timetable.NO_TRIP else None
 
 def modified_dijkstra_with_transit(graph: Graph, comp_graph: CompressedGraph,
                                    clusters, cluster_dist,
-                                   start_id, target_id, start_time):
+                                   start_id, target_id, start_time, stats=None):
     """
+    stats: необязательный SearchStats (old_code/Graphs/SearchStats.py) — счётчики работы поиска;
+           при None никакого учёта не ведётся
     Возвращает tuple (best_arrival_time, prev_map)
     prev_map: node_id -> (prev_node, action)
       action: ('walk',)  # пришли пешком
@@ -257,10 +319,13 @@ def modified_dijkstra_with_transit(graph: Graph, comp_graph: CompressedGraph,
     dist = defaultdict(lambda: INF)
     prev = {}  # node -> (prev_node, action)
     pq = []
+    search_start = time.perf_counter() if stats is not None else None
 
     # initialize: положим в очередь стартовую вершину
     dist[start_id] = start_time
     heapq.heappush(pq, (start_time, start_id))
+    if stats is not None:
+        stats.pushes += 1
 
     # также добавляем сразу интересующие вершины из кластеров стартовой вершины
     start_clusters = graph.nodes[start_id].clusters
@@ -277,17 +342,27 @@ def modified_dijkstra_with_transit(graph: Graph, comp_graph: CompressedGraph,
                     continue
                 if v in dmap:
                     t_arr = start_time + dmap[v]
+                    if stats is not None:
+                        stats.relaxed += 1
                     if t_arr < dist[v]:
                         dist[v] = t_arr
                         prev[v] = (start_id, ('walk',))
                         heapq.heappush(pq, (t_arr, v))
+                        if stats is not None:
+                            stats.pushes += 1
 
     target_clusters = graph.nodes[target_id].clusters
 
     while pq:
         cur_time, u = heapq.heappop(pq)
+        if stats is not None:
+            stats.pops += 1
         if cur_time != dist[u]:
+            if stats is not None:
+                stats.stale_pops += 1
             continue
+        if stats is not None:
+            stats.settled += 1
 
         # если u и target имеют общий кластер — можем завершить быстро, если известна внутренняя дистанция
         if graph.nodes[u].clusters & target_clusters:
@@ -303,29 +378,34 @@ def modified_dijkstra_with_transit(graph: Graph, comp_graph: CompressedGraph,
                 # установим prev для target (чтобы восстановить) и вернём
                 prev[target_id] = (u, ('walk_to_target_in_cluster',))
                 dist[target_id] = best_total
+                if stats is not None:
+                    stats.search_time += time.perf_counter() - search_start
                 return best_total, prev
 
         # 1) раскрываем компрессированные пешеходные рёбра (walk между boundary/stop)
         for v, w in comp_graph.adj.get(u, []):
             arrival = cur_time + w
+            if stats is not None:
+                stats.relaxed += 1
             if arrival < dist[v]:
                 dist[v] = arrival
                 prev[v] = (u, ('walk',))
                 heapq.heappush(pq, (arrival, v))
+                if stats is not None:
+                    stats.pushes += 1
 
         # 2) если u — остановка, обработать маршруты (wait/ride)
         node_obj = graph.nodes[u]
         if node_obj.stop_routes:
-            for route_id in node_obj.stop_routes:
-                route = graph.routes[route_id]
-                pos = graph.stop_to_route_pos[route_id][u]
-                arrivals_here = route.arrivals[pos]  # list of times for trips at this stop
-
-                trip_idx = next_trip_index(arrivals_here, cur_time)
-                if trip_idx is None:
+            # ближайший рейс сразу по всем маршрутам остановки
+            route_ids, positions, stacked = graph.get_stop_timetable(u)
+            trips = stacked.next_trips(cur_time).tolist()
+            for route_id, pos, trip_idx in zip(route_ids, positions, trips):
+                if trip_idx == Timetable.NO_TRIP:
                     continue
+                route = graph.routes[route_id]
 
-                arrival_time_here = arrivals_here[trip_idx]
+                arrival_time_here = float(route.arrivals[pos, trip_idx])
                 if arrival_time_here > cur_time:
                     # надо ждать: добавляем саму точку u с временем arrival_time_here
                     # action 'wait' означает, что позже при обработке мы сядем на trip_idx
@@ -333,36 +413,50 @@ def modified_dijkstra_with_transit(graph: Graph, comp_graph: CompressedGraph,
                         dist[u] = arrival_time_here
                         prev[u] = (u, ('wait', route_id, trip_idx))
                         heapq.heappush(pq, (arrival_time_here, u))
+                        if stats is not None:
+                            stats.pushes += 1
                     # после ожидания мы обработаем посадку (попади снова на эту вершину)
                 else:
                     # можем сразу сесть на trip_idx
-                    # переберём все последующие остановки и положим их с их times
-                    # предположение: route.arrivals[p][trip_idx] даёт время прибытия этого же trip на stop p
-                    for p in range(pos + 1, len(route.stops)):
+                    # все последующие остановки сравниваются одним срезом столбца trip_idx,
+                    # в очередь идут только те, куда рейс приезжает раньше уже известного
+                    later_stops = route.stops[pos + 1:]
+                    best = np.fromiter((dist[v] for v in later_stops), dtype=np.float64, count=len(later_stops))
+                    ride_positions, arrivals_at = Timetable.ride_scan(route.arrivals, pos, trip_idx, best)
+                    if stats is not None:
+                        stats.relaxed += len(later_stops)
+                    for p, arrival_at_dest in zip(ride_positions.tolist(), arrivals_at.tolist()):
                         dest_node = route.stops[p]
-                        arrival_at_dest = route.arrivals[p][trip_idx]
-                        # добавить в очередь
+                        # на кольцевом маршруте остановка может повториться - проверяем ещё раз
                         if arrival_at_dest < dist[dest_node]:
                             dist[dest_node] = arrival_at_dest
                             prev[dest_node] = (u, ('ride', route_id, trip_idx))
                             heapq.heappush(pq, (arrival_at_dest, dest_node))
+                            if stats is not None:
+                                stats.pushes += 1
 
         # 3) раскрывать "локальные" несжатые соседи внутри кластеров не обязательно,
         #    но можно при желании — здесь пропускаем (оптимизация). Если нужно, добавить.
 
+    if stats is not None:
+        stats.search_time += time.perf_counter() - search_start
     return None, prev  # путь не найден
 
 # -----------------------
 # Восстановление пути (простая версия)
 # -----------------------
 
-def reconstruct_path(prev_map, start_id, target_id):
+def reconstruct_path(prev_map, start_id, target_id, stats=None):
     """
     prev_map: node -> (prev_node, action)
+    stats: необязательный SearchStats, в unpack_time добавляется время восстановления
     Возвращаем список событий в порядке (start -> ... -> target):
       [(node_id, action_desc, time_unknown), ...]
     Заметьте: точные времена не реконструируются здесь (они в dist). Мы возвращаем только последовательность узлов и тип перехода.
     """
+    if stats is not None:
+        with stats.timer('unpack_time'):
+            return reconstruct_path(prev_map, start_id, target_id)
     if target_id not in prev_map:
         return None
     path_nodes = []
@@ -1,6 +1,6 @@
-import math
 import os
 
+from old_code.Graphs.Geodesic import haversine
 from old_code.Modes.DefaultMode import DefaultMode
 from old_code.Modes.PublicTransportMode import PublicTransportMode
 from old_code.Modes.ScooterMode import ScooterMode
@@ -35,7 +35,7 @@ def get_node_by_coords(value, graph):
         coords = graph.get_node_coords(sorted_nodes[mid])
 
         # Вычисляем расстояние между текущими координатами и искомыми
-        distance = graph.haversine(coords, value)
+        distance = haversine(coords, value)
 
         # Если нашли более близкий узел, обновляем best_node
         if distance < best_distance:
@@ -60,22 +60,6 @@ def get_mode_class(mode, file):
     else:
         return DefaultMode(file=file)
 
-def haversine(point_a, point_b):
-    R = 6371.0
-
-    lat_a, lon_a = math.radians(point_a[0]), math.radians(point_a[1])
-    lat_b, lon_b = math.radians(point_b[0]), math.radians(point_b[1])
-
-    dlat = lat_b - lat_a
-    dlon = lon_b - lon_a
-
-    a = (math.sin(dlat / 2) ** 2 +
-     math.cos(lat_a) * math.cos(lat_b) * math.sin(dlon / 2) ** 2)
-    c = 2 * math.asin(math.sqrt(a))
-
-    distance = R * c
-    return distance * 1000
-
 # Использование
 output_dir = "../city_polygons"
 delete_empty_files(output_dir)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import resource
+import time
+import tracemalloc
+
+import networkx as nx
+import osmium
+
+from old_code.Graphs.Geodesic import segment_lengths
+
+
+def get_peak_rss_mb():
+    # ru_maxrss в Linux в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IngestionBenchmark:
+    '''
+    Раскладывает построение графа режима (DefaultMode.get_graph) на фазы:
+      decode     — чтение pbf osmium'ом без координат
+      locations  — чтение с with_locations() (кэш координат узлов)
+      tags       — питоновский цикл проверки тегов
+      haversine  — длины всех рёбер (одним векторным вызовом, как в Graph.add_ways)
+      networkx   — вставка узлов и рёбер в nx.Graph
+      total      — честный mode.get_graph() целиком; с location_index — get_graph_filtered
+                   (фильтры osmium и индекс координат на диске), он тогда идёт первым, чтобы его пиковый
+                   RSS не перекрывали проходы с координатами в памяти
+    Фазы osmium пересекаются, поэтому decode/locations/tags меряются отдельными проходами,
+    а время фазы — разница с предыдущим проходом.
+    '''
+
+    def __init__(self, mode, use_tracemalloc=False, location_index=None):
+        self.mode = mode
+        self.location_index = location_index
+        self.file = mode.area_file
+        self.use_tracemalloc = use_tracemalloc
+        self.phases = {}
+        self.traced_peaks = {}
+        self.top_allocations = []
+
+    def measure(self, name, func):
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        start_time = time.perf_counter()
+        result = func()
+        self.phases[name] = time.perf_counter() - start_time
+        if self.use_tracemalloc:
+            self.traced_peaks[name] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            if name == 'total':
+                snapshot = tracemalloc.take_snapshot()
+                self.top_allocations = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+            tracemalloc.stop()
+        return result
+
+    def decode(self):
+        count = 0
+        for _ in osmium.FileProcessor(self.file):
+            count += 1
+        return count
+
+    def locations(self):
+        count = 0
+        for _ in osmium.FileProcessor(self.file).with_locations():
+            count += 1
+        return count
+
+    def tags(self):
+        # собираем координаты подходящих путей, чтобы дальше мерить длины и вставку без osmium
+        target_dict = self.mode.get_target_dict()
+        ways = []
+        for obj in osmium.FileProcessor(self.file).with_locations():
+            if self.mode.is_suitable(obj, target_dict) and obj.is_way() and len(obj.nodes) > 0:
+                ways.append([(node.ref, node.lat, node.lon) for node in obj.nodes])
+        return ways
+
+    def haversine(self, ways):
+        # как в Graph.add_ways: координаты всех путей подряд, длины - одним вызовом, стыки путей пропускаем
+        lats = [lat for way in ways for _, lat, _ in way]
+        lons = [lon for way in ways for _, _, lon in way]
+        all_lengths = segment_lengths(lats, lons, self.mode.graph.length_method).tolist() if len(lats) > 1 else []
+        lengths, offset = [], 0
+        for way in ways:
+            lengths.append(all_lengths[offset:offset + len(way) - 1])
+            offset += len(way)
+        return lengths
+
+    @staticmethod
+    def networkx(ways, lengths):
+        # как в Graph.add_way: id OSM -> плотный номер, номера — узлы nx
+        graph = nx.Graph()
+        node_index = {}
+        for way, way_lengths in zip(ways, lengths):
+            prev_index = node_index.setdefault(way[0][0], len(node_index))
+            graph.add_node(prev_index)
+            for i in range(1, len(way)):
+                curr_index = node_index.setdefault(way[i][0], len(node_index))
+                graph.add_node(curr_index)
+                graph.add_edge(prev_index, curr_index, weight=way_lengths[i - 1])
+                prev_index = curr_index
+        return graph
+
+    def run(self):
+        graph = None
+        if self.location_index is not None:
+            graph = self.measure('total', lambda: self.mode.get_graph(self.location_index)).get_graph()
+            total_rss = get_peak_rss_mb()
+        objects = self.measure('decode', self.decode)
+        self.measure('locations', self.locations)
+        ways = self.measure('tags', self.tags)
+        lengths = self.measure('haversine', lambda: self.haversine(ways))
+        self.measure('networkx', lambda: self.networkx(ways, lengths))
+        del ways, lengths
+        if graph is None:
+            graph = self.measure('total', self.mode.get_graph).get_graph()
+            total_rss = get_peak_rss_mb()
+
+        phases = {
+            'decode': self.phases['decode'],
+            'locations': max(self.phases['locations'] - self.phases['decode'], 0.0),
+            'tags': max(self.phases['tags'] - self.phases['locations'], 0.0),
+            'haversine': self.phases['haversine'],
+            'networkx': self.phases['networkx'],
+            'total': self.phases['total'],
+        }
+        return {
+            'file': self.file,
+            'objects': objects,
+            'nodes': graph.number_of_nodes(),
+            'edges': graph.number_of_edges(),
+            'phases_s': phases,
+            'objects_per_s': objects / self.phases['total'] if self.phases['total'] else None,
+            'peak_rss_mb': get_peak_rss_mb(),
+            'peak_rss_total_mb': total_rss,
+            'location_index': self.location_index,
+            'tracemalloc_peak_mb': self.traced_peaks or None,
+            'top_allocations': self.top_allocations or None,
+        }
@@ -0,0 +1,54 @@
+import json
+import random
+
+import networkx as nx
+
+
+class QuerySet:
+    '''
+    Воспроизводимый набор пар (откуда, куда) для бенчмарков.
+    Точки хранятся координатами, чтобы набор не зависел от того, чем ключуются узлы графа.
+    '''
+
+    def __init__(self, queries, city=None, mode=None, seed=None):
+        self.queries = queries  # список пар ((lat, lon), (lat, lon))
+        self.city = city
+        self.mode = mode
+        self.seed = seed
+
+    @classmethod
+    def generate(cls, graph, count, seed=0, city=None, mode=None):
+        '''Случайные пары узлов из самой большой компоненты связности графа'''
+        nx_graph = graph.get_graph()
+        component = max(nx.connected_components(nx_graph), key=len)
+        # сортируем, чтобы выбор зависел только от seed, а не от порядка вставки узлов
+        nodes = sorted(component, key=graph.get_node_coords)
+        rnd = random.Random(seed)
+        queries = []
+        while len(queries) < count and len(nodes) > 1:
+            start, end = rnd.sample(nodes, 2)
+            queries.append((tuple(graph.get_node_coords(start)), tuple(graph.get_node_coords(end))))
+        return cls(queries, city=city, mode=mode, seed=seed)
+
+    def save(self, file_name):
+        data = {
+            'city': self.city,
+            'mode': self.mode,
+            'seed': self.seed,
+            'queries': [{'source': list(s), 'target': list(t)} for s, t in self.queries],
+        }
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, file_name):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        queries = [(tuple(q['source']), tuple(q['target'])) for q in data['queries']]
+        return cls(queries, city=data.get('city'), mode=data.get('mode'), seed=data.get('seed'))
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __iter__(self):
+        return iter(self.queries)
@@ -0,0 +1,136 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+from old_code.Graphs.SearchStats import SearchStats, SearchStatsCollector
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'mean': float(np.mean(values))}
+
+
+def get_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class RoutingBenchmark:
+    '''
+    Прогоняет набор запросов через движки маршрутизации и собирает
+    p50/p95/p99 задержки, число осевших вершин, время предобработки и пиковую память.
+    Задержки меряются без SearchStats, счётчики — отдельным проходом с ним.
+    '''
+
+    def __init__(self, graph, query_set, engines, memory_sample=20):
+        self.graph = graph
+        self.query_set = query_set
+        self.engines = engines  # список экземпляров RoutingEngine
+        self.memory_sample = memory_sample  # сколько запросов гонять под tracemalloc
+        self.coords_to_node = {tuple(graph.get_node_coords(node)): node for node in graph.get_graph().nodes()}
+
+    def get_queries(self):
+        return [(self.coords_to_node[s], self.coords_to_node[t]) for s, t in self.query_set]
+
+    def run_engine(self, engine, queries):
+        start_time = time.perf_counter()
+        engine.prepare(self.graph)
+        preprocessing = time.perf_counter() - start_time
+
+        latencies = []
+        failed = 0
+        for start, end in queries:
+            start_time = time.perf_counter()
+            try:
+                engine.route(start, end)
+            except nx.NetworkXNoPath:
+                failed += 1
+                continue
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+        collector = SearchStatsCollector()
+        for start, end in queries:
+            stats = SearchStats(label=(self.graph.get_node_coords(start), self.graph.get_node_coords(end)))
+            try:
+                with stats.timer('search_time'):
+                    engine.route(start, end, stats=stats)
+            except nx.NetworkXNoPath:
+                pass
+            collector.add(stats)
+
+        # память меряем отдельным проходом: tracemalloc сильно замедляет и портил бы задержки
+        tracemalloc.start()
+        engine.prepare(self.graph)
+        for start, end in queries[:self.memory_sample]:
+            try:
+                engine.route(start, end)
+            except nx.NetworkXNoPath:
+                pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'queries': len(queries),
+            'failed': failed,
+            'preprocessing_s': preprocessing,
+            'latency_ms': percentiles(latencies),
+            'settled_nodes': percentiles([stats.settled for stats in collector.stats]),
+            'relaxed_edges': percentiles([stats.relaxed for stats in collector.stats]),
+            'peak_memory_mb': peak / 2 ** 20,
+            'histograms': collector.histograms(),
+            'worst_queries': [{'query': stats.label, **stats.as_dict()} for stats in collector.worst('settled', 5)],
+        }
+
+    def run(self):
+        queries = self.get_queries()
+        nx_graph = self.graph.get_graph()
+        result = {
+            'meta': {
+                'commit': get_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'city': self.query_set.city,
+                'mode': self.query_set.mode,
+                'seed': self.query_set.seed,
+                'nodes': nx_graph.number_of_nodes(),
+                'edges': nx_graph.number_of_edges(),
+            },
+            'engines': {},
+        }
+        for engine in self.engines:
+            result['engines'][engine.name] = self.run_engine(engine, queries)
+        return result
+
+    @staticmethod
+    def save(result, file_name):
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def compare(old_result, new_result):
+        '''Сравнение двух прогонов (например, с разных коммитов): отношение new / old по основным метрикам'''
+        rows = []
+        for name, new in new_result['engines'].items():
+            old = old_result['engines'].get(name)
+            if old is None:
+                continue
+            for metric, key in (('latency_ms', 'p50'), ('latency_ms', 'p95'), ('latency_ms', 'p99'),
+                                ('settled_nodes', 'p50')):
+                old_value, new_value = old[metric][key], new[metric][key]
+                ratio = new_value / old_value if old_value else None
+                rows.append((name, f'{metric}.{key}', old_value, new_value, ratio))
+            old_value, new_value = old['preprocessing_s'], new['preprocessing_s']
+            rows.append((name, 'preprocessing_s', old_value, new_value, new_value / old_value if old_value else None))
+            old_value, new_value = old['peak_memory_mb'], new['peak_memory_mb']
+            rows.append((name, 'peak_memory_mb', old_value, new_value, new_value / old_value if old_value else None))
+        return rows
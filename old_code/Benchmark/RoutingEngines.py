@@ -0,0 +1,104 @@
+import networkx as nx
+
+from old_code.Graphs import InstrumentedSearch
+from old_code.Graphs.AlternativeRoutes import AlternativeRoutes
+from old_code.Graphs.CSRGraph import CSRGraph
+from old_code.Graphs.PartitionRouter import GraphPartition, PartitionRouter
+from old_code.Graphs.aStarPath import aStarPath
+
+
+class RoutingEngine:
+    '''
+    Общий интерфейс движка: prepare(graph) — предобработка,
+    route(start, end, stats=None) -> путь; stats — необязательный SearchStats
+    '''
+    name = 'base'
+
+    def __init__(self):
+        self.graph = None
+
+    def prepare(self, graph):
+        self.graph = graph
+
+    def route(self, start, end, stats=None):
+        raise NotImplementedError
+
+
+class NxDijkstraEngine(RoutingEngine):
+    name = 'nx-dijkstra'
+
+    def route(self, start, end, stats=None):
+        if stats is not None:
+            return InstrumentedSearch.dijkstra_path(self.graph.get_graph(), start, end, 'weight', stats)
+        return nx.shortest_path(self.graph.get_graph(), start, end, weight='weight', method='dijkstra')
+
+
+class NxAStarEngine(RoutingEngine):
+    name = 'nx-astar'
+
+    def prepare(self, graph):
+        self.graph = graph
+        self.a_star = aStarPath(graph)
+
+    def route(self, start, end, stats=None):
+        return self.a_star.a_star_path(start, end, stats=stats)
+
+
+class CSRDijkstraEngine(RoutingEngine):
+    name = 'csr-dijkstra'
+
+    def prepare(self, graph):
+        self.graph = graph
+        self.csr = CSRGraph.from_graph(graph)
+        self.nodes = list(graph.get_graph().nodes())
+
+    def route(self, start, end, stats=None):
+        path, _ = self.csr.shortest_path(self.csr.node_index[start], self.csr.node_index[end], stats=stats)
+        return [self.nodes[i] for i in path]
+
+
+class PartitionEngine(CSRDijkstraEngine):
+    '''Многоуровневый поиск по разбиению; в предобработку входят и разбиение, и customization'''
+    name = 'crp'
+
+    def __init__(self, cell_sizes=(128, 1024, 8192)):
+        super().__init__()
+        self.cell_sizes = cell_sizes
+
+    def prepare(self, graph):
+        super().prepare(graph)
+        self.router = PartitionRouter(self.csr, GraphPartition.build(self.csr, cell_sizes=self.cell_sizes))
+        self.router.customize()
+
+    def route(self, start, end, stats=None):
+        path, _ = self.router.shortest_path(self.csr.node_index[start], self.csr.node_index[end], stats=stats)
+        return [self.nodes[i] for i in path]
+
+
+class AlternativesEngine(CSRDijkstraEngine):
+    '''Время запроса — поиск k альтернатив целиком, маршрутом считается первый (кратчайший)'''
+    name = 'alternatives'
+
+    def __init__(self, k=3):
+        super().__init__()
+        self.k = k
+
+    def prepare(self, graph):
+        super().prepare(graph)
+        self.alternatives = AlternativeRoutes(self.csr)
+
+    def route(self, start, end, stats=None):
+        routes = self.alternatives.find(self.csr.node_index[start], self.csr.node_index[end], self.k, stats=stats)
+        if not routes:
+            raise nx.NetworkXNoPath(f'Node {end} not reachable from {start}')
+        return [self.nodes[i] for i in routes[0][0]]
+
+
+# все движки, которые умеет гонять бенчмарк; новые добавлять сюда
+ENGINES = {
+    NxDijkstraEngine.name: NxDijkstraEngine,
+    NxAStarEngine.name: NxAStarEngine,
+    CSRDijkstraEngine.name: CSRDijkstraEngine,
+    PartitionEngine.name: PartitionEngine,
+    AlternativesEngine.name: AlternativesEngine,
+}
@@ -0,0 +1,82 @@
+import math
+import random
+from collections import namedtuple
+
+from old_code.Graphs.Graph import Graph
+
+# Узел пути в том же виде, что и osmium.osm.NodeRef: ref, lat, lon
+WayNode = namedtuple('WayNode', ['ref', 'lat', 'lon'])
+
+
+class SyntheticCity:
+    '''
+    Искусственный город-решётка для офлайн прогонов бенчмарков
+    (без pbf-файлов). Ведёт себя как режим: get_graph() возвращает Graph.
+    '''
+
+    def __init__(self, rows, cols, step=100.0, origin=(56.8, 60.6), jitter=0.2, drop=0.1, seed=0):
+        self.rows = rows
+        self.cols = cols
+        self.step = step  # метров между соседними перекрёстками
+        self.origin = origin
+        self.jitter = jitter  # доля шага, на которую сдвигаем перекрёстки
+        self.drop = drop  # доля выкинутых кварталов улиц, чтобы пути не были тривиальными
+        self.seed = seed
+        self.graph = Graph()
+
+    def get_nodes(self):
+        rnd = random.Random(self.seed)
+        lat0, lon0 = self.origin
+        dlat = self.step / 111320.0
+        dlon = self.step / (111320.0 * math.cos(math.radians(lat0)))
+        nodes = {}
+        for r in range(self.rows):
+            for c in range(self.cols):
+                lat = lat0 + (r + rnd.uniform(-self.jitter, self.jitter)) * dlat
+                lon = lon0 + (c + rnd.uniform(-self.jitter, self.jitter)) * dlon
+                nodes[(r, c)] = WayNode(r * self.cols + c + 1, round(lat, 7), round(lon, 7))
+        return nodes
+
+    def get_ways(self):
+        '''
+        Возвращает список путей (списков WayNode): улица идёт вдоль строки или столбца решётки
+        и рвётся там, где квартал выкинут
+        '''
+        rnd = random.Random(self.seed + 1)
+        nodes = self.get_nodes()
+        lines = [[(r, c) for c in range(self.cols)] for r in range(self.rows)]
+        lines += [[(r, c) for r in range(self.rows)] for c in range(self.cols)]
+        ways = []
+        for line in lines:
+            way = [nodes[line[0]]]
+            for i in range(1, len(line)):
+                if rnd.random() < self.drop:
+                    if len(way) > 1:
+                        ways.append(way)
+                    way = [nodes[line[i]]]
+                else:
+                    way.append(nodes[line[i]])
+            if len(way) > 1:
+                ways.append(way)
+        return ways
+
+    def write_pbf(self, file_name, tag=('highway', 'footway')):
+        '''Сохраняет город в .osm.pbf, чтобы гонять по нему настоящие режимы через osmium'''
+        import osmium
+
+        ways = self.get_ways()
+        with osmium.SimpleWriter(file_name, overwrite=True) as writer:
+            for node in sorted(self.get_nodes().values()):
+                writer.add_node(osmium.osm.mutable.Node(id=node.ref, location=(node.lon, node.lat)))
+            for way_id, way in enumerate(ways, start=1):
+                writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=[node.ref for node in way],
+                                                      tags={tag[0]: tag[1]}))
+        return file_name
+
+    def get_graph(self):
+        for way in self.get_ways():
+            self.graph.add_way(way)
+        return self.graph
+
+    def get_shortest_route(self, start, end):
+        return self.graph.get_shortest_route(start, end)
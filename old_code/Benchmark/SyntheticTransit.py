@@ -0,0 +1,92 @@
+import random
+
+import networkx as nx
+import numpy as np
+
+from old_code.Graphs.Geodesic import segment_lengths
+from old_code.Graphs.GtfsFeed import GtfsFeed, TripPattern
+
+PEAK_HOURS = ((7, 10), (17, 20))  # в часы пик рейсы вдвое чаще
+
+
+class SyntheticTransit:
+    '''
+    Искусственная сеть маршрутов поверх пешеходного Graph для прогонов транспортных поисков без GTFS.
+    Маршрут — кратчайший путь между двумя далёкими узлами, остановки — узлы пути через stop_spacing метров,
+    рейсы в обе стороны с first до last через headway секунд. get_feed() возвращает GtfsFeed и узлы
+    графа для остановок — то же, что дал бы GtfsFeed.load + snap_stops
+    '''
+
+    def __init__(self, graph, routes=40, stop_spacing=400.0, speed=20.0, dwell=20, headway=900,
+                 first=5 * 3600, last=24 * 3600, min_length=3000.0, seed=0):
+        self.graph = graph
+        self.routes = routes
+        self.stop_spacing = stop_spacing  # метров
+        self.speed = speed  # км/ч
+        self.dwell = dwell  # секунд стоянки на остановке
+        self.headway = headway
+        self.first = first
+        self.last = last
+        self.min_length = min_length
+        self.seed = seed
+
+    def get_stops(self, path):
+        '''Узлы пути, где ставим остановки, и расстояния между соседними остановками'''
+        lats = [self.graph.get_node_coords(node)[0] for node in path]
+        lons = [self.graph.get_node_coords(node)[1] for node in path]
+        cumulative = np.concatenate([[0.0], np.cumsum(segment_lengths(lats, lons))])
+        stops, positions = [path[0]], [0.0]
+        for node, position in zip(path[1:], cumulative[1:].tolist()):
+            if position - positions[-1] >= self.stop_spacing:
+                stops.append(node)
+                positions.append(position)
+        if stops[-1] != path[-1]:
+            stops.append(path[-1])
+            positions.append(float(cumulative[-1]))
+        return stops, np.diff(positions)
+
+    def get_departures(self):
+        departures, time = [], self.first
+        while time < self.last:
+            departures.append(time)
+            peak = any(start * 3600 <= time < end * 3600 for start, end in PEAK_HOURS)
+            time += self.headway // 2 if peak else self.headway
+        return np.array(departures, dtype=np.int32)
+
+    def get_feed(self):
+        rnd = random.Random(self.seed)
+        nx_graph = self.graph.get_graph()
+        nodes = sorted(max(nx.connected_components(nx_graph), key=len))
+        stop_index, stop_nodes, lines = {}, [], []
+        attempts = 0
+        while len(lines) < self.routes and attempts < self.routes * 20:
+            attempts += 1
+            source, target = rnd.sample(nodes, 2)
+            path = nx.shortest_path(nx_graph, source, target, weight='weight')
+            stops, gaps = self.get_stops(path)
+            if len(stops) < 3 or gaps.sum() < self.min_length:
+                continue
+            for node in stops:
+                if node not in stop_index:
+                    stop_index[node] = len(stop_nodes)
+                    stop_nodes.append(node)
+            lines.append((stops, gaps))
+
+        departures = self.get_departures()
+        patterns, route_ids = [], []
+        for r, (stops, gaps) in enumerate(lines):
+            route_ids.append(f'S{r}')
+            for direction in (stops, stops[::-1]):
+                direction_gaps = gaps if direction is stops else gaps[::-1]
+                offsets = np.concatenate([[0], np.cumsum(np.round(direction_gaps / (self.speed / 3.6)) + self.dwell)])
+                arrivals = np.ascontiguousarray((offsets[:, None] + departures[None, :]).astype(np.int32))
+                patterns.append(TripPattern(r, np.array([stop_index[node] for node in direction], dtype=np.int32),
+                                            arrivals, arrivals.copy(),
+                                            [f'S{r}_{len(patterns)}_{k}' for k in range(len(departures))]))
+        coords = [self.graph.get_node_coords(node) for node in stop_nodes]
+        feed = GtfsFeed([str(self.graph.get_osm_id(node)) for node in stop_nodes], [''] * len(stop_nodes),
+                        np.array([lat for lat, _ in coords], dtype=np.float64),
+                        np.array([lon for _, lon in coords], dtype=np.float64),
+                        route_ids, route_ids, np.full(len(route_ids), 3, dtype=np.int32), patterns,
+                        meta={'synthetic': True, 'seed': self.seed})
+        return feed, np.array(stop_nodes, dtype=np.int64)
@@ -0,0 +1,140 @@
+import heapq
+import math
+
+
+class AlternativeRoutes:
+    '''
+    Несколько заметно разных маршрутов по CSRGraph методом штрафов: после каждого найденного пути веса
+    его рёбер умножаются на (1 + penalty), и следующий поиск уходит в сторону. Маршрут принимается, если
+    его настоящий вес не больше max_stretch * кратчайший и общая с уже принятыми часть не больше
+    max_share его веса.
+    Общая работа на все поиски — одна обратная Дейкстра от цели до радиуса max_stretch * кратчайший:
+      - она даёт кратчайший путь (по дереву обратного поиска) без отдельного поиска,
+      - её расстояния — точная нижняя оценка для A*: штрафы веса только увеличивают, так что оценка
+        остаётся допустимой, а каждый A* со штрафами обходит немногим больше самого маршрута,
+      - узлы дальше радиуса не могут лежать на допустимом маршруте, и A* их не смотрит.
+    '''
+
+    def __init__(self, csr, max_stretch=1.3, max_share=0.7, penalty=0.5, max_attempts=None):
+        self.csr = csr
+        self.max_stretch = max_stretch
+        self.max_share = max_share
+        self.penalty = penalty
+        self.max_attempts = max_attempts  # поисков со штрафами; по умолчанию 2k
+
+    def backward_search(self, source, target, stats=None):
+        '''Расстояния до target и родители к target в радиусе max_stretch * d(source, target)'''
+        indptr, indices, weights = self.csr.indptr_view, self.csr.indices_view, self.csr.weights_view
+        dist = {target: 0.0}
+        parent = {target: (-1, -1)}  # узел -> (следующий узел к цели, дуга)
+        settled = {}
+        heap = [(0.0, target)]
+        limit = math.inf
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            if d > limit:
+                break
+            settled[u] = d
+            if stats is not None:
+                stats.settled += 1
+            if u == source:
+                limit = d * self.max_stretch
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    # граф неориентированный: дуга u -> v того же веса, что v -> u
+                    parent[v] = (u, k)
+                    heapq.heappush(heap, (nd, v))
+        return settled, parent
+
+    def penalized_search(self, source, target, bound, factors, stats=None):
+        '''A* со штрафами factors ({дуга: множитель}) по узлам из bound, оценка — bound[узел]'''
+        indptr, indices, weights = self.csr.indptr_view, self.csr.indices_view, self.csr.weights_view
+        g = {source: 0.0}
+        parent = {source: (-1, -1)}
+        settled = set()
+        heap = [(bound[source], source)]
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if stats is not None:
+                stats.settled += 1
+            if u == target:
+                break
+            d = g[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                h = bound.get(v)
+                if h is None:
+                    continue
+                nd = d + weights[k] * factors.get(k, 1.0)
+                if nd < g.get(v, math.inf):
+                    g[v] = nd
+                    parent[v] = (u, k)
+                    heapq.heappush(heap, (nd + h, v))
+        if target not in settled:
+            return None
+        path, arcs = [target], []
+        while parent[path[-1]][0] != -1:
+            u, k = parent[path[-1]]
+            arcs.append(k)
+            path.append(u)
+        path.reverse()
+        arcs.reverse()
+        return path, arcs
+
+    def get_reverse_arc(self, k, u, v):
+        '''Дуга v -> u для дуги k = u -> v'''
+        for j in range(self.csr.indptr_view[v], self.csr.indptr_view[v + 1]):
+            if self.csr.indices_view[j] == u and self.csr.weights_view[j] == self.csr.weights_view[k]:
+                return j
+        return None
+
+    def find(self, source, target, k=3, stats=None):
+        '''До k маршрутов [(путь по номерам узлов CSR, вес)], первый — кратчайший; [] — пути нет'''
+        if k <= 0 or not self.csr.is_reachable(source, target):
+            return []
+        if source == target:
+            return [([source], 0.0)]
+        bound, parent = self.backward_search(source, target, stats=stats)
+        if source not in bound:
+            return []
+        best = bound[source]
+        path, arcs = [source], []
+        while path[-1] != target:
+            nxt, arc = parent[path[-1]]
+            arcs.append(self.get_reverse_arc(arc, nxt, path[-1]))
+            path.append(nxt)
+        routes = [(path, best)]
+        used = {(min(a, b), max(a, b)) for a, b in zip(path, path[1:])}
+        weights = self.csr.weights_view
+        factors = {}
+        max_attempts = self.max_attempts if self.max_attempts is not None else 2 * k
+        for _ in range(max_attempts):
+            if len(routes) >= k:
+                break
+            # штрафуем рёбра последнего найденного пути в обе стороны
+            for arc, a, b in zip(arcs, path, path[1:]):
+                for j in (arc, self.get_reverse_arc(arc, a, b)):
+                    if j is not None:
+                        factors[j] = factors.get(j, 1.0) * (1.0 + self.penalty)
+            found = self.penalized_search(source, target, bound, factors, stats=stats)
+            if found is None:
+                break
+            path, arcs = found
+            weight = sum(weights[arc] for arc in arcs)
+            if weight > best * self.max_stretch:
+                continue
+            edges = [(min(a, b), max(a, b)) for a, b in zip(path, path[1:])]
+            shared = sum(weights[arc] for arc, edge in zip(arcs, edges) if edge in used)
+            if shared > self.max_share * weight:
+                continue
+            routes.append((path, weight))
+            used.update(edges)
+        return routes
@@ -0,0 +1,239 @@
+import heapq
+import json
+import math
+import os
+
+import networkx as nx
+import numpy as np
+
+from old_code.Graphs.Geodesic import haversine_to_many, path_length
+
+
+class CSRGraph:
+    '''
+    Неизменяемый граф маршрутизации на плоских массивах (CSR):
+      indptr[i]..indptr[i + 1] — рёбра узла i в indices/weights, узлы пронумерованы 0..N-1,
+      edge_ids  — номер ребра исходного Graph для каждой записи indices (-1, если ребро не из EdgeStore),
+                  по нему веса другого профиля переносятся без перестроения (set_weights),
+      lats/lons — координаты узлов, node_ids — id узлов OSM,
+      components — номер компоненты связности узла (0..K-1): пары из разных компонент отсекаются сразу,
+      cell_keys/cell_nodes — сеточный индекс для привязки точек (узлы, отсортированные по ячейке).
+    Массивы можно положить в разделяемую память (SharedGraphStore) или в файлы и открыть через mmap —
+    тогда много процессов-воркеров читают одну копию графа.
+    '''
+    ARRAYS = ('indptr', 'indices', 'weights', 'edge_ids', 'lats', 'lons', 'node_ids', 'components',
+              'cell_keys', 'cell_nodes')
+
+    def __init__(self, arrays, cell_size=0.005):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.cell_size = cell_size
+        self.node_index = None  # ключ узла исходного графа -> номер, есть только у построенного в этом процессе
+        # memoryview по массивам: поэлементный доступ из питона к ним быстрее, чем к numpy
+        self.indptr_view = memoryview(self.indptr)
+        self.indices_view = memoryview(self.indices)
+        self.weights_view = memoryview(self.weights)
+        if len(self.cell_keys):
+            cells_i = (self.cell_keys >> 32)
+            cells_j = (self.cell_keys & 0xFFFFFFFF) - 2 ** 31
+            self.bounds = (int(cells_i.min()), int(cells_i.max()), int(cells_j.min()), int(cells_j.max()))
+        else:
+            self.bounds = None
+
+    @classmethod
+    def from_graph(cls, graph, cell_size=0.005):
+        '''Строит CSR из нашего Graph (nx.Graph внутри); рёбра неориентированные — кладём оба направления'''
+        nx_graph = graph.get_graph()
+        nodes = list(nx_graph.nodes())
+        node_index = {node: i for i, node in enumerate(nodes)}
+        coords = np.array([graph.get_node_coords(node) for node in nodes], dtype=np.float64).reshape(-1, 2)
+
+        sources, targets, weights, edge_ids = [], [], [], []
+        for u, v, data in nx_graph.edges(data=True):
+            iu, iv = node_index[u], node_index[v]
+            weight = data.get('weight', 1)
+            edge_id = data.get('edge_id', -1)
+            sources += (iu, iv)
+            targets += (iv, iu)
+            weights += (weight, weight)
+            edge_ids += (edge_id, edge_id)
+        sources = np.array(sources, dtype=np.int32)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+
+        arrays = {
+            'indptr': indptr,
+            'indices': np.array(targets, dtype=np.int32)[order],
+            'weights': np.array(weights, dtype=np.float64)[order],
+            'edge_ids': np.array(edge_ids, dtype=np.int32)[order],
+            'lats': np.ascontiguousarray(coords[:, 0]),
+            'lons': np.ascontiguousarray(coords[:, 1]),
+            'node_ids': np.array([graph.get_osm_id(node) for node in nodes], dtype=np.int64),
+            # метки Components - корни union-find, сжимаем их в 0..K-1
+            'components': np.unique(np.array([graph.get_component(node) for node in nodes], dtype=np.int32),
+                                    return_inverse=True)[1].astype(np.int32).reshape(-1),
+        }
+        arrays['cell_keys'], arrays['cell_nodes'] = cls.build_cells(arrays['lats'], arrays['lons'], cell_size)
+        csr = cls(arrays, cell_size=cell_size)
+        csr.node_index = node_index
+        return csr
+
+    @staticmethod
+    def get_cell_keys(cells_i, cells_j):
+        return (cells_i.astype(np.int64) << 32) + (cells_j.astype(np.int64) + 2 ** 31)
+
+    @classmethod
+    def build_cells(cls, lats, lons, cell_size):
+        keys = cls.get_cell_keys(np.floor(lats / cell_size), np.floor(lons / cell_size))
+        order = np.argsort(keys, kind='stable').astype(np.int32)
+        return keys[order], order
+
+    def get_num_nodes(self):
+        return len(self.indptr) - 1
+
+    def get_node_coords(self, node):
+        return float(self.lats[node]), float(self.lons[node])
+
+    def set_weights(self, edge_weights):
+        '''Веса нового профиля (массив по edge_id, Graph.weights) без перестроения CSR'''
+        has_edge = self.edge_ids >= 0
+        weights = np.array(self.weights, dtype=np.float64)
+        weights[has_edge] = np.asarray(edge_weights, dtype=np.float64)[self.edge_ids[has_edge]]
+        self.weights = weights
+        self.weights_view = memoryview(weights)
+
+    def update_edge_weights(self, updates):
+        '''Точечно меняет веса рёбер: updates — {edge_id: вес}, inf — ребро закрыто. Возвращает изменённые позиции'''
+        ids = np.fromiter(updates.keys(), dtype=np.int64, count=len(updates))
+        positions = np.nonzero(np.isin(self.edge_ids, ids))[0]
+        if not self.weights.flags.writeable:
+            # веса из mmap или разделяемой памяти — меняем свою копию, чтобы не трогать другие процессы
+            self.weights = np.array(self.weights)
+            self.weights_view = memoryview(self.weights)
+        for k in positions.tolist():
+            self.weights[k] = updates[int(self.edge_ids[k])]
+        return positions
+
+    def get_path_length(self, path):
+        '''Длина пути по узлам в метрах, независимо от профиля весов'''
+        if len(path) < 2:
+            return 0.0
+        path = np.asarray(path)
+        return path_length(self.lats[path], self.lons[path])
+
+    def get_osm_id(self, node):
+        return int(self.node_ids[node])
+
+    def get_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    # -----------------------
+    # привязка точки к узлу
+    # -----------------------
+
+    def get_cell_nodes(self, cell_i, cell_j):
+        key = (cell_i << 32) + (cell_j + 2 ** 31)
+        lo = np.searchsorted(self.cell_keys, key, side='left')
+        hi = np.searchsorted(self.cell_keys, key, side='right')
+        return self.cell_nodes[lo:hi]
+
+    def nearest(self, point, component=None):
+        '''
+        Ближайший узел к точке (lat, lon): (номер, метры) или (None, inf) для пустого графа.
+        component — номер из components: привязывать только к узлам этой компоненты
+        '''
+        if self.bounds is None:
+            return None, float('inf')
+        lat, lon = point
+        ci, cj = int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+        min_i, max_i, min_j, max_j = self.bounds
+        max_radius = max(abs(min_i - ci), abs(max_i - ci), abs(min_j - cj), abs(max_j - cj))
+        ring_meters = self.cell_size * 111320.0 * max(math.cos(math.radians(lat)), 0.01)
+        best_node, best_distance = None, float('inf')
+        for radius in range(max_radius + 1):
+            cells = [(i, j) for i in range(ci - radius, ci + radius + 1) for j in range(cj - radius, cj + radius + 1)
+                     if max(abs(i - ci), abs(j - cj)) == radius]
+            candidates = [self.get_cell_nodes(i, j) for i, j in cells]
+            candidates = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int32)
+            if component is not None and len(candidates):
+                candidates = candidates[self.components[candidates] == component]
+            if len(candidates):
+                distances = haversine_to_many(lat, lon, self.lats[candidates], self.lons[candidates])
+                k = int(np.argmin(distances))
+                if distances[k] < best_distance:
+                    best_node, best_distance = int(candidates[k]), float(distances[k])
+            if best_node is not None and best_distance <= radius * ring_meters:
+                break
+        return best_node, best_distance
+
+    # -----------------------
+    # поиск
+    # -----------------------
+
+    def dijkstra(self, source, target=None, stats=None):
+        '''Дейкстра по CSR; возвращает (dist, parent) — словари по номерам узлов'''
+        indptr, indices, weights = self.indptr_view, self.indices_view, self.weights_view
+        dist = {source: 0.0}
+        parent = {source: -1}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if stats is not None:
+                stats.pops += 1
+            if u in settled:
+                if stats is not None:
+                    stats.stale_pops += 1
+                continue
+            settled.add(u)
+            if stats is not None:
+                stats.settled += 1
+            if u == target:
+                break
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if stats is not None:
+                    stats.relaxed += 1
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd, v))
+                    if stats is not None:
+                        stats.pushes += 1
+        return dist, parent
+
+    def is_reachable(self, source, target):
+        return self.components[source] == self.components[target]
+
+    def shortest_path(self, source, target, stats=None):
+        if not self.is_reachable(source, target):
+            raise nx.NetworkXNoPath(f'Node {target} not reachable from {source}')
+        dist, parent = self.dijkstra(source, target, stats=stats)
+        if target not in dist:
+            raise nx.NetworkXNoPath(f'Node {target} not reachable from {source}')
+        path = [target]
+        while parent[path[-1]] != -1:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return path, dist[target]
+
+    # -----------------------
+    # хранение в файлах (np.load с mmap_mode='r' не читает граф в память процесса)
+    # -----------------------
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'cell_size': self.cell_size, 'nodes': self.get_num_nodes()}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(arrays, cell_size=meta['cell_size'])
+
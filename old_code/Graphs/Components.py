@@ -0,0 +1,51 @@
+from array import array
+from collections import Counter
+
+
+class Components:
+    '''
+    Компоненты связности графа: система непересекающихся множеств (union-find) по номерам узлов Graph.
+    Рёбра только объединяют компоненты, поэтому метки ведутся прямо при построении графа, без обхода.
+    Удаление рёбер (remove_way, закрытия EdgeOverlay) компоненты не делит: у разных меток путь точно
+    не существует, у одинаковых — скорее всего есть; rebuild() пересчитывает метки по текущим рёбрам.
+    '''
+
+    def __init__(self):
+        self.parent = array('i')
+        self.size = array('i')
+
+    def add(self):
+        '''Заводит новый узел отдельной компонентой; номер совпадает с номером узла Graph'''
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]  # сокращение пути через одного
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def is_connected(self, a, b):
+        return self.find(a) == self.find(b)
+
+    def get_sizes(self, nodes):
+        '''Корень компоненты -> сколько в ней узлов из nodes (узлы nx, без удалённых)'''
+        return Counter(self.find(node) for node in nodes)
+
+    def rebuild(self, nx_graph, num_nodes):
+        '''Метки заново по текущим рёбрам nx_graph, например после удаления путей'''
+        self.parent = array('i', range(num_nodes))
+        self.size = array('i', [1]) * num_nodes
+        for u, v in nx_graph.edges():
+            self.union(u, v)
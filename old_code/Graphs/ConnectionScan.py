@@ -0,0 +1,163 @@
+import math
+
+import numpy as np
+
+class ConnectionScan:
+    '''
+    Connection Scan по TransitNetwork: все рейсы всех маршрутов (Route.arrivals) разрезаны на связи
+    «остановка -> следующая остановка того же рейса» и лежат одним массивом по возрастанию отправления:
+      conn_from, conn_to, conn_dep, conn_arr, conn_trip (сквозной номер рейса, trip_offsets[r] + рейс маршрута),
+      conn_pos — позиция остановки отправления в маршруте.
+    Запрос — один проход по массиву с первой связи не раньше выхода (searchsorted) до момента, когда
+    отправление не раньше лучшего прибытия в цель. Пешие пересадки — таблица TransitNetwork (уже кратчайшие,
+    поэтому после поездки хватает одного шага по ней). Массивы для прохода хранятся ещё и списками:
+    поэлементно из питона они быстрее numpy
+    '''
+
+    def __init__(self, network):
+        self.network = network
+        num_trips = np.array([times.shape[1] for times in network.route_times], dtype=np.int64)
+        self.trip_offsets = np.zeros(len(num_trips) + 1, dtype=np.int64)
+        np.cumsum(num_trips, out=self.trip_offsets[1:])
+
+        parts = []
+        for r, (stops, times) in enumerate(zip(network.route_stops, network.route_times)):
+            n, m = times.shape
+            if n < 2 or not m:
+                continue
+            # (остановки - 1) x рейсы, по строкам — позиция, по столбцам — рейс
+            shape = (n - 1, m)
+            parts.append((
+                np.broadcast_to(stops[:-1, None], shape).ravel(),
+                np.broadcast_to(stops[1:, None], shape).ravel(),
+                times[:-1].ravel(),
+                times[1:].ravel(),
+                np.broadcast_to(self.trip_offsets[r] + np.arange(m), shape).ravel(),
+                np.broadcast_to(np.arange(n - 1)[:, None], shape).ravel(),
+            ))
+        columns = [np.concatenate(column) for column in zip(*parts)] or [np.empty(0)] * 6
+        # при равном отправлении раньше идёт связь с более ранним прибытием: связь без стоянки (dep == arr)
+        # должна успеть отметить остановку до следующей связи того же рейса
+        order = np.lexsort((columns[3], columns[2]))
+        self.conn_from = columns[0][order].astype(np.int32)
+        self.conn_to = columns[1][order].astype(np.int32)
+        self.conn_dep = columns[2][order].astype(np.float64)
+        self.conn_arr = columns[3][order].astype(np.float64)
+        self.conn_trip = columns[4][order].astype(np.int32)
+        self.conn_pos = columns[5][order].astype(np.int32)
+        self.lists = (self.conn_from.tolist(), self.conn_to.tolist(), self.conn_dep.tolist(),
+                      self.conn_arr.tolist(), self.conn_trip.tolist())
+        self.transfers = [tuple(zip(*(array.tolist() for array in network.get_transfers(stop))))
+                          for stop in range(network.get_num_stops())]
+
+    def get_num_connections(self):
+        return len(self.conn_dep)
+
+    def get_memory_bytes(self):
+        return sum(array.nbytes for array in (self.conn_from, self.conn_to, self.conn_dep, self.conn_arr,
+                                              self.conn_trip, self.conn_pos, self.trip_offsets))
+
+    def earliest_arrival(self, source, target, departure, stats=None):
+        '''
+        Самое раннее прибытие из узла source в узел target при выходе в departure: (время, поездок, маршрут),
+        маршрут — участки в формате Raptor.get_journey. Пути нет — (inf, None, None)
+        '''
+        network = self.network
+        conn_from, conn_to, conn_dep, conn_arr, conn_trip = self.lists
+        transfers = self.transfers
+        access_stops, access_times, reached = network.get_access(source)
+        egress_stops, egress_times, _ = network.get_access(target)
+        egress = dict(zip(egress_stops.tolist(), egress_times.tolist()))
+
+        num_stops = network.get_num_stops()
+        # прибытие поездкой, пешей пересадкой после неё и пешком от старта — порознь: пересадка начинается
+        # только с поездки (иначе прогулки склеились бы в одну длиннее max_walk), к цели идут с поездки или
+        # пересадки, а с подхода только садятся. Более раннее прибытие другого вида не отсекает поездку
+        arrival = [math.inf] * num_stops
+        footpath = [math.inf] * num_stops
+        access = [math.inf] * num_stops
+        # указатели пути на остановку: связи посадки и высадки поездки, которой приехали сюда (enter, exit_)
+        # или на остановку, откуда пришли пешком (foot_enter, foot_exit)
+        enter = [-1] * num_stops
+        exit_ = [-1] * num_stops
+        foot_enter = [-1] * num_stops
+        foot_exit = [-1] * num_stops
+        boarded = {}  # сквозной номер рейса -> связь, на которой сели
+        bound = departure + reached.get(target, math.inf)
+        target_stop, target_walked = -1, False
+        # пешком без транспорта — только напрямую (reached): подход и отход через одну остановку
+        # дали бы пешую прогулку длиннее max_walk
+        for stop, walk_time in zip(access_stops.tolist(), access_times.tolist()):
+            access[stop] = departure + walk_time
+
+        first = int(self.conn_dep.searchsorted(departure))
+        scanned = improved = 0
+        for i in range(first, len(conn_dep)):
+            dep = conn_dep[i]
+            if dep >= bound:
+                break
+            scanned += 1
+            trip = conn_trip[i]
+            if trip not in boarded:
+                stop = conn_from[i]
+                if arrival[stop] > dep and footpath[stop] > dep and access[stop] > dep:
+                    continue
+                boarded[trip] = i
+            arr = conn_arr[i]
+            to = conn_to[i]
+            if arr >= arrival[to] or arr >= bound:
+                continue
+            improved += 1
+            arrival[to] = arr
+            enter[to], exit_[to] = boarded[trip], i
+            if to in egress and arr + egress[to] < bound:
+                bound = arr + egress[to]
+                target_stop, target_walked = to, False
+            for other, walk_time in transfers[to]:
+                walk_arrival = arr + walk_time
+                if walk_arrival < footpath[other] and walk_arrival < arrival[other]:
+                    footpath[other] = walk_arrival
+                    foot_enter[other], foot_exit[other] = boarded[trip], i
+                    if other in egress and walk_arrival + egress[other] < bound:
+                        bound = walk_arrival + egress[other]
+                        target_stop, target_walked = other, True
+
+        if stats is not None:
+            stats.relaxed += scanned
+            stats.settled += improved
+        if bound == math.inf:
+            return math.inf, None, None
+        legs = self.get_journey((arrival, footpath, access), (enter, exit_, foot_enter, foot_exit), target_stop,
+                                target_walked, source, target, departure, bound)
+        return bound, sum(1 for leg in legs if leg[0] == 'ride'), legs
+
+    def get_journey(self, arrivals, pointers, stop, walked, source, target, departure, target_arrival):
+        '''
+        Участки пути по указателям: от остановки у цели назад — пешая пересадка (walked — пришли на остановку
+        пешком), поездка от связи посадки до связи высадки, остановка посадки и т.д. до остановки, куда
+        успели пешком от старта к посадке. На остановке посадки берётся метка, с которой успевали сесть
+        '''
+        network = self.network
+        nodes = network.stop_nodes
+        arrival, footpath, access = arrivals
+        enter, exit_, foot_enter, foot_exit = pointers
+        if stop < 0:
+            return [('walk', source, target, departure, target_arrival)]
+        legs = [('walk', nodes[stop], target, footpath[stop] if walked else arrival[stop], target_arrival)]
+        while True:
+            first, last = (foot_enter[stop], foot_exit[stop]) if walked else (enter[stop], exit_[stop])
+            landed = int(self.conn_to[last])
+            if walked:
+                legs.append(('walk', nodes[landed], nodes[stop], float(self.conn_arr[last]), footpath[stop]))
+            trip = int(self.conn_trip[first])
+            r = int(self.trip_offsets.searchsorted(trip, side='right')) - 1
+            stop = int(self.conn_from[first])
+            dep = float(self.conn_dep[first])
+            legs.append(('ride', network.route_ids[r], trip - int(self.trip_offsets[r]), nodes[stop], nodes[landed],
+                         dep, float(self.conn_arr[last])))
+            if access[stop] <= dep:
+                break
+            walked = arrival[stop] > dep
+        legs.append(('walk', source, nodes[stop], departure, access[stop]))
+        legs.reverse()
+        return legs
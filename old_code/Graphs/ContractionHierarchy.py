@@ -0,0 +1,110 @@
+import heapq
+import math
+
+import numpy as np
+
+
+class ContractionHierarchy:
+    '''
+    Порядок сжатия узлов (contraction hierarchies) для неориентированного CSRGraph.
+    Узлы сжимаются по одному, от «неважных» к «важным»: при сжатии узла v между его соседями добавляется
+    ребро-сокращение, если без v кратчайший путь между ними длиннее пути через v (это проверяет
+    ограниченный поиск свидетеля). Важность — разница между числом сокращений и числом рёбер узла плюс
+    число уже сжатых соседей, чтобы сжатие шло равномерно по карте.
+    Результат:
+      rank[node]          — номер узла в порядке сжатия,
+      up_indptr/up_indices/up_weights — рёбра из каждого узла к соседям с большим rank (с сокращениями).
+    Кратчайший путь всегда есть «вверх, потом вниз»: расстояние s-t — минимум по общим вершинам
+    поисков вверх из s и из t. На этом строятся HubLabels
+    '''
+
+    def __init__(self, rank, up_indptr, up_indices, up_weights, shortcuts=0):
+        self.rank = rank
+        self.up_indptr = up_indptr
+        self.up_indices = up_indices
+        self.up_weights = up_weights
+        self.shortcuts = shortcuts
+
+    @classmethod
+    def build(cls, csr, witness_settled=64):
+        '''witness_settled — предел узлов в поиске свидетеля: меньше — быстрее, но больше лишних сокращений'''
+        n = csr.get_num_nodes()
+        indptr, indices, weights = csr.indptr.tolist(), csr.indices.tolist(), csr.weights.tolist()
+        adj = [{} for _ in range(n)]
+        for u in range(n):
+            for k in range(indptr[u], indptr[u + 1]):
+                v, w = indices[k], weights[k]
+                if v != u and w < adj[u].get(v, math.inf):
+                    adj[u][v] = w
+        deleted_neighbors = [0] * n
+        up = [None] * n
+        rank = np.zeros(n, dtype=np.int32)
+
+        def witness(source, skip, limit, targets):
+            '''Дейкстра из source без узла skip до расстояния limit; возвращает найденные расстояния'''
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            left = len(targets)
+            while heap and left and settled < witness_settled:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                if d > limit:
+                    break
+                settled += 1
+                if u in targets:
+                    left -= 1
+                for v, w in adj[u].items():
+                    nd = d + w
+                    if v != skip and nd < dist.get(v, math.inf):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            return dist
+
+        def get_shortcuts(v):
+            neighbors = list(adj[v].items())
+            shortcuts = []
+            for i in range(len(neighbors) - 1):
+                u, wu = neighbors[i]
+                targets = {w: wu + ww for w, ww in neighbors[i + 1:]}
+                dist = witness(u, v, max(targets.values()), targets)
+                shortcuts += [(u, w, d) for w, d in targets.items() if dist.get(w, math.inf) > d]
+            return shortcuts
+
+        def get_priority(v):
+            return len(get_shortcuts(v)) - len(adj[v]) + deleted_neighbors[v]
+
+        heap = [(get_priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        total_shortcuts = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            # ленивое обновление: важность могла вырасти после сжатия соседей
+            shortcuts = get_shortcuts(v)
+            priority = len(shortcuts) - len(adj[v]) + deleted_neighbors[v]
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+            up[v] = list(adj[v].items())
+            rank[v] = order
+            order += 1
+            for u in adj[v]:
+                del adj[u][v]
+                deleted_neighbors[u] += 1
+            adj[v] = {}
+            for u, w, d in shortcuts:
+                if d < adj[u].get(w, math.inf):
+                    adj[u][w] = adj[w][u] = d
+                    total_shortcuts += 1
+
+        counts = np.array([len(arcs) for arcs in up], dtype=np.int64)
+        up_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=up_indptr[1:])
+        up_indices = np.array([u for arcs in up for u, _ in arcs], dtype=np.int32)
+        up_weights = np.array([w for arcs in up for _, w in arcs], dtype=np.float64)
+        return cls(rank, up_indptr, up_indices, up_weights, shortcuts=total_shortcuts)
+
+    def get_num_nodes(self):
+        return len(self.rank)
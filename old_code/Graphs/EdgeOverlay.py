@@ -0,0 +1,122 @@
+import math
+
+
+class EdgeOverlay:
+    '''
+    Перекрытия поверх загруженного Graph: закрытые рёбра и переопределённые веса по edge_id (EdgeStore).
+    Граф не перестраивается: закрытое ребро убирается из nx (его словарь запоминается), переопределённый
+    вес пишется в словарь ребра, revert() возвращает исходное. Всё, что построено по графу, обновляется
+    точечно, а не заново:
+      index        — SpatialIndex: узлы, у которых закрыты все рёбра, убираются из привязки и возвращаются;
+      cache        — RouteCache: при росте весов (закрытие) сбрасываются только маршруты через эти рёбра,
+                     при уменьшении (открытие, ускорение) короче может стать любой маршрут — сбрасывается
+                     весь город/режим;
+      preprocessed — предобработки с методом update_edge_weights({edge_id: вес}): CSRGraph, PartitionRouter.
+    Версия графа не меняется, иначе кэш потерял бы и маршруты, которых перекрытие не касается.
+    '''
+
+    def __init__(self, graph, index=None, cache=None, city=None, mode=None, preprocessed=()):
+        self.graph = graph
+        self.index = index
+        self.cache = cache
+        self.city = city
+        self.mode = mode
+        self.preprocessed = list(preprocessed)
+        self.original = {}  # edge_id -> (u, v, исходный словарь ребра nx)
+        self.weights = {}  # edge_id -> действующий вес перекрытия, inf — ребро закрыто
+        self.hidden_nodes = set()  # узлы, убранные из привязки
+
+    def block(self, edge_ids):
+        return self.apply({edge_id: math.inf for edge_id in edge_ids})
+
+    def block_street(self, name):
+        return self.block(self.graph.edges.find_edges(name))
+
+    def override(self, weights):
+        '''weights — {edge_id: новый вес} в единицах текущего профиля'''
+        return self.apply(weights)
+
+    def revert(self, edge_ids=None):
+        '''Снимает перекрытия с данных рёбер (None — со всех)'''
+        edge_ids = list(self.weights) if edge_ids is None else edge_ids
+        return self.apply({edge_id: None for edge_id in edge_ids})
+
+    def get_graph_edge(self, edge_id):
+        '''
+        (u, v, edge_id ребра nx): если один отрезок есть в нескольких путях OSM, в nx одно ребро,
+        и перекрытие относится к нему
+        '''
+        u, v = self.graph.edges.u[edge_id], self.graph.edges.v[edge_id]
+        nx_graph = self.graph.get_graph()
+        if nx_graph.has_edge(u, v):
+            return u, v, nx_graph[u][v].get('edge_id', edge_id)
+        for graph_edge_id, (a, b, _) in self.original.items():
+            if {a, b} == {u, v}:
+                return u, v, graph_edge_id
+        return u, v, None
+
+    def apply(self, updates):
+        '''updates — {edge_id: вес}, inf — закрыть, None — вернуть исходный. Возвращает отчёт об изменениях'''
+        nx_graph = self.graph.get_graph()
+        changed = {}
+        increased, decreased = [], False
+        touched_nodes = set()
+        for edge_id, weight in updates.items():
+            u, v, graph_edge_id = self.get_graph_edge(edge_id)
+            if graph_edge_id is None or (weight is None and graph_edge_id not in self.original):
+                continue
+            if graph_edge_id not in self.original:
+                self.original[graph_edge_id] = (u, v, dict(nx_graph[u][v]))
+            u, v, data = self.original[graph_edge_id]
+            old = self.weights.get(graph_edge_id, data['weight'])
+            if weight is None or weight == data['weight']:
+                weight = data['weight']
+                del self.original[graph_edge_id]
+                self.weights.pop(graph_edge_id, None)
+                nx_graph.add_edge(u, v, **data)
+            elif weight == math.inf:
+                self.weights[graph_edge_id] = weight
+                if nx_graph.has_edge(u, v):
+                    nx_graph.remove_edge(u, v)
+            else:
+                self.weights[graph_edge_id] = weight
+                nx_graph.add_edge(u, v, **dict(data, weight=weight))
+            if weight == old:
+                continue
+            changed[graph_edge_id] = weight
+            touched_nodes.update((u, v))
+            if weight > old:
+                increased.append(graph_edge_id)
+            else:
+                decreased = True
+
+        report = {'edges': len(changed), 'cache_invalidated': 0, 'cells_recustomized': 0,
+                  'hidden_nodes': 0, 'restored_nodes': 0}
+        if not changed:
+            return report
+        for preprocessed in self.preprocessed:
+            result = preprocessed.update_edge_weights(changed)
+            if isinstance(result, int):
+                report['cells_recustomized'] += result
+        if self.cache is not None:
+            if decreased:
+                report['cache_invalidated'] = self.cache.invalidate(self.city, self.mode)
+            else:
+                report['cache_invalidated'] = self.cache.invalidate_edges(self.city, self.mode, increased)
+        if self.index is not None:
+            for node in touched_nodes:
+                if nx_graph.degree(node) == 0 and node not in self.hidden_nodes:
+                    self.index.remove_node(node)
+                    self.hidden_nodes.add(node)
+                    report['hidden_nodes'] += 1
+                elif nx_graph.degree(node) > 0 and node in self.hidden_nodes:
+                    self.index.add_node(node)
+                    self.hidden_nodes.discard(node)
+                    report['restored_nodes'] += 1
+        return report
+
+    def get_state(self):
+        return {
+            'blocked': [edge_id for edge_id, weight in self.weights.items() if weight == math.inf],
+            'overridden': {edge_id: weight for edge_id, weight in self.weights.items() if weight != math.inf},
+        }
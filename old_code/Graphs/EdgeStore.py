@@ -0,0 +1,119 @@
+import re
+from array import array
+
+import numpy as np
+
+# класс дороги хранится номером (uint8); 0 — неизвестно
+HIGHWAY_CLASSES = ['', 'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential',
+                   'living_street', 'service', 'pedestrian', 'footway', 'path', 'steps', 'corridor', 'cycleway',
+                   'track', 'motorway_link', 'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link']
+HIGHWAY_CODES = {name: code for code, name in enumerate(HIGHWAY_CLASSES)}
+
+# покрытие (тег surface) тоже номером (uint8); 0 — не указано
+SURFACE_CLASSES = ['', 'asphalt', 'paved', 'concrete', 'paving_stones', 'sett', 'cobblestone', 'unhewn_cobblestone',
+                   'compacted', 'fine_gravel', 'gravel', 'pebblestone', 'unpaved', 'ground', 'dirt', 'grass', 'sand',
+                   'mud', 'wood', 'metal', 'rubber']
+SURFACE_CODES = {name: code for code, name in enumerate(SURFACE_CLASSES)}
+
+# неявные ограничения скорости (км/ч) из maxspeed=RU:...
+IMPLICIT_MAXSPEED = {'ru:urban': 60, 'ru:rural': 90, 'ru:living_street': 20, 'ru:motorway': 110, 'walk': 5}
+
+
+def parse_maxspeed(value):
+    '''Тег maxspeed -> км/ч в пределах uint8; 0 — неизвестно или без ограничения'''
+    if not value:
+        return 0
+    value = value.split(';')[0].strip().lower()
+    if value in IMPLICIT_MAXSPEED:
+        return IMPLICIT_MAXSPEED[value]
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*(mph|km/h|kmh)?$', value)
+    if not match:
+        return 0
+    speed = float(match.group(1))
+    if match.group(2) == 'mph':
+        speed *= 1.609
+    return min(int(round(speed)), 255)
+
+
+class EdgeStore:
+    '''
+    Атрибуты рёбер по столбцам, номер ребра — индекс строки:
+      u, v        — номера узлов графа (int32)
+      length      — длина в метрах (float32)
+      highway     — класс дороги, номер в HIGHWAY_CLASSES (uint8)
+      max_speed   — ограничение скорости, км/ч, 0 — неизвестно (uint8)
+      name        — номер названия в self.names (uint32); одинаковые названия хранятся один раз
+      surface     — покрытие, номер в SURFACE_CLASSES (uint8)
+    Профили весов (WeightProfiles) считают по этим столбцам массив весов целиком через numpy.
+    '''
+
+    def __init__(self):
+        self.u = array('i')
+        self.v = array('i')
+        self.length = array('f')
+        self.highway = array('B')
+        self.max_speed = array('B')
+        self.name = array('I')
+        self.surface = array('B')
+        self.names = ['']
+        self.name_index = {'': 0}
+
+    def intern_name(self, name):
+        index = self.name_index.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names.append(name)
+            self.name_index[name] = index
+        return index
+
+    def get_way_columns(self, tags):
+        '''Общие для всех рёбер пути значения столбцов: (класс дороги, скорость, номер названия, покрытие)'''
+        if tags is None:
+            return 0, 0, 0, 0
+        return (HIGHWAY_CODES.get(tags.get('highway'), 0),
+                parse_maxspeed(tags.get('maxspeed')),
+                self.intern_name(tags.get('name') or ''),
+                SURFACE_CODES.get(tags.get('surface'), 0))
+
+    def add_edge(self, u, v, length, highway=0, max_speed=0, name=0, surface=0):
+        edge_id = len(self.u)
+        self.u.append(u)
+        self.v.append(v)
+        self.length.append(length)
+        self.highway.append(highway)
+        self.max_speed.append(max_speed)
+        self.name.append(name)
+        self.surface.append(surface)
+        return edge_id
+
+    def get_columns(self):
+        '''Столбцы как numpy-массивы без копирования'''
+        return {
+            'u': np.frombuffer(self.u, dtype=np.int32),
+            'v': np.frombuffer(self.v, dtype=np.int32),
+            'length': np.frombuffer(self.length, dtype=np.float32),
+            'highway': np.frombuffer(self.highway, dtype=np.uint8),
+            'max_speed': np.frombuffer(self.max_speed, dtype=np.uint8),
+            'name': np.frombuffer(self.name, dtype=np.uint32),
+            'surface': np.frombuffer(self.surface, dtype=np.uint8),
+        }
+
+    def get_attributes(self, edge_id):
+        '''Атрибуты одного ребра словарём, в именах, которые ждёт my_code/code/compressor.py'''
+        return {
+            'length': float(self.length[edge_id]),
+            'highway': HIGHWAY_CLASSES[self.highway[edge_id]] or None,
+            'max_speed': self.max_speed[edge_id] or None,
+            'name': self.names[self.name[edge_id]] or None,
+            'surface': SURFACE_CLASSES[self.surface[edge_id]] or None,
+        }
+
+    def find_edges(self, name):
+        '''Номера рёбер улицы с данным названием'''
+        name_id = self.name_index.get(name)
+        if name_id is None or not name:
+            return []
+        return np.nonzero(np.frombuffer(self.name, dtype=np.uint32) == name_id)[0].tolist()
+
+    def __len__(self):
+        return len(self.u)
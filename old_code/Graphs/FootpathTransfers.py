@@ -0,0 +1,207 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# пешеходный граф в CSR и номер остановки по номеру узла в процессе-воркере, см. init_worker
+WORKER_WALK = None
+
+
+def init_worker(indptr, indices, weights, stop_of, max_walk):
+    global WORKER_WALK
+    WORKER_WALK = (indptr.tolist(), indices.tolist(), weights.tolist(), stop_of.tolist(), max_walk)
+
+
+def build_chunk(sources):
+    '''Пересадки от остановок sources (номера узлов CSR): (число пересадок у каждой, остановки, время)'''
+    indptr, indices, weights, stop_of, max_walk = WORKER_WALK
+    counts, stops, times = [], [], []
+    for source in sources:
+        reached = walk_csr(source, indptr, indices, weights, max_walk)
+        row = sorted((stop_of[node], time) for node, time in reached.items() if stop_of[node] >= 0 and node != source)
+        counts.append(len(row))
+        for stop, time in row:
+            stops.append(stop)
+            times.append(time)
+    return counts, stops, times
+
+
+def walk_csr(source, indptr, indices, weights, max_walk):
+    '''Ограниченная Дейкстра по CSR (списки): {узел: время} не дальше max_walk'''
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = {}
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = d
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd <= max_walk and nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return settled
+
+
+def get_walk_arrays(graph):
+    '''Пешеходные рёбра графа кластеризатора (graph.nodes[u].edges) в CSR: (node_ids, indptr, indices, weights)'''
+    node_ids = np.array(sorted(graph.nodes), dtype=np.int64)
+    index = {node: i for i, node in enumerate(node_ids.tolist())}
+    counts = np.array([len(graph.nodes[node].edges) for node in node_ids.tolist()], dtype=np.int64)
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.array([index[edge.to] for node in node_ids.tolist() for edge in graph.nodes[node].edges],
+                       dtype=np.int32)
+    weights = np.array([edge.weight for node in node_ids.tolist() for edge in graph.nodes[node].edges],
+                       dtype=np.float64)
+    return node_ids, indptr, indices, weights
+
+
+def get_fingerprint(walk_arrays, stop_nodes, max_walk):
+    '''Отпечаток пешеходного графа, набора остановок и max_walk: по нему видно, что таблицу пора пересчитать'''
+    digest = hashlib.sha1()
+    for array in walk_arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(np.asarray(stop_nodes, dtype=np.int64).tobytes())
+    digest.update(repr(float(max_walk)).encode())
+    return digest.hexdigest()
+
+
+class FootpathTransfers:
+    '''
+    Пешие пересадки между остановками — разреженная таблица остановки x остановки в CSR:
+    indptr[i]..indptr[i + 1] — пересадки от остановки i в indices/times, остановки строки по возрастанию.
+    Номера остановок — позиции в stop_nodes (node_id графа кластеризатора). Считается ограниченными
+    Дейкстрами от всех остановок по пешеходному графу кусками в процессах-воркерах, хранится на диске
+    вместе с отпечатком графа (meta['fingerprint']) — load_or_build пересчитывает её, только если граф,
+    остановки или max_walk поменялись. Транспортный поиск берёт её через get_arrays (TransitNetwork(transfers=...))
+    '''
+    ARRAYS = ('indptr', 'indices', 'times', 'stop_nodes')
+
+    def __init__(self, indptr, indices, times, stop_nodes, meta=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.times = times
+        self.stop_nodes = stop_nodes
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, graph, stop_nodes, max_walk=600.0, workers=None, chunk_size=256, walk_arrays=None, meta=None):
+        '''
+        graph — граф кластеризатора с пешеходными рёбрами, stop_nodes — node_id остановок; пересадки дальше
+        max_walk (в единицах весов рёбер, обычно секундах) не попадают в таблицу. workers=1 — без процессов
+        '''
+        walk_arrays = walk_arrays if walk_arrays is not None else get_walk_arrays(graph)
+        node_ids, indptr, indices, weights = walk_arrays
+        stop_nodes = np.asarray(stop_nodes, dtype=np.int64)
+        sources = node_ids.searchsorted(stop_nodes)
+        if len(stop_nodes) and (sources.max() >= len(node_ids) or np.any(node_ids[sources] != stop_nodes)):
+            raise ValueError('не все остановки есть в пешеходном графе')
+        stop_of = np.full(len(node_ids), -1, dtype=np.int32)
+        stop_of[sources] = np.arange(len(stop_nodes), dtype=np.int32)
+        chunks = [sources[start:start + chunk_size].tolist() for start in range(0, len(sources), chunk_size)]
+        initargs = (indptr, indices, weights, stop_of, max_walk)
+        if workers == 1:
+            init_worker(*initargs)
+            results = [build_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+                results = list(pool.map(build_chunk, chunks))
+        counts = np.concatenate([np.array(r[0], dtype=np.int64) for r in results]) if results else np.empty(0)
+        table_indptr = np.zeros(len(stop_nodes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=table_indptr[1:])
+        table_indices = np.concatenate([np.array(r[1], dtype=np.int32) for r in results]) if results else np.empty(0)
+        times = np.concatenate([np.array(r[2], dtype=np.float64) for r in results]) if results else np.empty(0)
+        meta = dict(meta or {}, max_walk=float(max_walk),
+                    fingerprint=get_fingerprint(walk_arrays, stop_nodes, max_walk))
+        return cls(table_indptr, table_indices.astype(np.int32), times.astype(np.float64), stop_nodes, meta=meta)
+
+    @classmethod
+    def load_or_build(cls, directory, graph, stop_nodes, max_walk=600.0, workers=None, meta=None):
+        '''
+        Таблица из directory, если она посчитана для того же графа, остановок и max_walk; иначе считает
+        заново и сохраняет. Второе значение — True, если таблица взята с диска
+        '''
+        walk_arrays = get_walk_arrays(graph)
+        fingerprint = get_fingerprint(walk_arrays, stop_nodes, max_walk)
+        if os.path.exists(os.path.join(directory, 'transfers.json')):
+            table = cls.load(directory)
+            if table.meta.get('fingerprint') == fingerprint:
+                return table, True
+        table = cls.build(graph, stop_nodes, max_walk, workers=workers, walk_arrays=walk_arrays, meta=meta)
+        table.save(directory)
+        return table, False
+
+    def get_num_stops(self):
+        return len(self.stop_nodes)
+
+    def get_transfers(self, stop):
+        '''(остановки, время пешком) от остановки stop'''
+        lo, hi = self.indptr[stop], self.indptr[stop + 1]
+        return self.indices[lo:hi], self.times[lo:hi]
+
+    def get_arrays(self, stop_nodes=None):
+        '''
+        (indptr, indices, times) в нумерации stop_nodes — для TransitNetwork(transfers=...). Таблица,
+        посчитанная для большего набора остановок (например, всех остановок фида), годится и для части:
+        лишние строки и пересадки выбрасываются
+        '''
+        if stop_nodes is None or np.array_equal(np.asarray(stop_nodes), self.stop_nodes):
+            return np.asarray(self.indptr), np.asarray(self.indices), np.asarray(self.times)
+        stop_nodes = np.asarray(stop_nodes, dtype=np.int64)
+        order = np.argsort(self.stop_nodes, kind='stable')
+        found = np.searchsorted(self.stop_nodes, stop_nodes, sorter=order)
+        found = np.minimum(found, len(order) - 1) if len(order) else found
+        if not len(order) or np.any(self.stop_nodes[order[found]] != stop_nodes):
+            raise ValueError('в таблице пересадок нет части остановок')
+        rows = order[found]
+        # старый номер остановки -> новый, -1 — остановки в новом наборе нет
+        renumber = np.full(len(self.stop_nodes), -1, dtype=np.int32)
+        renumber[rows] = np.arange(len(stop_nodes), dtype=np.int32)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        counts = ends - starts
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+        indices = renumber[self.indices[positions]]
+        keep = indices >= 0
+        row_of = np.repeat(np.arange(len(stop_nodes)), counts)[keep]
+        indptr = np.zeros(len(stop_nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_of, minlength=len(stop_nodes)), out=indptr[1:])
+        return indptr, indices[keep], np.asarray(self.times)[positions][keep]
+
+    def get_memory_report(self):
+        sizes = np.diff(self.indptr)
+        return {
+            'stops': self.get_num_stops(),
+            'transfers': int(sizes.sum()),
+            'avg_transfers': float(sizes.mean()) if len(sizes) else 0.0,
+            'max_transfers': int(sizes.max()) if len(sizes) else 0,
+            'memory_mb': sum(getattr(self, name).nbytes for name in self.ARRAYS) / 2 ** 20,
+        }
+
+    # -----------------------
+    # хранение: каталог на город, как у HubLabels
+    # -----------------------
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'transfers.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        # json пишется последним: пока его нет, недописанная таблица не считается готовой
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.meta, **self.get_memory_report()), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'transfers.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(**arrays, meta=meta)
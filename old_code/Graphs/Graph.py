@@ -1,65 +1,243 @@
-import math
+from array import array
+from contextlib import nullcontext
+
 import networkx as nx
+import numpy as np
 from old_code.Graphs.aStarPath import aStarPath
+from old_code.Graphs.Components import Components
+from old_code.Graphs.EdgeStore import EdgeStore
+from old_code.Graphs.Geodesic import haversine, segment_lengths
+from old_code.Graphs.NodeOrder import get_order
+from old_code.Graphs.WeightProfiles import DistanceProfile
 
 
 class Graph:
     def __init__(self):
         self.graph = nx.Graph()
         self.a = []
+        self.version = 0  # растёт при каждом изменении графа, по нему кэши понимают, что устарели
+        # узлы графа — плотные номера 0..N-1; id узла OSM и координаты лежат в массивах по номеру
+        self.node_index = {}  # id узла OSM -> номер
+        self.node_ids = array('q')
+        self.lats = array('d')
+        self.lons = array('d')
+        # атрибуты рёбер по столбцам; в nx у ребра лежат только edge_id и вес текущего профиля
+        self.edges = EdgeStore()
+        self.weight_profile = DistanceProfile()
+        self.weights = None  # массив весов по edge_id, считается в set_weight_profile
+        # пути, добавленные с way_id: id пути OSM -> (номера узлов, edge_id его рёбер); нужно для remove_way
+        self.ways = {}
+        # как считать длины рёбер: 'haversine' или 'local' - локальная проекция, см. Geodesic
+        self.length_method = 'haversine'
+        # компоненты связности по номерам узлов, ведутся при добавлении рёбер; см. Components
+        self.components = Components()
+
+    # возвращает номер узла по id OSM, при первой встрече заводит узел
+    def add_node(self, osm_id, lat, lon):
+        index = self.node_index.get(osm_id)
+        if index is None:
+            index = len(self.node_ids)
+            self.node_index[osm_id] = index
+            self.node_ids.append(osm_id)
+            self.lats.append(lat)
+            self.lons.append(lon)
+            self.components.add()
+            self.graph.add_node(index)
+        return index
 
-    def haversine(self, point_a, point_b):
-        # Радиус Земли в километрах
-        R = 6371.0
+    # добавляет какой-то один путь - и узлы, и ребра между ними для этого пути
+    # tags - теги пути (highway, maxspeed, name), идут в столбцы EdgeStore
+    # вес новых рёбер - длина; другой профиль применяется к уже добавленным рёбрам через set_weight_profile
+    # way_id - id пути OSM, если путь потом может понадобиться убрать (обновления из .osc)
+    def add_way(self, nodes, tags=None, way_id=None):
+        self.add_ways([self.read_way(nodes, tags, way_id)])
 
-        # Преобразуем широту и долготу из градусов в радианы
-        lat_a, lon_a = math.radians(point_a[0]), math.radians(point_a[1])
-        lat_b, lon_b = math.radians(point_b[0]), math.radians(point_b[1])
+    # копирует путь в простые списки: объекты osmium живут только до следующего шага итерации,
+    # а длины удобнее считать сразу для пачки путей
+    def read_way(self, nodes, tags=None, way_id=None):
+        return ([node.ref for node in nodes], [node.lat for node in nodes], [node.lon for node in nodes],
+                self.edges.get_way_columns(tags), way_id)
 
-        # Разница координат
-        dlat = lat_b - lat_a
-        dlon = lon_b - lon_a
+    # добавляет пачку путей из read_way; длины всех отрезков пачки - один векторный вызов segment_lengths
+    # у ребра nx ways - сколько путей через него проходит: общий отрезок двух путей - одно ребро
+    def add_ways(self, ways):
+        self.version += 1
+        lats = [lat for way in ways for lat in way[1]]
+        lons = [lon for way in ways for lon in way[2]]
+        # отрезки через границу соседних путей тоже посчитаются, их просто пропускаем
+        lengths = segment_lengths(lats, lons, self.length_method).tolist() if len(lats) > 1 else []
+        offset = 0
+        for refs, way_lats, way_lons, columns, way_id in ways:
+            prev_index = self.add_node(refs[0], way_lats[0], way_lons[0])
+            indices, edge_ids = array('i', [prev_index]), array('i')
+            for i in range(1, len(refs)):
+                curr_index = self.add_node(refs[i], way_lats[i], way_lons[i])
+                dist = lengths[offset + i - 1]
+                #self.a.append(dist)
+                edge_id = self.edges.add_edge(prev_index, curr_index, dist, *columns)
+                data = self.graph.get_edge_data(prev_index, curr_index)
+                ways_count = data['ways'] + 1 if data is not None else 1
+                self.graph.add_edge(prev_index, curr_index, weight=dist, edge_id=edge_id, ways=ways_count)
+                self.components.union(prev_index, curr_index)
+                indices.append(curr_index)
+                edge_ids.append(edge_id)
+                prev_index = curr_index
+            if way_id is not None:
+                self.ways[way_id] = (indices, edge_ids)
+            offset += len(refs)
 
-        # Формула haversine
-        a = (math.sin(dlat / 2) ** 2 +
-             math.cos(lat_a) * math.cos(lat_b) * math.sin(dlon / 2) ** 2)
-        c = 2 * math.asin(math.sqrt(a))
+    # убирает путь, добавленный с way_id: его рёбра, если их не держит другой путь, и узлы, оставшиеся без рёбер.
+    # строки EdgeStore остаются, чтобы номера рёбер не сдвигались. Возвращает убранные из nx узлы
+    def remove_way(self, way_id):
+        self.version += 1
+        indices, edge_ids = self.ways.pop(way_id)
+        for i in range(len(edge_ids)):
+            u, v = indices[i], indices[i + 1]
+            data = self.graph.get_edge_data(u, v)
+            if data is None:
+                continue
+            data['ways'] -= 1
+            if data['ways'] <= 0:
+                self.graph.remove_edge(u, v)
+        removed = [node for node in set(indices) if node in self.graph and self.graph.degree(node) == 0]
+        self.graph.remove_nodes_from(removed)
+        return removed
 
-        # Расстояние в метрах
-        distance = R * c
-        return distance * 1000
+    # пересчитывает компоненты по текущим рёбрам: после remove_way метки остаются прежними (шире настоящих)
+    def relabel_components(self):
+        self.components.rebuild(self.graph, len(self.node_ids))
 
-    # добавляет какой-то один путь - и узлы, и ребра между ними для этого пути
-    def add_way(self, nodes):
-        prev_node = nodes[0]
-        self.graph.add_node((prev_node.lat, prev_node.lon))
-        for i in range(1, len(nodes)):
-            curr_node = nodes[i]
-            self.graph.add_node((curr_node.lat, curr_node.lon))
-            dist = self.haversine((prev_node.lat, prev_node.lon), (curr_node.lat, curr_node.lon))
-            #self.a.append(dist)
-            self.graph.add_edge((prev_node.lat, prev_node.lon), (curr_node.lat, curr_node.lon), weight=dist)
-            prev_node = curr_node
+    # оставляет только крупные компоненты: keep='largest' - одну самую большую, число - все не меньше
+    # стольких узлов. Остальные узлы убираются из nx (строки EdgeStore и номера узлов остаются, как
+    # в remove_way), их пути - из self.ways. Возвращает число убранных узлов
+    def prune_components(self, keep='largest'):
+        sizes = self.components.get_sizes(self.graph.nodes())
+        if not sizes:
+            return 0
+        if keep == 'largest':
+            kept = {max(sizes, key=sizes.get)}
+        else:
+            kept = {root for root, size in sizes.items() if size >= keep}
+        removed = [node for node in self.graph.nodes() if self.components.find(node) not in kept]
+        if not removed:
+            return 0
+        self.version += 1
+        self.graph.remove_nodes_from(removed)
+        for way_id in [way_id for way_id, (indices, _) in self.ways.items()
+                       if self.components.find(indices[0]) not in kept]:
+            del self.ways[way_id]
+        return len(removed)
+
+    # шаг завершения построения: перенумеровывает узлы вдоль кривой curve ('hilbert' или 'morton', см. NodeOrder),
+    # чтобы соседние по карте узлы были соседними и в массивах. Меняются номера в node_index, массивах узлов,
+    # столбцах u/v EdgeStore, self.ways и в nx; id OSM и edge_id остаются прежними. Узлы, убранные из nx,
+    # уходят в конец. Всё, что хранит номера узлов (CSRGraph, SpatialIndex, кэши), строится уже после.
+    # Возвращает массив: старый номер -> новый
+    def reorder_nodes(self, curve='hilbert'):
+        lats = np.frombuffer(self.lats, dtype=np.float64)
+        lons = np.frombuffer(self.lons, dtype=np.float64)
+        curve_order = get_order(lats, lons, curve)
+        present = np.zeros(len(self.node_ids), dtype=bool)
+        present[list(self.graph.nodes())] = True
+        order = curve_order[np.argsort(~present[curve_order], kind='stable')]
+        new_index = np.empty(len(order), dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+
+        node_ids = np.frombuffer(self.node_ids, dtype=np.int64)[order]
+        self.node_ids = array('q', node_ids.tobytes())
+        self.lats = array('d', lats[order].tobytes())
+        self.lons = array('d', lons[order].tobytes())
+        del lats, lons
+        self.node_index = dict(zip(node_ids.tolist(), range(len(order))))
+        for column in ('u', 'v'):
+            values = np.frombuffer(getattr(self.edges, column), dtype=np.int32)
+            setattr(self.edges, column, array('i', new_index[values].astype(np.int32).tobytes()))
+        for way_id, (indices, edge_ids) in self.ways.items():
+            indices = new_index[np.frombuffer(indices, dtype=np.int32)].astype(np.int32)
+            self.ways[way_id] = (array('i', indices.tobytes()), edge_ids)
+
+        # nx.Graph обходит узлы в порядке вставки - вставляем заново уже по новым номерам
+        edges = [(int(new_index[u]), int(new_index[v]), data) for u, v, data in self.graph.edges(data=True)]
+        nodes = sorted(int(new_index[node]) for node in self.graph.nodes())
+        self.graph.clear()
+        self.graph.add_nodes_from(nodes)
+        self.graph.add_edges_from(sorted(edges, key=lambda edge: (min(edge[0], edge[1]), max(edge[0], edge[1]))))
+        self.relabel_components()
+        self.version += 1
+        return new_index
+
+    # O(1) проверка перед поиском: узлы разных компонент не связаны никаким путём
+    def is_reachable(self, start, end):
+        return self.components.is_connected(start, end)
+
+    def get_component(self, node):
+        return self.components.find(node)
+
+    # сдвигает узлы (moves - {номер: (lat, lon)}) и пересчитывает длины их рёбер
+    def move_nodes(self, moves):
+        if not moves:
+            return
+        self.version += 1
+        for node, (lat, lon) in moves.items():
+            self.lats[node], self.lons[node] = lat, lon
+        for node in moves:
+            for neighbour, data in self.graph[node].items():
+                dist = haversine(self.get_node_coords(node), self.get_node_coords(neighbour))
+                data['weight'] = dist
+                if data.get('edge_id') is not None:
+                    self.edges.length[data['edge_id']] = dist
+        if self.weights is not None:
+            # профиль считался по старым длинам - пересчитываем целиком, это один векторный проход
+            self.set_weight_profile(self.weight_profile)
+
+    # переключает профиль весов: один векторный пересчёт массива весов и запись его в рёбра, граф не перестраивается
+    def set_weight_profile(self, profile):
+        self.weight_profile = profile
+        self.weights = profile.compute(self.edges)
+        weights = self.weights.tolist()
+        for _, _, data in self.graph.edges(data=True):
+            edge_id = data.get('edge_id')
+            if edge_id is not None:
+                data['weight'] = weights[edge_id]
+        self.version += 1
+
+    # раскладывает столбцы в словари рёбер nx - для кода, который читает атрибуты оттуда (compressor)
+    def fill_edge_attributes(self):
+        for _, _, data in self.graph.edges(data=True):
+            edge_id = data.get('edge_id')
+            if edge_id is not None:
+                data.update(self.edges.get_attributes(edge_id))
 
     def get_graph(self):
         #print(self.get_detailed_statistics())
         return self.graph
 
     def get_list_of_nodes_coords(self, list_of_nodes):
-        nodes_coords = [self.graph.nodes[node] for node in list_of_nodes]
+        nodes_coords = [self.get_node_coords(node) for node in list_of_nodes]
         return nodes_coords
 
     def get_node_coords(self, node):
-        return node
+        return self.lats[node], self.lons[node]
+
+    def get_osm_id(self, node):
+        return self.node_ids[node]
+
+    def get_node_by_osm_id(self, osm_id):
+        return self.node_index.get(osm_id)
 
     def get_sorted_nodes(self):
-        sorted_nodes = sorted(self.graph.nodes(), key=lambda node: (node[0], node[1]))
+        sorted_nodes = sorted(self.graph.nodes(), key=self.get_node_coords)
         return sorted_nodes
 
-    def get_shortest_route(self, start, end):
-        shortest_route = nx.shortest_path(self.graph, start, end, weight='weight', method='dijkstra')
-        a_star = aStarPath(self)
-        shortest_route = a_star.a_star_path(start, end)
+    def get_shortest_route(self, start, end, stats=None):
+        # счётчики в stats пишет только A*, его маршрут и возвращается; время — за весь вызов
+        if not self.is_reachable(start, end):
+            # без этого поиск обошёл бы весь обрывок графа, прежде чем сдаться
+            raise nx.NetworkXNoPath(f'Node {end} not reachable from {start}')
+        with nullcontext() if stats is None else stats.timer('search_time'):
+            shortest_route = nx.shortest_path(self.graph, start, end, weight='weight', method='dijkstra')
+            a_star = aStarPath(self)
+            shortest_route = a_star.a_star_path(start, end, stats=stats)
         return shortest_route
 
     def get_detailed_statistics(self):
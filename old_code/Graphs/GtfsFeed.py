@@ -0,0 +1,269 @@
+import csv
+import datetime
+import io
+import os
+import zipfile
+from array import array
+
+import numpy as np
+
+from old_code.Graphs.SpatialIndex import SpatialIndex
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def parse_time(value):
+    '''Время GTFS "H:MM:SS" -> секунды от полуночи дня поездки (бывает больше 24 ч); -1 — время не указано'''
+    value = value.strip()
+    if not value:
+        return -1
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value.strip(), '%Y%m%d').date()
+
+
+def read_table(archive, name, columns, required=True):
+    '''
+    Строки таблицы name из архива: только нужные столбцы, по порядку columns (нет столбца — '').
+    Генератор, чтобы stop_times в миллионы строк не держать в памяти целиком
+    '''
+    if name not in archive.namelist():
+        if required:
+            raise ValueError(f'GTFS: в архиве нет {name}')
+        return
+    with archive.open(name) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        header = [column.strip() for column in next(reader, [])]
+        positions = [header.index(column) if column in header else None for column in columns]
+        for row in reader:
+            if row:
+                yield [row[k] if k is not None and k < len(row) else '' for k in positions]
+
+
+class TripPattern:
+    '''
+    Рейсы одного маршрута с одинаковой последовательностью остановок.
+      stops                 — номера остановок GtfsFeed по порядку (int32),
+      arrivals/departures   — матрицы остановки x рейсы (int32, секунды от полуночи),
+                              рейсы по возрастанию отправления с первой остановки,
+      trip_ids              — id рейсов GTFS по столбцам.
+    Рейсы в шаблоне не обгоняют друг друга: время каждой строки не убывает по рейсам (обгоняющие рейсы
+    при загрузке уходят в отдельный шаблон того же маршрута), поэтому ближайший рейс ищется бинарным поиском
+    '''
+
+    def __init__(self, route, stops, arrivals, departures, trip_ids):
+        self.route = route
+        self.stops = stops
+        self.arrivals = arrivals
+        self.departures = departures
+        self.trip_ids = trip_ids
+
+    def get_num_trips(self):
+        return self.arrivals.shape[1]
+
+    def get_travel_times(self):
+        '''Медианное время между соседними остановками, секунды (len(stops) - 1)'''
+        if not self.get_num_trips():
+            return np.zeros(max(len(self.stops) - 1, 0), dtype=np.float64)
+        return np.median(self.arrivals[1:] - self.departures[:-1], axis=1).astype(np.float64)
+
+
+class GtfsFeed:
+    '''
+    Расписание из GTFS (локальный .zip): остановки, маршруты и шаблоны рейсов (TripPattern) на плоских
+    массивах numpy. stop_times читается потоком в array('i') по столбцам, без объекта на строку, поэтому
+    фид большого города грузится за секунды, а в памяти остаются только матрицы времён по шаблонам.
+    Остановки к пешеходному графу привязываются одной пачкой (snap_stops); дальше фид можно отдать в
+    PublicTransportGraph.add_gtfs или в Graph.add_route кластеризатора (experements/my_clastarizator.py)
+    '''
+
+    def __init__(self, stop_ids, stop_names, stop_lats, stop_lons, route_ids, route_names, route_types,
+                 patterns, meta=None):
+        self.stop_ids = stop_ids
+        self.stop_names = stop_names
+        self.stop_lats = stop_lats
+        self.stop_lons = stop_lons
+        self.route_ids = route_ids
+        self.route_names = route_names
+        self.route_types = route_types
+        self.patterns = patterns
+        self.meta = meta or {}
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    @classmethod
+    def load(cls, path, date=None):
+        '''
+        path — .zip с GTFS; date (datetime.date) — брать только рейсы, которые ходят в этот день
+        по calendar.txt/calendar_dates.txt, None — все рейсы фида
+        '''
+        with zipfile.ZipFile(path) as archive:
+            stop_ids, stop_names, stop_lats, stop_lons = [], [], array('d'), array('d')
+            for stop_id, name, lat, lon, location_type in read_table(
+                    archive, 'stops.txt', ('stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location_type')):
+                # станции и входы (location_type 1..4) — не места посадки
+                if location_type.strip() not in ('', '0') or not lat.strip():
+                    continue
+                stop_ids.append(stop_id)
+                stop_names.append(name)
+                stop_lats.append(float(lat))
+                stop_lons.append(float(lon))
+            stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+            route_ids, route_names, route_types = [], [], array('i')
+            for route_id, short_name, long_name, route_type in read_table(
+                    archive, 'routes.txt', ('route_id', 'route_short_name', 'route_long_name', 'route_type')):
+                route_ids.append(route_id)
+                route_names.append(short_name or long_name)
+                route_types.append(int(route_type or 3))
+            route_index = {route_id: i for i, route_id in enumerate(route_ids)}
+
+            services = cls.get_active_services(archive, date) if date is not None else None
+            trip_ids, trip_routes = [], array('i')
+            for trip_id, route_id, service_id in read_table(archive, 'trips.txt',
+                                                            ('trip_id', 'route_id', 'service_id')):
+                if route_id not in route_index or (services is not None and service_id not in services):
+                    continue
+                trip_ids.append(trip_id)
+                trip_routes.append(route_index[route_id])
+            trip_index = {trip_id: i for i, trip_id in enumerate(trip_ids)}
+
+            # stop_times: по столбцам; одинаковые строки времени встречаются тысячи раз — разбираем один раз
+            trips, sequences, stops, arrivals, departures = (array('i') for _ in range(5))
+            times = {}
+            for trip_id, stop_id, sequence, arrival, departure in read_table(
+                    archive, 'stop_times.txt',
+                    ('trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time')):
+                trip = trip_index.get(trip_id)
+                stop = stop_index.get(stop_id)
+                if trip is None or stop is None:
+                    continue
+                trips.append(trip)
+                stops.append(stop)
+                sequences.append(int(sequence))
+                for value, column in ((arrival, arrivals), (departure, departures)):
+                    seconds = times.get(value)
+                    if seconds is None:
+                        seconds = times[value] = parse_time(value)
+                    column.append(seconds)
+
+        patterns = cls.build_patterns(np.frombuffer(trips, dtype=np.int32), np.frombuffer(sequences, dtype=np.int32),
+                                      np.frombuffer(stops, dtype=np.int32), np.frombuffer(arrivals, dtype=np.int32),
+                                      np.frombuffer(departures, dtype=np.int32), trip_ids,
+                                      np.frombuffer(trip_routes, dtype=np.int32))
+        meta = {'file': os.path.basename(path), 'date': date.isoformat() if date is not None else None,
+                'trips': len(trip_ids), 'stop_times': len(trips)}
+        return cls(stop_ids, stop_names, np.array(stop_lats, dtype=np.float64), np.array(stop_lons, dtype=np.float64),
+                   route_ids, route_names, np.array(route_types, dtype=np.int32), patterns, meta=meta)
+
+    @staticmethod
+    def get_active_services(archive, date):
+        '''service_id, которые ходят в день date: calendar.txt плюс исключения calendar_dates.txt'''
+        services = set()
+        weekday = WEEKDAYS[date.weekday()]
+        for row in read_table(archive, 'calendar.txt', ('service_id', weekday, 'start_date', 'end_date'),
+                              required=False):
+            service_id, runs, start, end = row
+            if runs.strip() == '1' and parse_date(start) <= date <= parse_date(end):
+                services.add(service_id)
+        for service_id, day, exception_type in read_table(archive, 'calendar_dates.txt',
+                                                          ('service_id', 'date', 'exception_type'), required=False):
+            if parse_date(day) != date:
+                continue
+            if exception_type.strip() == '1':
+                services.add(service_id)
+            elif exception_type.strip() == '2':
+                services.discard(service_id)
+        return services
+
+    @staticmethod
+    def build_patterns(trips, sequences, stops, arrivals, departures, trip_ids, trip_routes):
+        '''Строки stop_times (по столбцам) -> список TripPattern'''
+        if not len(trips):
+            return []
+        order = np.lexsort((sequences, trips))
+        trips, stops = trips[order], stops[order]
+        arrivals, departures = arrivals[order].copy(), departures[order].copy()
+        # нет времени — берём второе из пары, нет обоих (не опорная остановка) — интерполируем по порядку:
+        # у первой и последней остановки рейса время обязано быть, так что соседние рейсы не смешиваются
+        arrivals = np.where(arrivals < 0, departures, arrivals)
+        departures = np.where(departures < 0, arrivals, departures)
+        missing = arrivals < 0
+        if missing.any():
+            rows = np.arange(len(arrivals))
+            known = ~missing
+            filled = np.round(np.interp(rows[missing], rows[known], arrivals[known])).astype(np.int32)
+            arrivals[missing] = departures[missing] = filled
+
+        starts = np.flatnonzero(np.r_[True, trips[1:] != trips[:-1]])
+        ends = np.r_[starts[1:], len(trips)]
+        groups = {}  # (маршрут, последовательность остановок) -> номера рейсов (позиции в starts)
+        for k in range(len(starts)):
+            key = (int(trip_routes[trips[starts[k]]]), stops[starts[k]:ends[k]].tobytes())
+            groups.setdefault(key, []).append(k)
+
+        patterns = []
+        for (route, _), members in groups.items():
+            members = np.array(members, dtype=np.int64)
+            members = members[np.argsort(departures[starts[members]], kind='stable')]
+            length = int(ends[members[0]] - starts[members[0]])
+            # строки — остановки, столбцы — рейсы: positions[p, t] — строка stop_times рейса t на остановке p
+            positions = starts[members][None, :] + np.arange(length)[:, None]
+            pattern_arrivals = arrivals[positions]
+            pattern_departures = departures[positions]
+            for columns in GtfsFeed.split_overtaking(pattern_arrivals, pattern_departures):
+                patterns.append(TripPattern(
+                    route, stops[starts[members[0]]:ends[members[0]]].copy(),
+                    np.ascontiguousarray(pattern_arrivals[:, columns]),
+                    np.ascontiguousarray(pattern_departures[:, columns]),
+                    [trip_ids[trips[starts[members[k]]]] for k in columns]))
+        return patterns
+
+    @staticmethod
+    def split_overtaking(arrivals, departures):
+        '''Раскладывает рейсы (столбцы, по отправлению) на группы, где ни один рейс не обгоняет предыдущий'''
+        groups = []
+        for trip in range(arrivals.shape[1]):
+            for columns in groups:
+                last = columns[-1]
+                if (np.all(arrivals[:, trip] >= arrivals[:, last]) and
+                        np.all(departures[:, trip] >= departures[:, last])):
+                    columns.append(trip)
+                    break
+            else:
+                groups.append([trip])
+        return groups
+
+    def get_stop(self, stop_id):
+        return self.stop_index.get(stop_id)
+
+    def get_route_patterns(self):
+        '''Номер маршрута -> номера его шаблонов'''
+        result = {}
+        for k, pattern in enumerate(self.patterns):
+            result.setdefault(pattern.route, []).append(k)
+        return result
+
+    def snap_stops(self, graph, index=None, max_distance=300.0, component=None):
+        '''
+        Привязка всех остановок к узлам графа одной пачкой (SpatialIndex.nearest_many).
+        Возвращает (узлы графа int64, расстояния в метрах); дальше max_distance — узел -1
+        '''
+        index = index if index is not None else SpatialIndex(graph)
+        snapped = index.nearest_many(list(zip(self.stop_lats.tolist(), self.stop_lons.tolist())), component)
+        nodes = np.array([-1 if node is None else node for node, _ in snapped], dtype=np.int64)
+        distances = np.array([distance for _, distance in snapped], dtype=np.float64)
+        nodes[distances > max_distance] = -1
+        return nodes, distances
+
+    def get_memory_report(self):
+        matrices = sum(p.arrivals.nbytes + p.departures.nbytes + p.stops.nbytes for p in self.patterns)
+        return {
+            'stops': len(self.stop_ids),
+            'routes': len(self.route_ids),
+            'patterns': len(self.patterns),
+            'trips': sum(p.get_num_trips() for p in self.patterns),
+            'matrices_mb': matrices / 2 ** 20,
+        }
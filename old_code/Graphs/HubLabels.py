@@ -0,0 +1,185 @@
+import heapq
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from old_code.Graphs.ContractionHierarchy import ContractionHierarchy
+
+# рёбра вверх ContractionHierarchy в процессе-воркере сборки меток, см. init_worker
+WORKER_UP = None
+
+
+def init_worker(up_indptr, up_indices, up_weights):
+    global WORKER_UP
+    WORKER_UP = (up_indptr.tolist(), up_indices.tolist(), up_weights.tolist())
+
+
+def build_chunk(start, end):
+    '''Метки узлов start..end-1: (длины меток, хабы, расстояния) — хабы каждой метки по возрастанию'''
+    up_indptr, up_indices, up_weights = WORKER_UP
+    counts, hubs, dists = [], [], []
+    for node in range(start, end):
+        label = get_upward_label(node, up_indptr, up_indices, up_weights)
+        counts.append(len(label))
+        for hub in sorted(label):
+            hubs.append(hub)
+            dists.append(label[hub])
+    return counts, hubs, dists
+
+
+def get_upward_label(source, up_indptr, up_indices, up_weights):
+    '''
+    Дейкстра из source только по рёбрам вверх. Узел, до которого через уже найденного соседа выше по
+    рангу ближе, чем его расстояние, «заглушается» (stall-on-demand): расстояние до него не кратчайшее,
+    в метку он не идёт и дальше поиск через него не продолжается
+    '''
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    label = {}
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u] or u in label:
+            continue
+        # у неориентированного графа рёбра вниз в u — те же, что рёбра вверх из u
+        stalled = False
+        for k in range(up_indptr[u], up_indptr[u + 1]):
+            if dist.get(up_indices[k], math.inf) + up_weights[k] < d:
+                stalled = True
+                break
+        if stalled:
+            continue
+        label[u] = d
+        for k in range(up_indptr[u], up_indptr[u + 1]):
+            v = up_indices[k]
+            nd = d + up_weights[k]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return label
+
+
+class HubLabels:
+    '''
+    Метки хабов для запросов «только расстояние» между узлами CSRGraph:
+    метка узла — список (хаб, расстояние до хаба), расстояние s-t = min по общим хабам d(s, h) + d(h, t).
+    Метки берутся из поиска вверх по ContractionHierarchy, поэтому короткие (сотни хабов на город).
+    Хранятся плоско: offsets[node]..offsets[node + 1] — метка узла в hubs/dists, хабы в метке по возрастанию,
+    так что запрос — слияние двух отсортированных коротких массивов.
+    node_ids — id узлов OSM по номерам, чтобы метки, загруженные с диска, можно было сопоставить с графом.
+    Расстояния во float32: на городских расстояниях ошибка — доли миллиметра, а память вдвое меньше
+    '''
+    ARRAYS = ('offsets', 'hubs', 'dists', 'node_ids')
+
+    def __init__(self, offsets, hubs, dists, node_ids, meta=None):
+        self.offsets = offsets
+        self.hubs = hubs
+        self.dists = dists
+        self.node_ids = node_ids
+        self.meta = meta or {}
+        self.node_index = None  # id OSM -> номер, заводится при первом get_node
+        self.scratch = None  # расстояния от текущего источника по номеру хаба, для distance_matrix
+
+    @classmethod
+    def build(cls, csr, ch=None, workers=None, chunk_size=2048, meta=None):
+        '''
+        Считает метки по ContractionHierarchy (если не передана — строит её) в процессах-воркерах:
+        узлы делятся на куски по chunk_size, каждый кусок — независимые поиски вверх
+        '''
+        ch = ch if ch is not None else ContractionHierarchy.build(csr)
+        n = csr.get_num_nodes()
+        chunks = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+        initargs = (ch.up_indptr, ch.up_indices, ch.up_weights)
+        if workers == 1:
+            init_worker(*initargs)
+            results = [build_chunk(start, end) for start, end in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+                results = list(pool.map(build_chunk, *zip(*chunks))) if chunks else []
+        counts = np.concatenate([np.array(r[0], dtype=np.int64) for r in results]) if results else np.empty(0)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        hubs = np.concatenate([np.array(r[1], dtype=np.int32) for r in results]) if results else np.empty(0)
+        dists = np.concatenate([np.array(r[2], dtype=np.float32) for r in results]) if results else np.empty(0)
+        meta = dict(meta or {}, shortcuts=ch.shortcuts)
+        return cls(offsets, hubs.astype(np.int32), dists.astype(np.float32), np.array(csr.node_ids, dtype=np.int64),
+                   meta=meta)
+
+    def get_num_nodes(self):
+        return len(self.offsets) - 1
+
+    def get_label(self, node):
+        lo, hi = self.offsets[node], self.offsets[node + 1]
+        return self.hubs[lo:hi], self.dists[lo:hi]
+
+    def get_node(self, osm_id):
+        if self.node_index is None:
+            self.node_index = dict(zip(self.node_ids.tolist(), range(len(self.node_ids))))
+        return self.node_index.get(osm_id)
+
+    def distance(self, source, target):
+        '''Расстояние между узлами (номера CSR), inf — если пути нет'''
+        source_hubs, source_dists = self.get_label(source)
+        target_hubs, target_dists = self.get_label(target)
+        _, i, j = np.intersect1d(source_hubs, target_hubs, assume_unique=True, return_indices=True)
+        if not len(i):
+            return math.inf
+        return float(np.min(source_dists[i].astype(np.float64) + target_dists[j]))
+
+    def distance_matrix(self, sources, targets):
+        '''
+        Матрица расстояний sources x targets. Метки всех целей склеиваются один раз, а для каждого
+        источника его метка раскладывается в массив по номеру хаба — строка считается одним проходом numpy
+        '''
+        if self.scratch is None:
+            self.scratch = np.full(self.get_num_nodes(), np.inf, dtype=np.float64)
+        scratch = self.scratch
+        targets = np.asarray(targets, dtype=np.int64)
+        result = np.full((len(sources), len(targets)), np.inf, dtype=np.float64)
+        if not len(targets):
+            return result
+        starts, ends = self.offsets[targets], self.offsets[targets + 1]
+        counts = ends - starts
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+        target_hubs = self.hubs[positions]
+        target_dists = self.dists[positions].astype(np.float64)
+        # у каждой метки есть хотя бы сам узел, поэтому отрезки reduceat не пустые
+        bounds = np.cumsum(counts) - counts
+        for row, source in enumerate(sources):
+            source_hubs, source_dists = self.get_label(source)
+            scratch[source_hubs] = source_dists
+            result[row] = np.minimum.reduceat(scratch[target_hubs] + target_dists, bounds)
+            scratch[source_hubs] = np.inf
+        return result
+
+    def get_memory_report(self):
+        sizes = np.diff(self.offsets)
+        total_bytes = sum(getattr(self, name).nbytes for name in self.ARRAYS)
+        return {
+            'nodes': self.get_num_nodes(),
+            'entries': int(sizes.sum()),
+            'avg_label': float(sizes.mean()) if len(sizes) else 0.0,
+            'p95_label': float(np.percentile(sizes, 95)) if len(sizes) else 0.0,
+            'max_label': int(sizes.max()) if len(sizes) else 0,
+            'memory_mb': total_bytes / 2 ** 20,
+        }
+
+    # -----------------------
+    # хранение: по каталогу на город/режим, массивы можно открыть через mmap
+    # -----------------------
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'labels.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(self.meta, **self.get_memory_report()), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'labels.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(**arrays, meta=meta)
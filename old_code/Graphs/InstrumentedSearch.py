@@ -0,0 +1,56 @@
+import heapq
+from itertools import count
+
+import networkx as nx
+
+'''
+Поиски по nx-графу с подсчётом работы в SearchStats. Используются роутерами только когда
+передан stats: networkx не даёт заглянуть в свою кучу, поэтому повторяем его алгоритмы здесь.
+Веса берутся как в networkx: data.get(weight, 1).
+'''
+
+
+def dijkstra_path(graph, source, target, weight, stats):
+    return astar_path(graph, source, target, None, weight, stats)
+
+
+def astar_path(graph, source, target, heuristic, weight, stats):
+    if source not in graph or target not in graph:
+        raise nx.NodeNotFound(f'Either source {source} or target {target} is not in G')
+    tie = count()  # чтобы куча не сравнивала сами узлы
+    h = heuristic(source, target) if heuristic else 0
+    queue = [(h, next(tie), source, 0, None)]
+    stats.pushes += 1
+    enqueued = {}  # узел -> (дистанция, эвристика)
+    explored = {}  # узел -> родитель
+    while queue:
+        _, _, node, dist, parent = heapq.heappop(queue)
+        stats.pops += 1
+        if node in explored:
+            stats.stale_pops += 1  # узел уже осел с меньшей дистанцией
+            continue
+        explored[node] = parent
+        stats.settled += 1
+        if node == target:
+            with stats.timer('unpack_time'):
+                path = [node]
+                while parent is not None:
+                    path.append(parent)
+                    parent = explored[parent]
+                path.reverse()
+            return path
+        for neighbor, data in graph[node].items():
+            if neighbor in explored:
+                continue
+            stats.relaxed += 1
+            new_dist = dist + data.get(weight, 1)
+            if neighbor in enqueued:
+                old_dist, h = enqueued[neighbor]
+                if old_dist <= new_dist:
+                    continue
+            else:
+                h = heuristic(neighbor, target) if heuristic else 0
+            enqueued[neighbor] = new_dist, h
+            heapq.heappush(queue, (new_dist + h, next(tie), neighbor, new_dist, node))
+            stats.pushes += 1
+    raise nx.NetworkXNoPath(f'Node {target} not reachable from {source}')
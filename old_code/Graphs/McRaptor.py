@@ -0,0 +1,224 @@
+import bisect
+import math
+from array import array
+
+from old_code.Graphs.Raptor import ACCESS, FOOT
+
+
+class LabelStore:
+    '''
+    Метки McRAPTOR одним набором плоских массивов, метка — номер строки: в мешках и в метках-родителях
+    лежат только номера, а не объекты, поэтому даже сотни тысяч меток на запрос занимают мегабайты.
+      arrival, walking — критерии (прибытие на остановку и время пешком с начала пути),
+      stop, route (номер маршрута, FOOT или ACCESS), trip, parent (номер метки, откуда пришли, -1 — старт),
+      board — остановка посадки для поездки
+    '''
+
+    def __init__(self):
+        self.arrival = array('d')
+        self.walking = array('d')
+        self.stop = array('i')
+        self.route = array('i')
+        self.trip = array('i')
+        self.parent = array('i')
+        self.board = array('i')
+
+    def add(self, arrival, walking, stop, route, trip=-1, parent=-1, board=-1):
+        self.arrival.append(arrival)
+        self.walking.append(walking)
+        self.stop.append(stop)
+        self.route.append(route)
+        self.trip.append(trip)
+        self.parent.append(parent)
+        self.board.append(board)
+        return len(self.arrival) - 1
+
+    def __len__(self):
+        return len(self.arrival)
+
+    def get_memory_bytes(self):
+        return sum(column.itemsize * len(column) for column in
+                   (self.arrival, self.walking, self.stop, self.route, self.trip, self.parent, self.board))
+
+
+def is_dominated(bag, arrival, walking):
+    '''bag — список пар (прибытие, пешком); метка хуже или равна какой-то из них по обоим критериям'''
+    for other_arrival, other_walking in bag:
+        if other_arrival <= arrival and other_walking <= walking:
+            return True
+    return False
+
+
+def merge(bag, arrival, walking):
+    '''Добавляет пару в Парето-мешок, выкидывая то, что она доминирует'''
+    bag[:] = [(a, w) for a, w in bag if not (arrival <= a and walking <= w)]
+    bag.append((arrival, walking))
+
+
+class McRaptor:
+    '''
+    Многокритериальный RAPTOR по TransitNetwork: Парето-множество путей по (прибытие, пересадки, время пешком).
+    Пересадки — номер раунда, поэтому мешок остановки в раунде k хранит Парето по (прибытие, пешком),
+    а метка раунда k отбрасывается, если её доминирует метка этой остановки из любого раунда не позже
+    (best — Парето по раундам с поездками) или уже найденный путь до цели (дальше критерии только растут).
+    Маршрут в раунде просматривается с мешком маршрута: (рейс, пешком, метка посадки) — рейсы не обгоняют
+    друг друга, так что номер рейса упорядочен так же, как прибытие
+    '''
+
+    def __init__(self, network, max_rounds=5):
+        self.network = network
+        self.max_rounds = max_rounds
+        self.rows = {}  # номер маршрута -> расписание списками, поэлементно из питона они быстрее numpy
+
+    def get_rows(self, r):
+        rows = self.rows.get(r)
+        if rows is None:
+            rows = self.rows[r] = self.network.route_times[r].tolist()
+        return rows
+
+    def search(self, source, target, departure, stats=None):
+        '''
+        Парето-множество путей из узла source в узел target при выходе в departure:
+        [(прибытие, поездок, пешком, участки)] по возрастанию прибытия; участки — как у Raptor.get_journey.
+        stats — необязательный dict, в него пишутся счётчики меток по раундам (см. benchmark_transit)
+        '''
+        network = self.network
+        access_stops, access_times, reached = network.get_access(source)
+        egress_stops, egress_times, _ = network.get_access(target)
+        egress = dict(zip(egress_stops.tolist(), egress_times.tolist()))
+        labels = LabelStore()
+        # остановка -> Парето (прибытие, пешком) по раундам с поездками: подход пешком ничего не отсекает,
+        # после него нельзя ни пересесть пешком, ни дойти до цели
+        best = {}
+        target_bag = []  # (прибытие, поездок, пешком, номер метки или -1 — пешком без транспорта)
+        created = [0] * (self.max_rounds + 1)
+        kept = [0] * (self.max_rounds + 1)
+
+        def reaches_target(arrival, walking):
+            for other_arrival, _, other_walking, _ in target_bag:
+                if other_arrival <= arrival and other_walking <= walking:
+                    return True
+            return False
+
+        def add_target(arrival, trips, walking, label):
+            for other_arrival, other_trips, other_walking, _ in target_bag:
+                if other_arrival <= arrival and other_trips <= trips and other_walking <= walking:
+                    return
+            target_bag[:] = [item for item in target_bag
+                             if not (arrival <= item[0] and trips <= item[1] and walking <= item[2])]
+            target_bag.append((arrival, trips, walking, label))
+
+        if target in reached:
+            add_target(departure + reached[target], 0, reached[target], -1)
+
+        bag = {}  # мешок раунда: остановка -> номера меток
+        for stop, walk_time in zip(access_stops.tolist(), access_times.tolist()):
+            label = labels.add(departure + walk_time, walk_time, stop, ACCESS)
+            bag[stop] = [label]
+            created[0] += 1
+            kept[0] += 1
+
+        def try_add(stop, arrival, walking, k):
+            '''Проверка на доминирование перед заведением метки'''
+            created[k] += 1
+            if reaches_target(arrival, walking):
+                return False
+            stop_best = best.setdefault(stop, [])
+            if is_dominated(stop_best, arrival, walking):
+                return False
+            merge(stop_best, arrival, walking)
+            return True
+
+        for k in range(1, self.max_rounds + 1):
+            if not bag:
+                break
+            routes = {}  # маршрут -> первая позиция, с которой его стоит смотреть
+            for stop in bag:
+                route_ids, positions = network.get_stop_routes(stop)
+                for r, pos in zip(route_ids.tolist(), positions.tolist()):
+                    if pos < routes.get(r, math.inf):
+                        routes[r] = pos
+            new_bag = {}
+            for r, first in routes.items():
+                stops = network.route_stops[r].tolist()
+                rows = self.get_rows(r)
+                route_bag = []  # (рейс, пешком, метка посадки, остановка посадки)
+                for p in range(first, len(stops)):
+                    stop = stops[p]
+                    row = rows[p]
+                    for trip, walking, parent, board in route_bag:
+                        arrival = row[trip]
+                        if try_add(stop, arrival, walking, k):
+                            label = labels.add(arrival, walking, stop, r, trip, parent, board)
+                            self.put(labels, new_bag, stop, label)
+                    for parent in bag.get(stop, ()):
+                        trip = bisect.bisect_left(row, labels.arrival[parent])
+                        if trip == len(row):
+                            continue
+                        walking = labels.walking[parent]
+                        if any(t <= trip and w <= walking for t, w, _, _ in route_bag):
+                            continue
+                        route_bag = [item for item in route_bag if not (trip <= item[0] and walking <= item[1])]
+                        route_bag.append((trip, walking, parent, stop))
+            # пешие пересадки от меток, заведённых поездкой в этом раунде
+            for stop, stop_labels in list(new_bag.items()):
+                others, walk_times = network.get_transfers(stop)
+                for parent in list(stop_labels):
+                    arrival, walking = labels.arrival[parent], labels.walking[parent]
+                    for other, walk_time in zip(others.tolist(), walk_times.tolist()):
+                        if try_add(other, arrival + walk_time, walking + walk_time, k):
+                            label = labels.add(arrival + walk_time, walking + walk_time, other, FOOT, parent=parent)
+                            self.put(labels, new_bag, other, label)
+            for stop, stop_labels in new_bag.items():
+                kept[k] += len(stop_labels)
+                walk_time = egress.get(stop)
+                if walk_time is not None:
+                    for label in stop_labels:
+                        add_target(labels.arrival[label] + walk_time, k, labels.walking[label] + walk_time, label)
+            bag = new_bag
+
+        if stats is not None:
+            stats['created'] = created
+            stats['kept'] = kept
+            stats['labels'] = len(labels)
+            stats['label_bytes'] = labels.get_memory_bytes()
+            stats['front'] = len(target_bag)
+        journeys = []
+        for arrival, trips, walking, label in sorted(target_bag):
+            journeys.append((arrival, trips, walking, self.get_journey(labels, label, source, target, departure,
+                                                                       arrival)))
+        return journeys
+
+    @staticmethod
+    def put(labels, new_bag, stop, label):
+        '''Кладёт метку в мешок остановки, убирая доминируемые ею метки этого же раунда'''
+        arrival, walking = labels.arrival[label], labels.walking[label]
+        stop_labels = [other for other in new_bag.get(stop, ())
+                       if not (arrival <= labels.arrival[other] and walking <= labels.walking[other])]
+        stop_labels.append(label)
+        new_bag[stop] = stop_labels
+
+    def get_journey(self, labels, label, source, target, departure, arrival):
+        network = self.network
+        if label < 0:
+            return [('walk', source, target, departure, arrival)]
+        legs = [('walk', network.stop_nodes[labels.stop[label]], target, labels.arrival[label], arrival)]
+        while True:
+            route, stop = labels.route[label], labels.stop[label]
+            parent = labels.parent[label]
+            if route == ACCESS:
+                legs.append(('walk', source, network.stop_nodes[stop], departure, labels.arrival[label]))
+                break
+            if route == FOOT:
+                legs.append(('walk', network.stop_nodes[labels.stop[parent]], network.stop_nodes[stop],
+                             labels.arrival[parent], labels.arrival[label]))
+            else:
+                board = labels.board[label]
+                trip = labels.trip[label]
+                position = network.route_stops[route].tolist().index(board)
+                departure_time = float(network.route_times[route][position, trip])
+                legs.append(('ride', network.route_ids[route], trip, network.stop_nodes[board],
+                             network.stop_nodes[stop], departure_time, labels.arrival[label]))
+            label = parent
+        legs.reverse()
+        return legs
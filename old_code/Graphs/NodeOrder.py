@@ -0,0 +1,61 @@
+import numpy as np
+
+# Порядок узлов вдоль кривой, заполняющей плоскость: близкие по координатам узлы получают близкие номера,
+# и соседи во фронте поиска лежат рядом в массивах (CSRGraph, веса, координаты), а не по всей памяти.
+# Гильберт сохраняет близость лучше Мортона (у Мортона скачки на границах квадрантов), Мортон дешевле считать
+CURVES = ('hilbert', 'morton')
+CURVE_BITS = 16  # сетка 2^16 x 2^16 по рамке графа: для города ячейка — доли метра
+
+
+def quantize(lats, lons, bits=CURVE_BITS):
+    '''Координаты -> целые x, y в [0, 2^bits) по рамке точек'''
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    side = (1 << bits) - 1
+
+    def scale(values):
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(len(values), dtype=np.uint64)
+        return np.round((values - low) / (high - low) * side).astype(np.uint64)
+
+    return scale(lons), scale(lats)
+
+
+def morton_keys(x, y, bits=CURVE_BITS):
+    '''Z-порядок: биты x и y через один'''
+    keys = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(bits):
+        keys |= ((x >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        keys |= ((y >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return keys
+
+
+def hilbert_keys(x, y, bits=CURVE_BITS):
+    '''Номер точки на кривой Гильберта порядка bits (классический xy2d, по всем точкам сразу)'''
+    x, y = x.astype(np.int64), y.astype(np.int64)
+    keys = np.zeros(len(x), dtype=np.int64)
+    n = 1 << bits
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # поворот четверти, чтобы следующий уровень шёл в том же направлении
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return keys
+
+
+def get_order(lats, lons, curve='hilbert', bits=CURVE_BITS):
+    '''Перестановка: order[новый номер] = старый номер, узлы по возрастанию ключа кривой'''
+    if curve not in CURVES:
+        raise ValueError(f'unknown curve {curve!r}, expected one of {CURVES}')
+    if len(lats) == 0:
+        return np.empty(0, dtype=np.int64)
+    x, y = quantize(lats, lons, bits)
+    keys = hilbert_keys(x, y, bits) if curve == 'hilbert' else morton_keys(x, y, bits)
+    return np.argsort(keys, kind='stable')
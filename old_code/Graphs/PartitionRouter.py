@@ -0,0 +1,374 @@
+import heapq
+import json
+import math
+import os
+import time
+from collections import deque
+
+import networkx as nx
+import numpy as np
+
+# направления проекций для inertial flow: углы к оси восток-запад
+DIRECTIONS = (0.0, 45.0, 90.0, 135.0)
+
+
+def get_subgraph(csr, nodes, local):
+    '''
+    Рёбра CSR внутри подмножества узлов в локальной нумерации: (src, dst), по одной записи на направление.
+    local — массив длины N, local[nodes] уже заполнен номерами 0..len(nodes)-1, остальные -1
+    '''
+    starts = csr.indptr[nodes]
+    counts = csr.indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    arcs = np.arange(total, dtype=np.int64) + offsets
+    src = np.repeat(np.arange(len(nodes), dtype=np.int64), counts)
+    dst = local[csr.indices[arcs]].astype(np.int64)
+    keep = (dst >= 0) & (dst != src)
+    return src[keep], dst[keep]
+
+
+def inertial_flow_bisect(csr, nodes, balance=0.25, directions=DIRECTIONS):
+    '''
+    Делит узлы на две части с маленьким разрезом:
+      1) для каждого направления проецируем координаты и считаем рёбра через медиану, берём лучшее,
+      2) первые balance узлов по проекции — источники, последние — стоки,
+      3) минимальный разрез между ними единичным потоком (пути находим BFS), левая часть — достижимые
+         из источников в остаточной сети.
+    Возвращает (left, right) — массивы номеров узлов
+    '''
+    k = len(nodes)
+    local = np.full(csr.get_num_nodes(), -1, dtype=np.int64)
+    local[nodes] = np.arange(k)
+    src, dst = get_subgraph(csr, nodes, local)
+
+    lats, lons = csr.lats[nodes], csr.lons[nodes]
+    x = lons * math.cos(math.radians(float(np.mean(lats))))
+    best = None
+    for angle in directions:
+        a = math.radians(angle)
+        order = np.argsort(x * math.cos(a) + lats * math.sin(a), kind='stable')
+        rank = np.empty(k, dtype=np.int64)
+        rank[order] = np.arange(k)
+        crossing = int(np.count_nonzero((rank[src] < k // 2) != (rank[dst] < k // 2)))
+        if best is None or crossing < best[0]:
+            best = (crossing, order)
+    order = best[1]
+
+    # локальный CSR с обратными дугами: rev[a] — дуга (dst, src) для дуги a = (src, dst)
+    arc_order = np.lexsort((dst, src))
+    src, dst = src[arc_order], dst[arc_order]
+    indptr = np.zeros(k + 1, dtype=np.int64)
+    np.add.at(indptr, src + 1, 1)
+    indptr = np.cumsum(indptr)
+    keys = src * k + dst
+    rev = np.searchsorted(keys, dst * k + src)
+    indptr, dst, rev = indptr.tolist(), dst.tolist(), rev.tolist()
+    flow = [0] * len(dst)
+
+    side = max(1, int(k * balance))
+    is_source = [False] * k
+    is_sink = [False] * k
+    for u in order[:side].tolist():
+        is_source[u] = True
+    for u in order[k - side:].tolist():
+        is_sink[u] = True
+    sources = order[:side].tolist()
+
+    while True:
+        # BFS по остаточной сети от всех источников сразу
+        parent_arc = [-1] * k
+        visited = is_source[:]
+        queue = deque(sources)
+        found = -1
+        while queue and found < 0:
+            u = queue.popleft()
+            for a in range(indptr[u], indptr[u + 1]):
+                v = dst[a]
+                if not visited[v] and flow[a] < 1:
+                    visited[v] = True
+                    parent_arc[v] = a
+                    if is_sink[v]:
+                        found = v
+                        break
+                    queue.append(v)
+        if found < 0:
+            break
+        v = found
+        while not is_source[v]:
+            a = parent_arc[v]
+            flow[a] += 1
+            flow[rev[a]] -= 1
+            v = dst[rev[a]]
+
+    left_mask = np.array(visited, dtype=bool)
+    return nodes[left_mask], nodes[~left_mask]
+
+
+class GraphPartition:
+    '''
+    Вложенное разбиение узлов CSRGraph на ячейки, не зависящее от весов:
+    cells[level][node] — номер ячейки узла на уровне level, ячейка уровня l целиком лежит в одной ячейке
+    уровня l + 1; cell_sizes[level] — предельный размер ячейки уровня.
+    Строится один раз на город рекурсивным inertial flow, при смене весов не меняется.
+    '''
+
+    def __init__(self, cells, cell_sizes):
+        self.cells = cells
+        self.cell_sizes = tuple(cell_sizes)
+
+    @classmethod
+    def build(cls, csr, cell_sizes=(128, 1024, 8192), balance=0.25):
+        num_levels = len(cell_sizes)
+        cells = np.zeros((num_levels, csr.get_num_nodes()), dtype=np.int32)
+        counters = [0] * num_levels
+        # стек (узлы, самый верхний ещё не назначенный уровень)
+        stack = [(np.arange(csr.get_num_nodes(), dtype=np.int64), num_levels - 1)]
+        while stack:
+            nodes, level = stack.pop()
+            while level >= 0 and len(nodes) <= cell_sizes[level]:
+                cells[level, nodes] = counters[level]
+                counters[level] += 1
+                level -= 1
+            if level < 0:
+                continue
+            left, right = inertial_flow_bisect(csr, nodes, balance=balance)
+            if not len(left) or not len(right):
+                # делить нечего (все узлы в одной точке) — режем пополам по номеру
+                left, right = nodes[:len(nodes) // 2], nodes[len(nodes) // 2:]
+            stack.append((right, level))
+            stack.append((left, level))
+        return cls(cells, cell_sizes)
+
+    def get_num_levels(self):
+        return len(self.cell_sizes)
+
+    def get_num_cells(self, level):
+        return int(self.cells[level].max()) + 1 if self.cells.shape[1] else 0
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'cells.npy'), self.cells)
+        with open(os.path.join(directory, 'partition.json'), 'w', encoding='utf-8') as f:
+            json.dump({'cell_sizes': list(self.cell_sizes)}, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'partition.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(directory, 'cells.npy')), meta['cell_sizes'])
+
+
+class PartitionRouter:
+    '''
+    Многоуровневый поиск по разбиению (CRP) поверх CSRGraph.
+    Граничный узел уровня l — узел, у которого есть ребро в другую ячейку уровня l.
+    customize() для каждой ячейки каждого уровня считает клику — кратчайшие расстояния между её
+    граничными узлами внутри ячейки (уровень 0 — по рёбрам графа, уровень l — по кликам и разрезным
+    рёбрам уровня l - 1). Это единственная часть, зависящая от весов, и она пересчитывается при смене
+    профиля или перекрытиях за секунды, разбиение остаётся прежним.
+    shortest_path() идёт по рёбрам графа только в ячейках уровня 0 с началом и концом,
+    а дальше — по кликам самого верхнего уровня, на котором узел не в одной ячейке ни с началом, ни с концом.
+    '''
+
+    def __init__(self, csr, partition):
+        self.csr = csr
+        self.partition = partition
+        self.num_levels = partition.get_num_levels()
+        self.cells = [partition.cells[level].tolist() for level in range(self.num_levels)]
+        self.indptr = csr.indptr.tolist()
+        self.indices = csr.indices.tolist()
+        # boundary[level][cell] — граничные узлы ячейки, boundary_pos[level][node] — место узла в этом списке
+        self.boundary = []
+        self.boundary_pos = []
+        src = np.repeat(np.arange(csr.get_num_nodes()), np.diff(csr.indptr))
+        for level in range(self.num_levels):
+            cells = partition.cells[level]
+            mask = np.zeros(csr.get_num_nodes(), dtype=bool)
+            mask[src[cells[src] != cells[csr.indices]]] = True
+            nodes = np.nonzero(mask)[0]
+            nodes = nodes[np.argsort(cells[nodes], kind='stable')]
+            boundary = [[] for _ in range(partition.get_num_cells(level))]
+            positions = {}
+            for node, cell in zip(nodes.tolist(), cells[nodes].tolist()):
+                positions[node] = len(boundary[cell])
+                boundary[cell].append(node)
+            self.boundary.append(boundary)
+            self.boundary_pos.append(positions)
+        self.cliques = None
+        self.customize_time = None
+
+    # -----------------------
+    # customization: клики ячеек под текущие веса
+    # -----------------------
+
+    def customize(self, edge_weights=None):
+        '''
+        Пересчитывает клики всех ячеек снизу вверх. edge_weights — веса по edge_id (Graph.weights) для
+        нового профиля; без него берутся текущие веса CSR
+        '''
+        start_time = time.perf_counter()
+        if edge_weights is not None:
+            self.csr.set_weights(edge_weights)
+        self.weights = self.csr.weights.tolist()
+        self.cliques = []
+        for level in range(self.num_levels):
+            cliques = []
+            for cell, boundary in enumerate(self.boundary[level]):
+                cliques.append(self.get_cell_clique(level, cell, boundary))
+            self.cliques.append(cliques)
+        self.customize_time = time.perf_counter() - start_time
+        return self.customize_time
+
+    def update_edge_weights(self, updates):
+        '''
+        Инкрементальная customization: {edge_id: вес} меняется в CSR, а клики пересчитываются только у ячеек,
+        внутри которых лежат изменённые рёбра (по уровням снизу вверх). Возвращает число пересчитанных ячеек
+        '''
+        positions = self.csr.update_edge_weights(updates)
+        if self.cliques is None:
+            self.weights = self.csr.weights.tolist()
+            return 0
+        sources = np.searchsorted(self.csr.indptr, positions, side='right') - 1
+        dirty = [set() for _ in range(self.num_levels)]
+        for k, u in zip(positions.tolist(), sources.tolist()):
+            self.weights[k] = float(self.csr.weights[k])
+            v = self.indices[k]
+            for level in range(self.num_levels):
+                if self.cells[level][u] == self.cells[level][v]:
+                    dirty[level].add(self.cells[level][u])
+        for level in range(self.num_levels):
+            for cell in dirty[level]:
+                self.cliques[level][cell] = self.get_cell_clique(level, cell, self.boundary[level][cell])
+        return sum(len(cells) for cells in dirty)
+
+    def get_cell_clique(self, level, cell, boundary):
+        rows = []
+        for node in boundary:
+            dist, _ = self.cell_search(level, cell, node)
+            rows.append([dist.get(other, math.inf) for other in boundary])
+        return rows
+
+    def get_arcs(self, node, level):
+        '''
+        Дуги узла в графе уровня level: клика его ячейки и разрезные рёбра уровня
+        (в другую ячейку уровня); level = -1 — просто рёбра графа.
+        Элементы — (сосед, вес, уровень клики или -1 для ребра графа)
+        '''
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        if level < 0:
+            return [(indices[k], weights[k], -1) for k in range(indptr[node], indptr[node + 1])]
+        cells = self.cells[level]
+        cell = cells[node]
+        arcs = [(indices[k], weights[k], -1) for k in range(indptr[node], indptr[node + 1])
+                if cells[indices[k]] != cell]
+        row = self.cliques[level][cell][self.boundary_pos[level][node]]
+        boundary = self.boundary[level][cell]
+        arcs += [(boundary[j], row[j], level) for j in range(len(row)) if row[j] < math.inf and boundary[j] != node]
+        return arcs
+
+    def cell_search(self, level, cell, source, target=None):
+        '''
+        Дейкстра внутри ячейки уровня level по графу уровня level - 1.
+        Возвращает (dist, parent), parent[v] = (u, уровень дуги u -> v)
+        '''
+        cells = self.cells[level]
+        dist = {source: 0.0}
+        parent = {source: (-1, -1)}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u == target:
+                break
+            for v, w, arc_level in self.get_arcs(u, level - 1):
+                if cells[v] != cell:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = (u, arc_level)
+                    heapq.heappush(heap, (nd, v))
+        return dist, parent
+
+    # -----------------------
+    # запрос
+    # -----------------------
+
+    def get_query_level(self, node, source_cells, target_cells):
+        '''Уровень графа, по которому идём из узла: на единицу ниже первой ячейки, общей с началом или концом'''
+        for level in range(self.num_levels):
+            cell = self.cells[level][node]
+            if cell == source_cells[level] or cell == target_cells[level]:
+                return level - 1
+        return self.num_levels - 1
+
+    def shortest_path(self, source, target, stats=None):
+        '''Путь по номерам узлов CSR и его вес, как CSRGraph.shortest_path'''
+        if self.cliques is None:
+            raise RuntimeError('PartitionRouter.customize() не вызывался')
+        if not self.csr.is_reachable(source, target):
+            raise nx.NetworkXNoPath(f'Node {target} not reachable from {source}')
+        source_cells = [self.cells[level][source] for level in range(self.num_levels)]
+        target_cells = [self.cells[level][target] for level in range(self.num_levels)]
+        dist = {source: 0.0}
+        parent = {source: (-1, -1)}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if stats is not None:
+                stats.pops += 1
+            if u in settled:
+                if stats is not None:
+                    stats.stale_pops += 1
+                continue
+            settled.add(u)
+            if stats is not None:
+                stats.settled += 1
+            if u == target:
+                break
+            for v, w, arc_level in self.get_arcs(u, self.get_query_level(u, source_cells, target_cells)):
+                nd = d + w
+                if stats is not None:
+                    stats.relaxed += 1
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = (u, arc_level)
+                    heapq.heappush(heap, (nd, v))
+                    if stats is not None:
+                        stats.pushes += 1
+        if target not in settled:
+            raise nx.NetworkXNoPath(f'Node {target} not reachable from {source}')
+        if stats is not None:
+            unpack_start = time.perf_counter()
+        path = self.unpack(parent, source, target)
+        if stats is not None:
+            stats.unpack_time += time.perf_counter() - unpack_start
+        return path, dist[target]
+
+    def unpack(self, parent, source, target):
+        '''Разворачивает дуги-клики в пути по рёбрам графа (поиском внутри ячейки, рекурсивно по уровням)'''
+        arcs = []
+        node = target
+        while node != source:
+            prev, arc_level = parent[node]
+            arcs.append((prev, node, arc_level))
+            node = prev
+        # arcs — стек: следующая дуга пути в конце
+        path = [source]
+        while arcs:
+            u, v, arc_level = arcs.pop()
+            if arc_level < 0:
+                path.append(v)
+                continue
+            _, cell_parent = self.cell_search(arc_level, self.cells[arc_level][u], u, v)
+            node = v
+            while node != u:
+                prev, inner_level = cell_parent[node]
+                arcs.append((prev, node, inner_level))
+                node = prev
+        return path
@@ -0,0 +1,43 @@
+'''
+Кодирование линии в строку (Google encoded polyline): дельты координат, умноженные на 10^precision,
+пишутся переменной длиной по 5 бит на символ. Маршрут из сотен точек занимает несколько сотен байт
+вместо списка кортежей из float.
+'''
+
+
+def encode_polyline(points, precision=6):
+    factor = 10 ** precision
+    result = []
+    prev_lat, prev_lon = 0, 0
+    for lat, lon in points:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return ''.join(result)
+
+
+def decode_polyline(encoded, precision=6):
+    factor = 10 ** precision
+    points = []
+    index, lat, lon = 0, 0, 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift, value = 0, 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
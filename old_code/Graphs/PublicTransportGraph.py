@@ -1,5 +1,8 @@
+from old_code.Graphs import InstrumentedSearch
+from old_code.Graphs.Geodesic import haversine
 from old_code.Graphs.Graph import Graph
 import networkx as nx
+import numpy as np
 
 
 class PublicTransportGraph(Graph):
@@ -12,28 +15,64 @@ class PublicTransportGraph(Graph):
         # пока предлагаю не привязыватьс к конкретному времени
 
     def add_pedestrian_way(self, nodes):
+        self.version += 1
         prev_node = nodes[0]
-        self.graph.add_node(prev_node.ref, coords=(prev_node.lat, prev_node.lon))
+        prev_index = self.add_node(prev_node.ref, prev_node.lat, prev_node.lon)
         for i in range(1, len(nodes)):
             curr_node = nodes[i]
-            self.graph.add_node(curr_node.ref, coords=(curr_node.lat, curr_node.lon))
-            dist = self.haversine((prev_node.lat, prev_node.lon), (curr_node.lat, curr_node.lon))
+            curr_index = self.add_node(curr_node.ref, curr_node.lat, curr_node.lon)
+            dist = haversine((prev_node.lat, prev_node.lon), (curr_node.lat, curr_node.lon))
             time = dist / 4500
-            self.graph.add_edge(prev_node.ref, curr_node.ref, weight=time)
-            prev_node = curr_node
+            self.graph.add_edge(prev_index, curr_index, weight=time)
+            self.components.union(prev_index, curr_index)
+            prev_node, prev_index = curr_node, curr_index
 
-    def add_public_transport_way(self, nodes_and_time):
+    def add_public_transport_way(self, nodes_and_time, times=None):
         # на вход узел (id, широта, долгота) и время
+        # times - время между соседними узлами в часах (из расписания); без него - оценка по расстоянию
+        self.version += 1
         prev_node = nodes_and_time[0]
-        self.graph.add_node(prev_node[0], coords=(prev_node[1], prev_node[2]))
+        prev_index = self.add_node(prev_node[0], prev_node[1], prev_node[2])
         for i in range(1, len(nodes_and_time)):
             curr_node = nodes_and_time[i]
-            self.graph.add_node(curr_node[0], coords=(curr_node[1], curr_node[2]))
-            dist = self.haversine((prev_node[1], prev_node[2]), (curr_node[1], curr_node[2]))
-            time = dist / 20000 # приблизительная скорость автомобиля в городе
-            self.graph.add_edge(prev_node[0], curr_node[0], weight=time)
-            prev_node = curr_node
+            curr_index = self.add_node(curr_node[0], curr_node[1], curr_node[2])
+            if times is not None:
+                time = times[i - 1]
+            else:
+                dist = haversine((prev_node[1], prev_node[2]), (curr_node[1], curr_node[2]))
+                time = dist / 20000 # приблизительная скорость автомобиля в городе
+            # один перегон могут проходить несколько маршрутов - оставляем самый быстрый
+            if self.graph.has_edge(prev_index, curr_index):
+                time = min(time, self.graph.edges[prev_index, curr_index]['weight'])
+            self.graph.add_edge(prev_index, curr_index, weight=time)
+            self.components.union(prev_index, curr_index)
+            prev_node, prev_index = curr_node, curr_index
 
-    def get_shortest_route(self, start, end):
+    def add_gtfs(self, feed, stop_nodes=None):
+        # перегоны шаблонов рейсов GtfsFeed со временем по расписанию (медиана по рейсам)
+        # stop_nodes - узлы графа для остановок фида (feed.snap_stops), по умолчанию привязываем здесь
+        # остановки без узла пропускаются: перегон идёт от предыдущей привязанной остановки
+        if stop_nodes is None:
+            stop_nodes, _ = feed.snap_stops(self)
+        for pattern in feed.patterns:
+            nodes, times = [], []
+            last = None  # позиция последней взятой остановки в шаблоне
+            for pos, stop in enumerate(pattern.stops.tolist()):
+                node = int(stop_nodes[stop])
+                if node < 0 or (nodes and self.get_node_by_osm_id(nodes[-1][0]) == node):
+                    continue
+                if nodes:
+                    seconds = np.median(pattern.arrivals[pos] - pattern.departures[last])
+                    times.append(float(seconds) / 3600)
+                lat, lon = self.get_node_coords(node)
+                nodes.append((self.get_osm_id(node), lat, lon))
+                last = pos
+            if len(nodes) > 1:
+                self.add_public_transport_way(nodes, times)
+
+    def get_shortest_route(self, start, end, stats=None):
+        if stats is not None:
+            with stats.timer('search_time'):
+                return InstrumentedSearch.dijkstra_path(self.graph, start, end, 'time', stats)
         shortest_route = nx.shortest_path(self.graph, start, end, weight='time')
         return shortest_route
\ No newline at end of file
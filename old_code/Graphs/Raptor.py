@@ -0,0 +1,217 @@
+import math
+
+import numpy as np
+
+from old_code.Graphs.Timetable import NO_TRIP
+
+ACCESS = -2  # метка пришла пешком от точки старта (раунд 0)
+FOOT = -1  # метка пришла пешей пересадкой с другой остановки
+
+
+class RaptorLabels:
+    '''
+    Метки RAPTOR по раундам: arrival[k, остановка] — лучшее прибытие не больше чем за k поездок (поездкой
+    или пешей пересадкой после неё — с него садятся в следующем раунде и идут к цели), ride[k, остановка] —
+    лучшее прибытие поездкой: пешая пересадка начинается только с него, иначе прогулки склеивались бы
+    в одну длиннее max_walk. walk_from[k, остановка] — откуда пришла пешком метка arrival (-1 — это поездка
+    или подход в раунде 0). Для отсечения: best_ride — поездки по всем раундам, best — поездки и пересадки
+    (подход пешком не отсекает ничего, пересадка не отсекает поездку: после них нельзя то, что можно после
+    поездки). target[k] — прибытие в цель за k поездок. Откуда поездка: parent_route (номер маршрута,
+    ACCESS в раунде 0), parent_stop (остановка посадки), parent_trip.
+    Для профильного поиска (Raptor.profile) метки не сбрасываются между моментами выхода: более ранний выход
+    может всё, что поздний (подождать), поэтому старые метки — верхние оценки и для него
+    '''
+
+    def __init__(self, num_stops, max_rounds):
+        shape = (max_rounds + 1, num_stops)
+        self.arrival = np.full(shape, math.inf)
+        self.ride = np.full(shape, math.inf)
+        self.walk_from = np.full(shape, -1, dtype=np.int32)
+        self.best = np.full(num_stops, math.inf)
+        self.best_ride = np.full(num_stops, math.inf)
+        self.target = np.full(max_rounds + 1, math.inf)
+        self.target_stop = np.full(max_rounds + 1, -1, dtype=np.int32)  # с какой остановки дошли до цели
+        self.parent_route = np.full(shape, ACCESS, dtype=np.int32)
+        self.parent_stop = np.full(shape, -1, dtype=np.int32)
+        self.parent_trip = np.full(shape, -1, dtype=np.int32)
+
+
+class Raptor:
+    '''
+    RAPTOR по TransitNetwork: раунд k — все поездки с k-1 пересадками. В раунде просматриваются маршруты
+    через остановки, улучшенные в прошлом раунде; маршрут просматривается целиком векторно: ближайший рейс
+    на каждой остановке — один searchsorted (StackedRows), рейс, на котором едем к остановке p, — минимум
+    по доступным рейсам на остановках до p (np.minimum.accumulate, рейсы не обгоняют друг друга).
+    profile — rRAPTOR: моменты выхода в окне перебираются от поздних к ранним, метки переиспользуются,
+    и весь профиль стоит немногим больше одного поиска
+    '''
+
+    def __init__(self, network, max_rounds=5):
+        self.network = network
+        self.max_rounds = max_rounds
+
+    def get_egress(self, target, max_walk=None):
+        '''Время пешком от каждой остановки до цели (inf — дальше max_walk) и все узлы в этом радиусе'''
+        stops, times, reached = self.network.get_access(target, max_walk)
+        egress = np.full(self.network.get_num_stops(), math.inf)
+        egress[stops] = times
+        return egress, reached
+
+    def run(self, labels, marked, egress, stats=None, routes=None):
+        '''
+        Раунды 1..max_rounds от меток раунда 0 у остановок marked. routes — какие маршруты смотреть в первом
+        раунде, по умолчанию все через marked
+        '''
+        network = self.network
+        for k in range(1, self.max_rounds + 1):
+            if not marked:
+                break
+            prev, cur = labels.arrival[k - 1], labels.arrival[k]
+            if k > 1 or routes is None:
+                routes = set()
+                for stop in marked:
+                    routes.update(network.get_stop_routes(stop)[0].tolist())
+            improved = set()  # остановки, куда улучшилась поездка
+            marked = set()  # остановки, где улучшилась метка arrival: с них садятся в следующем раунде
+            bound = labels.target[:k + 1].min()
+            for r in routes:
+                stops = network.route_stops[r]
+                times = network.route_times[r]
+                num_trips = times.shape[1]
+                trips = network.route_rows[r].next_trips(prev[stops])
+                trips[trips == NO_TRIP] = num_trips
+                active = np.minimum.accumulate(trips)
+                # на остановку p приезжаем рейсом, на который сели где-то до p
+                riding = active[:-1]
+                positions = np.flatnonzero(riding < num_trips) + 1
+                if stats is not None:
+                    stats.relaxed += len(stops)
+                if not len(positions):
+                    continue
+                arrivals = times[positions, riding[positions - 1]]
+                better = np.flatnonzero(arrivals < np.minimum(labels.best_ride[stops[positions]], bound))
+                if not len(better):
+                    continue
+                # остановка посадки — последняя до p, где доступен ровно этот рейс
+                boarded = np.maximum.accumulate(np.where(trips == active, np.arange(len(stops)), 0))
+                for i in better.tolist():
+                    p = int(positions[i])
+                    stop = int(stops[p])
+                    arrival = float(arrivals[i])
+                    if arrival < labels.best_ride[stop]:  # на кольцевом маршруте остановка бывает дважды
+                        labels.ride[k, stop] = labels.best_ride[stop] = arrival
+                        labels.parent_route[k, stop] = r
+                        labels.parent_stop[k, stop] = stops[boarded[p - 1]]
+                        labels.parent_trip[k, stop] = riding[p - 1]
+                        improved.add(stop)
+                        if arrival < cur[stop]:
+                            cur[stop] = arrival
+                            labels.walk_from[k, stop] = -1
+                        if arrival < labels.best[stop]:
+                            labels.best[stop] = arrival
+                            marked.add(stop)
+            # пешие пересадки от улучшенных поездкой остановок — от прибытия поездкой, а не от пересадки,
+            # пришедшей сюда же в этом раунде (таблица уже кратчайшая, цепочки не нужны)
+            for stop in improved:
+                others, walk_times = network.get_transfers(stop)
+                if stats is not None:
+                    stats.relaxed += len(others)
+                ride = labels.ride[k, stop]
+                for other, walk_time in zip(others.tolist(), walk_times.tolist()):
+                    arrival = ride + walk_time
+                    if arrival < labels.best[other] and arrival < bound:
+                        cur[other] = labels.best[other] = arrival
+                        labels.walk_from[k, other] = stop
+                        marked.add(other)
+            if stats is not None:
+                stats.settled += len(marked)
+            if marked:
+                candidates = np.fromiter(marked, dtype=np.int64, count=len(marked))
+                totals = cur[candidates] + egress[candidates]
+                i = int(np.argmin(totals))
+                if totals[i] < labels.target[k]:
+                    labels.target[k] = totals[i]
+                    labels.target_stop[k] = candidates[i]
+        return labels
+
+    def start(self, labels, access_stops, access_times, departure):
+        '''Метки раунда 0 для выхода в departure; возвращает остановки, где они улучшились'''
+        marked = set()
+        for stop, walk_time in zip(access_stops.tolist(), access_times.tolist()):
+            arrival = departure + walk_time
+            if arrival < labels.arrival[0, stop]:
+                labels.arrival[0, stop] = arrival
+                labels.parent_route[0, stop] = ACCESS
+                marked.add(stop)
+        return marked
+
+    def earliest_arrival(self, source, target, departure, stats=None):
+        '''
+        Самое раннее прибытие из узла source в узел target при выходе в departure: (время, поездок, маршрут),
+        маршрут — список участков (см. get_journey); пешком без транспорта, если так быстрее — 0 поездок.
+        Пути нет — (inf, None, None)
+        '''
+        access_stops, access_times, reached = self.network.get_access(source)
+        egress, _ = self.get_egress(target)
+        labels = RaptorLabels(self.network.get_num_stops(), self.max_rounds)
+        labels.target[0] = departure + reached.get(target, math.inf)
+        self.run(labels, self.start(labels, access_stops, access_times, departure), egress, stats)
+        k = int(np.argmin(labels.target))
+        if labels.target[k] == math.inf:
+            return math.inf, None, None
+        return float(labels.target[k]), k, self.get_journey(labels, k, source, target, departure)
+
+    def profile(self, source, target, start, end, stats=None):
+        '''
+        Профиль на окно выхода [start, end]: Парето-множество [(выход, прибытие, поездок)] по убыванию выхода —
+        каждый следующий выходит раньше и приезжает строго раньше. Второе значение — время пешком до цели без
+        транспорта (inf — дальше max_walk): поездки, которые не быстрее него, в профиль не попадают
+        '''
+        access_stops, access_times, reached = self.network.get_access(source)
+        egress, _ = self.get_egress(target)
+        walk_time = reached.get(target, math.inf)
+        labels = RaptorLabels(self.network.get_num_stops(), self.max_rounds)
+        result = []
+        best_arrival = math.inf
+        departures, sources = self.network.get_departures(access_stops, access_times, start, end)
+        for i, (departure, routes) in enumerate(zip(departures.tolist(), sources)):
+            marked = self.start(labels, access_stops, access_times, departure)
+            # первый (самый поздний) выход — полный поиск: он же ловит рейсы, уходящие после окна. Дальше
+            # метки подхода становятся раньше везде, но новый рейс, на который теперь успеваем, есть только у routes
+            self.run(labels, marked, egress, stats, routes=routes.tolist() if i else None)
+            k = int(np.argmin(labels.target))
+            arrival = float(labels.target[k])
+            if arrival < best_arrival and arrival - departure < walk_time:
+                result.append((departure, arrival, k))
+                best_arrival = arrival
+        return result, walk_time
+
+    def get_journey(self, labels, k, source, target, departure):
+        '''
+        Участки пути по меткам раунда k: ('walk', откуда, куда, выход, прибытие) и
+        ('ride', id маршрута, рейс, откуда, куда, посадка, прибытие); узлы — node_id графа кластеризатора
+        '''
+        network = self.network
+        stop = int(labels.target_stop[k])
+        if stop < 0:
+            return [('walk', source, target, departure, float(labels.target[k]))]
+        legs = [('walk', network.stop_nodes[stop], target, float(labels.arrival[k, stop]), float(labels.target[k]))]
+        while k:
+            previous = int(labels.walk_from[k, stop])
+            if previous >= 0:
+                legs.append(('walk', network.stop_nodes[previous], network.stop_nodes[stop],
+                             float(labels.ride[k, previous]), float(labels.arrival[k, stop])))
+                stop = previous
+            route = int(labels.parent_route[k, stop])
+            previous = int(labels.parent_stop[k, stop])
+            trip = int(labels.parent_trip[k, stop])
+            times = network.route_times[route]
+            stops = network.route_stops[route]
+            board = int(np.flatnonzero(stops == previous)[0])
+            legs.append(('ride', network.route_ids[route], trip, network.stop_nodes[previous],
+                         network.stop_nodes[stop], float(times[board, trip]), float(labels.ride[k, stop])))
+            k -= 1
+            stop = previous
+        legs.append(('walk', source, network.stop_nodes[stop], departure, float(labels.arrival[0, stop])))
+        legs.reverse()
+        return legs
@@ -0,0 +1,102 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from old_code.Graphs.Polyline import decode_polyline, encode_polyline
+
+
+class RouteCache:
+    '''
+    LRU-кэш готовых маршрутов перед движками. Ключ — (город, режим, привязанный старт, привязанный финиш,
+    профиль веса), поэтому разные точки, привязавшиеся к одним узлам, попадают в одну запись.
+    Геометрия хранится строкой encoded polyline. Каждая запись помнит версию графа, на которой
+    посчитана; при смене версии (граф перестроен или изменён) запись считается промахом и удаляется.
+    Если при put() переданы edge_id рёбер маршрута, запись можно сбросить точечно — invalidate_edges()
+    убирает только маршруты через указанные рёбра (перекрытия улиц, EdgeOverlay).
+    Ограничен и числом записей, и примерным объёмом в байтах.
+    '''
+
+    def __init__(self, max_entries=100000, max_bytes=64 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # ключ -> (версия графа, polyline, длина маршрута, edge_id рёбер)
+        self.edge_keys = {}  # (город, режим, edge_id) -> ключи записей, чьи маршруты идут по ребру
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()  # сервер ходит в кэш из пула потоков
+
+    @staticmethod
+    def get_key(city, mode, start_node, end_node, profile='distance'):
+        return city, mode, start_node, end_node, profile
+
+    @staticmethod
+    def get_entry_size(key, entry):
+        # 64 — кортежи и float записи, по 8 байт на ребро в индексе рёбер
+        return sys.getsizeof(entry[1]) + sys.getsizeof(key) + 64 + 8 * len(entry[3])
+
+    def get(self, key, version):
+        '''Возвращает (список точек, длина) или None'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self.remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return decode_polyline(entry[1]), entry[2]
+
+    def put(self, key, version, points, distance, edges=()):
+        entry = (version, encode_polyline(points), distance, tuple(edges))
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = entry
+            self.bytes += self.get_entry_size(key, entry)
+            for edge_id in entry[3]:
+                self.edge_keys.setdefault((key[0], key[1], edge_id), set()).add(key)
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= self.get_entry_size(key, entry)
+        for edge_id in entry[3]:
+            keys = self.edge_keys.get((key[0], key[1], edge_id))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.edge_keys[(key[0], key[1], edge_id)]
+
+    def invalidate(self, city=None, mode=None):
+        '''Сбрасывает записи города/режима (или все); версии и так отсекают устаревшее, это — чтобы освободить память'''
+        with self.lock:
+            keys = [k for k in self.entries if (city is None or k[0] == city) and (mode is None or k[1] == mode)]
+            for key in keys:
+                self.remove(key)
+        return len(keys)
+
+    def invalidate_edges(self, city, mode, edge_ids):
+        '''Сбрасывает только маршруты города/режима, проходящие по данным рёбрам; возвращает число записей'''
+        with self.lock:
+            keys = set()
+            for edge_id in edge_ids:
+                keys |= self.edge_keys.get((city, mode, edge_id), set())
+            for key in keys:
+                self.remove(key)
+        return len(keys)
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'evictions': self.evictions,
+        }
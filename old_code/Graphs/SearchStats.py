@@ -0,0 +1,72 @@
+import math
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class SearchStats:
+    '''
+    Счётчики работы одного запроса маршрутизации. Передаётся в роутер необязательным
+    аргументом stats; если его нет (None), роутеры идут прежним путём без учёта.
+    Время — в секундах.
+    '''
+    COUNTERS = ('settled', 'relaxed', 'pushes', 'pops', 'stale_pops')
+    TIMERS = ('snap_time', 'search_time', 'unpack_time')
+
+    def __init__(self, label=None):
+        self.label = label  # чем пометить запрос, например (start, end)
+        self.settled = 0
+        self.relaxed = 0
+        self.pushes = 0
+        self.pops = 0
+        self.stale_pops = 0
+        self.snap_time = 0.0
+        self.search_time = 0.0
+        self.unpack_time = 0.0
+
+    @contextmanager
+    def timer(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, name, getattr(self, name) + time.perf_counter() - start_time)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.COUNTERS + self.TIMERS}
+
+    def __repr__(self):
+        return 'SearchStats(' + ', '.join(f'{k}={v}' for k, v in self.as_dict().items()) + ')'
+
+
+class SearchStatsCollector:
+    '''Собирает SearchStats многих запросов в гистограммы (корзины по степеням двойки)'''
+
+    def __init__(self):
+        self.stats = []
+
+    def add(self, stats):
+        self.stats.append(stats)
+
+    @staticmethod
+    def bucket(value, field):
+        if field in SearchStats.TIMERS:
+            value = value * 1e6  # для времени корзины в микросекундах
+        if value < 1:
+            return 0
+        return 2 ** int(math.log2(value))
+
+    def histogram(self, field):
+        '''Корзина (нижняя граница, для времени — мкс) -> число запросов'''
+        counter = Counter(self.bucket(getattr(stats, field), field) for stats in self.stats)
+        return dict(sorted(counter.items()))
+
+    def histograms(self):
+        return {field: self.histogram(field) for field in SearchStats.COUNTERS + SearchStats.TIMERS}
+
+    def worst(self, field='settled', count=10):
+        '''Запросы, которые «взорвались» сильнее всего по выбранному полю'''
+        return sorted(self.stats, key=lambda stats: getattr(stats, field), reverse=True)[:count]
+
+    def __len__(self):
+        return len(self.stats)
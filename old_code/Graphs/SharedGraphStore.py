@@ -0,0 +1,51 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from old_code.Graphs.CSRGraph import CSRGraph
+
+ALIGN = 64
+
+
+class SharedGraphStore:
+    '''
+    Кладёт массивы CSRGraph в один блок разделяемой памяти. publish() делается один раз в главном
+    процессе и возвращает небольшой handle (имя блока и раскладку массивов); handle передаётся воркерам,
+    они делают attach() и читают ту же память без копирования и без перестроения графа.
+    '''
+
+    def __init__(self):
+        self.blocks = []  # созданные этим процессом блоки, их надо освободить в close()
+
+    def publish(self, csr, name=None):
+        layout = {}
+        offset = 0
+        for array_name in CSRGraph.ARRAYS:
+            array = np.ascontiguousarray(getattr(csr, array_name))
+            layout[array_name] = (array.dtype.str, array.shape, offset)
+            offset += (array.nbytes + ALIGN - 1) // ALIGN * ALIGN
+        block = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+        self.blocks.append(block)
+        for array_name, (dtype, shape, array_offset) in layout.items():
+            target = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=array_offset)
+            target[...] = getattr(csr, array_name)
+        return {'name': block.name, 'layout': layout, 'cell_size': csr.cell_size, 'size': offset}
+
+    @staticmethod
+    def attach(handle):
+        '''Открывает граф из разделяемой памяти только на чтение; блок надо держать живым вместе с графом'''
+        block = shared_memory.SharedMemory(name=handle['name'])
+        arrays = {}
+        for array_name, (dtype, shape, offset) in handle['layout'].items():
+            array = np.ndarray(tuple(shape), dtype=dtype, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[array_name] = array
+        csr = CSRGraph(arrays, cell_size=handle['cell_size'])
+        csr.shared_block = block
+        return csr
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
@@ -0,0 +1,125 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from old_code.Graphs.Geodesic import haversine, haversine_many
+
+
+class SpatialIndex:
+    '''
+    Равномерная сетка по координатам узлов графа для привязки точки к ближайшему узлу.
+    Строится один раз; поиск смотрит только соседние ячейки, расширяя кольцо, пока есть шанс найти ближе.
+    '''
+
+    def __init__(self, graph, cell_size=0.005):
+        self.graph = graph
+        self.cell_size = cell_size  # градусов, ~550 м по широте
+        self.cells = defaultdict(list)
+        for node in graph.get_graph().nodes():
+            lat, lon = graph.get_node_coords(node)
+            self.cells[self.get_cell(lat, lon)].append((lat, lon, node))
+        # границы занятых ячеек, чтобы не расширять кольцо бесконечно
+        self.bounds = (min(i for i, _ in self.cells), max(i for i, _ in self.cells),
+                       min(j for _, j in self.cells), max(j for _, j in self.cells)) if self.cells else None
+
+    def add_node(self, node):
+        lat, lon = self.graph.get_node_coords(node)
+        cell = self.get_cell(lat, lon)
+        self.cells[cell].append((lat, lon, node))
+        i, j = cell
+        if self.bounds is None:
+            self.bounds = (i, i, j, j)
+        else:
+            min_i, max_i, min_j, max_j = self.bounds
+            self.bounds = (min(min_i, i), max(max_i, i), min(min_j, j), max(max_j, j))
+
+    def remove_node(self, node):
+        '''Убирает узел из привязки (например, все его рёбра перекрыты); границы сетки не сужаются'''
+        cell = self.get_cell(*self.graph.get_node_coords(node))
+        self.cells[cell] = [item for item in self.cells.get(cell, ()) if item[2] != node]
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def get_cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def get_ring(self, center, radius):
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        for i in range(ci - radius, ci + radius + 1):
+            yield i, cj - radius
+            yield i, cj + radius
+        for j in range(cj - radius + 1, cj + radius):
+            yield ci - radius, j
+            yield ci + radius, j
+
+    def nearest(self, point, component=None):
+        '''
+        Возвращает (узел, расстояние в метрах) или (None, inf) для пустого графа.
+        component — метка Graph.get_component: привязывать только к узлам этой компоненты
+        '''
+        if not self.cells:
+            return None, float('inf')
+        lat, lon = point
+        center = self.get_cell(lat, lon)
+        # сколько метров гарантированно покрывает одно кольцо (по долготе ячейка уже, чем по широте)
+        ring_meters = self.cell_size * 111320.0 * max(math.cos(math.radians(lat)), 0.01)
+        best_node, best_distance = None, float('inf')
+        radius = 0
+        max_radius = self.get_max_radius(center)
+        while radius <= max_radius:
+            for cell in self.get_ring(center, radius):
+                for node_lat, node_lon, node in self.cells.get(cell, ()):
+                    if component is not None and self.graph.get_component(node) != component:
+                        continue
+                    distance = haversine((lat, lon), (node_lat, node_lon))
+                    if distance < best_distance:
+                        best_node, best_distance = node, distance
+            # всё, что лежит дальше следующего кольца, заведомо дальше найденного
+            if best_node is not None and best_distance <= radius * ring_meters:
+                break
+            radius += 1
+        return best_node, best_distance
+
+    def get_max_radius(self, center):
+        ci, cj = center
+        min_i, max_i, min_j, max_j = self.bounds
+        return max(abs(min_i - ci), abs(max_i - ci), abs(min_j - cj), abs(max_j - cj))
+
+    def nearest_many(self, points, component=None):
+        '''
+        Привязка пачки точек: точки группируются по ячейке, и для группы расстояния до узлов её ячейки
+        и соседних считаются одной матрицей numpy. Если ближайший из них дальше ширины кольца (нет гарантии,
+        что за соседними ячейками нет ближе) — для точки обычный nearest
+        '''
+        if not self.cells:
+            return [(None, float('inf'))] * len(points)
+        groups = defaultdict(list)
+        for i, (lat, lon) in enumerate(points):
+            groups[self.get_cell(lat, lon)].append(i)
+        result = [None] * len(points)
+        for (ci, cj), members in groups.items():
+            candidates = [item for i in (ci - 1, ci, ci + 1) for j in (cj - 1, cj, cj + 1)
+                          for item in self.cells.get((i, j), ())
+                          if component is None or self.graph.get_component(item[2]) == component]
+            if not candidates:
+                for i in members:
+                    result[i] = self.nearest(points[i], component)
+                continue
+            lats = np.array([points[i][0] for i in members], dtype=np.float64)
+            lons = np.array([points[i][1] for i in members], dtype=np.float64)
+            node_lats = np.array([item[0] for item in candidates], dtype=np.float64)
+            node_lons = np.array([item[1] for item in candidates], dtype=np.float64)
+            distances = haversine_many(lats[:, None], lons[:, None], node_lats[None, :], node_lons[None, :])
+            best = np.argmin(distances, axis=1)
+            for row, i in enumerate(members):
+                distance = float(distances[row, best[row]])
+                ring_meters = self.cell_size * 111320.0 * max(math.cos(math.radians(points[i][0])), 0.01)
+                if distance <= ring_meters:
+                    result[i] = (candidates[best[row]][2], distance)
+                else:
+                    result[i] = self.nearest(points[i], component)
+        return result
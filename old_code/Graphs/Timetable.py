@@ -0,0 +1,68 @@
+import numpy as np
+
+'''
+Поиск по расписанию маршрута в виде матрицы schedule[остановка, рейс] (numpy, строка — одна остановка,
+рейсы по возрастанию, время в строке не убывает: рейсы не обгоняют друг друга, см. GtfsFeed.TripPattern).
+Всё считается целыми строками/столбцами через searchsorted и срезы, без цикла питона по элементам —
+этим пользуются модифицированная Дейкстра кластеризатора и транспортные поиски по GtfsFeed.
+'''
+
+NO_TRIP = -1
+
+
+def next_trip(schedule, pos, time):
+    '''Номер первого рейса, который на остановке pos не раньше time; NO_TRIP — таких нет'''
+    row = schedule[pos]
+    trip = int(row.searchsorted(time))
+    return trip if trip < len(row) else NO_TRIP
+
+
+class StackedRows:
+    '''
+    Несколько отсортированных строк расписания (например, строки всех маршрутов одной остановки) одним
+    массивом: строка i сдвинута на i * span, где span больше разброса всех времён, поэтому весь массив
+    отсортирован, и ближайший рейс во всех строках сразу ищется одним searchsorted
+    '''
+
+    def __init__(self, rows):
+        rows = [np.asarray(row) for row in rows]
+        self.lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        self.starts = np.cumsum(self.lengths) - self.lengths
+        filled = [row for row in rows if len(row)]
+        self.low = float(min(row[0] for row in filled)) if filled else 0.0
+        self.span = float(max(row[-1] for row in filled)) - self.low + 1.0 if filled else 1.0
+        self.offsets = np.arange(len(rows), dtype=np.float64) * self.span
+        self.keys = np.concatenate([row.astype(np.float64) - self.low + offset
+                                    for row, offset in zip(rows, self.offsets)]) if rows else np.empty(0)
+
+    def next_trips(self, times):
+        '''
+        Первый рейс не раньше times (одно время или своё на каждую строку) в каждой строке;
+        NO_TRIP — в строке таких нет. Время за пределами строки попадает в соседнюю строку, это и
+        отличает «рейсов уже нет» без отдельных проверок
+        '''
+        # раньше low — то же, что low: иначе время уехало бы в предыдущую строку
+        times = np.maximum(np.asarray(times, dtype=np.float64), self.low)
+        found = self.keys.searchsorted(times - self.low + self.offsets) - self.starts
+        return np.where(found < self.lengths, found, NO_TRIP)
+
+
+def next_trips(schedule, times):
+    '''Первый рейс не раньше times на каждой остановке матрицы schedule (times — одно время или по остановке)'''
+    return StackedRows(schedule).next_trips(times)
+
+
+def ride(schedule, pos, trip):
+    '''Времена рейса trip на остановках после pos (срез столбца)'''
+    return schedule[pos + 1:, trip]
+
+
+def ride_scan(schedule, pos, trip, best):
+    '''
+    Поездка рейсом trip от остановки pos: best — лучшие известные времена на остановках после pos
+    (len = число остановок - pos - 1). Возвращает (позиции остановок, времена прибытия) только там,
+    где рейс приезжает раньше best
+    '''
+    arrivals = ride(schedule, pos, trip)
+    improved = np.flatnonzero(arrivals < best)
+    return improved + pos + 1, arrivals[improved]
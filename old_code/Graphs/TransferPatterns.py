@@ -0,0 +1,345 @@
+import bisect
+import copy
+import heapq
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from old_code.Graphs.Raptor import Raptor, RaptorLabels
+
+# Raptor по сети без пешеходного графа и окно предподсчёта в процессе-воркере, см. init_worker
+WORKER_RAPTOR = None
+
+
+def init_worker(network, max_rounds, start, end):
+    global WORKER_RAPTOR
+    WORKER_RAPTOR = (Raptor(network, max_rounds=max_rounds), start, end)
+
+
+def build_chunk(origins):
+    '''Шаблоны пересадок остановок origins: для каждой — (node_parent, node_stop, node_walk, end_targets, end_nodes)'''
+    raptor, start, end = WORKER_RAPTOR
+    return [get_origin_patterns(raptor, origin, start, end) for origin in origins]
+
+
+def get_origin_patterns(raptor, origin, start, end):
+    '''
+    Шаблоны пересадок от остановки origin: rRAPTOR от неё на все остановки по всем отправлениям в [start, end].
+    Каждая метка (раунд k, остановка), улучшенная при очередном выходе, — оптимальный путь (по прибытию при
+    не больше k поездках); его последовательность остановок пересадки кладётся в дерево префиксов:
+    узел — (родитель, остановка, пришли пешком), корень 0 — сама origin. Возвращает (node_parent, node_stop,
+    node_walk — списки по номеру узла, end_targets, end_nodes — какими узлами кончаются шаблоны до каждой
+    остановки, по возрастанию)
+    '''
+    network = raptor.network
+    num_stops = network.get_num_stops()
+    labels = RaptorLabels(num_stops, raptor.max_rounds)
+    egress = np.full(num_stops, math.inf)
+    access_stops = np.array([origin], dtype=np.int32)
+    access_times = np.zeros(1, dtype=np.float64)
+    node_parent, node_stop, node_walk = [-1], [origin], [0]
+    children = {}  # (родитель, остановка, пешком) -> узел
+    # узел шаблона, которым получена текущая метка arrival и метка поездки ride (раунд, остановка)
+    node_of = np.full((raptor.max_rounds + 1, num_stops), -1, dtype=np.int32)
+    ride_node_of = np.full((raptor.max_rounds + 1, num_stops), -1, dtype=np.int32)
+    node_of[0, origin] = 0
+    ends = set()
+
+    def get_node(parent, stop, walked):
+        node = children.get((parent, stop, walked))
+        if node is None:
+            node = children[(parent, stop, walked)] = len(node_stop)
+            node_parent.append(parent)
+            node_stop.append(stop)
+            node_walk.append(walked)
+        return node
+
+    departures, sources = network.get_departures(access_stops, access_times, start, end)
+    for i, (departure, routes) in enumerate(zip(departures.tolist(), sources)):
+        before, before_ride = labels.arrival.copy(), labels.ride.copy()
+        marked = raptor.start(labels, access_stops, access_times, departure)
+        raptor.run(labels, marked, egress, routes=routes.tolist() if i else None)
+        for k in range(1, raptor.max_rounds + 1):
+            # сначала поездки, потом метки раунда: пешая пересадка продолжает поездку этого же раунда
+            for stop in np.flatnonzero(labels.ride[k] < before_ride[k]).tolist():
+                previous = int(labels.parent_stop[k, stop])
+                ride_node_of[k, stop] = get_node(int(node_of[k - 1, previous]), stop, 0)
+            for stop in np.flatnonzero(labels.arrival[k] < before[k]).tolist():
+                previous = int(labels.walk_from[k, stop])
+                node = ride_node_of[k, stop] if previous < 0 else get_node(int(ride_node_of[k, previous]), stop, 1)
+                node_of[k, stop] = node
+                ends.add((stop, int(node)))
+    ends = sorted(ends)
+    return node_parent, node_stop, node_walk, [stop for stop, _ in ends], [node for _, node in ends]
+
+
+def get_direct_table(network):
+    '''
+    Таблица прямых поездок: для каждой пары остановок (a, b), где b на маршруте после a, —
+    (ключ a * S + b, маршрут, позиция a, позиция b), по возрастанию ключа
+    '''
+    num_stops = network.get_num_stops()
+    keys, routes, from_positions, to_positions = [], [], [], []
+    for r, stops in enumerate(network.route_stops):
+        i, j = np.triu_indices(len(stops), 1)
+        keys.append(stops[i].astype(np.int64) * num_stops + stops[j])
+        routes.append(np.full(len(i), r, dtype=np.int32))
+        from_positions.append(i.astype(np.int32))
+        to_positions.append(j.astype(np.int32))
+    if not keys:
+        return np.empty(0, dtype=np.int64), *(np.empty(0, dtype=np.int32) for _ in range(3))
+    keys = np.concatenate(keys)
+    order = np.argsort(keys, kind='stable')
+    return (keys[order], np.concatenate(routes)[order], np.concatenate(from_positions)[order],
+            np.concatenate(to_positions)[order])
+
+
+class TransferPatterns:
+    '''
+    Шаблоны пересадок (transfer patterns) по TransitNetwork: для каждой остановки-начала заранее известны все
+    последовательности остановок пересадки, которыми идут оптимальные пути из неё в окне [start, end].
+    Запрос не ищет по расписанию: из шаблонов всех пар (остановка подхода, остановка отхода) собирается
+    маленький граф запроса, и по нему идёт Дейкстра, где ребро (a, b) — ближайшая прямая поездка из a в b
+    по таблице прямых поездок (один searchsorted на маршрут) или пешая пересадка — смотря по шаблону.
+    Хранение плоское, по всем началам сразу:
+      node_indptr[o]..node_indptr[o + 1] — дерево префиксов начала o в node_parent (номер узла внутри
+                                           дерева, -1 — корень), node_stop и node_walk (1 — пешая пересадка),
+      end_indptr[o]..end_indptr[o + 1]   — (end_targets, end_nodes): какими узлами дерева кончаются шаблоны
+                                           до каждой остановки, по возрастанию остановки,
+      direct_keys/direct_routes/direct_from/direct_to — таблица прямых поездок (get_direct_table).
+    Пути, выходящие к остановке подхода позже end, шаблоны не покрывают, поэтому предподсчёт захватывает
+    ещё max_walk после конца окна
+    '''
+    ARRAYS = ('node_indptr', 'node_parent', 'node_stop', 'node_walk', 'end_indptr', 'end_targets', 'end_nodes',
+              'direct_keys', 'direct_routes', 'direct_from', 'direct_to', 'stop_nodes')
+
+    def __init__(self, network, node_indptr, node_parent, node_stop, node_walk, end_indptr, end_targets, end_nodes,
+                 direct_keys, direct_routes, direct_from, direct_to, stop_nodes, meta=None):
+        if not np.array_equal(np.asarray(stop_nodes), network.stop_nodes):
+            raise ValueError('шаблоны пересадок посчитаны для другого набора остановок')
+        self.network = network
+        self.node_indptr = node_indptr
+        self.node_parent = node_parent
+        self.node_stop = node_stop
+        self.node_walk = node_walk
+        self.end_indptr = end_indptr
+        self.end_targets = end_targets
+        self.end_nodes = end_nodes
+        self.direct_keys = direct_keys
+        self.direct_routes = direct_routes
+        self.direct_from = direct_from
+        self.direct_to = direct_to
+        self.stop_nodes = stop_nodes
+        self.meta = meta or {}
+        self.rows = {}  # маршрут -> расписание списками, для поездок по ребру из питона
+
+    @classmethod
+    def build(cls, network, start, end, max_rounds=5, workers=None, chunk_size=32, meta=None):
+        '''
+        Шаблоны от всех остановок сети; остановки делятся на куски по chunk_size, каждый кусок — независимые
+        профильные поиски в процессе-воркере. workers=1 — без процессов
+        '''
+        # пешеходный граф воркерам не нужен: поиски идут от остановки, подходы не считаются
+        worker_network = copy.copy(network)
+        worker_network.graph = None
+        origins = list(range(network.get_num_stops()))
+        chunks = [origins[i:i + chunk_size] for i in range(0, len(origins), chunk_size)]
+        initargs = (worker_network, max_rounds, start, end + network.max_walk)
+        if workers == 1:
+            init_worker(*initargs)
+            results = [build_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+                results = list(pool.map(build_chunk, chunks))
+        patterns = [item for chunk in results for item in chunk]
+        node_counts = np.array([len(item[1]) for item in patterns], dtype=np.int64)
+        end_counts = np.array([len(item[3]) for item in patterns], dtype=np.int64)
+        node_indptr = np.zeros(len(patterns) + 1, dtype=np.int64)
+        np.cumsum(node_counts, out=node_indptr[1:])
+        end_indptr = np.zeros(len(patterns) + 1, dtype=np.int64)
+        np.cumsum(end_counts, out=end_indptr[1:])
+        columns = [np.array([value for item in patterns for value in item[c]], dtype=np.int32) for c in range(5)]
+        meta = dict(meta or {}, start=start, end=end, max_rounds=max_rounds, route_ids=list(network.route_ids))
+        return cls(network, node_indptr, columns[0], columns[1], columns[2].astype(np.int8), end_indptr,
+                   columns[3], columns[4],
+                   *get_direct_table(network), np.array(network.stop_nodes, dtype=np.int64), meta=meta)
+
+    def get_patterns(self, origin, target):
+        '''Шаблоны от остановки origin до остановки target: списки остановок [origin, ..., target]'''
+        result = []
+        for node in self.get_end_nodes(origin, target):
+            result.append(self.get_sequence(origin, node))
+        return result
+
+    def get_end_nodes(self, origin, target):
+        lo, hi = self.end_indptr[origin], self.end_indptr[origin + 1]
+        targets = self.end_targets[lo:hi]
+        first, last = targets.searchsorted(target), targets.searchsorted(target, side='right')
+        return self.end_nodes[lo + first:lo + last].tolist()
+
+    def get_sequence(self, origin, node):
+        first, last = self.node_indptr[origin], self.node_indptr[origin + 1]
+        parents, stops = self.node_parent[first:last].tolist(), self.node_stop[first:last].tolist()
+        sequence = []
+        while node >= 0:
+            sequence.append(stops[node])
+            node = parents[node]
+        sequence.reverse()
+        return sequence
+
+    def get_query_graph(self, origins, targets):
+        '''Рёбра всех шаблонов от остановок origins до остановок targets: {a: [(b, пешком), ...]}'''
+        targets = np.asarray(targets, dtype=np.int32)
+        edges = {}
+        for origin in origins:
+            first, last = self.node_indptr[origin], self.node_indptr[origin + 1]
+            parents = self.node_parent[first:last].tolist()
+            stops = self.node_stop[first:last].tolist()
+            walks = self.node_walk[first:last].tolist()
+            lo, hi = self.end_indptr[origin], self.end_indptr[origin + 1]
+            # концы шаблонов до всех целей сразу, без поиска по каждой паре
+            ends = self.end_nodes[lo:hi][np.isin(self.end_targets[lo:hi], targets)].tolist()
+            seen = set()  # дерево: если узел уже пройден, пройдены и все его предки
+            for node in ends:
+                while node > 0 and node not in seen:
+                    seen.add(node)
+                    parent = parents[node]
+                    edges.setdefault(stops[parent], set()).add((stops[node], walks[node]))
+                    node = parent
+        return {a: sorted(bs) for a, bs in edges.items()}
+
+    def get_rows(self, r):
+        rows = self.rows.get(r)
+        if rows is None:
+            rows = self.rows[r] = self.network.route_times[r].tolist()
+        return rows
+
+    def ride(self, a, b, time):
+        '''Ближайшая прямая поездка из a в b не раньше time: (прибытие, маршрут, рейс, отправление); нет — None'''
+        key = a * self.network.get_num_stops() + b
+        lo, hi = self.direct_keys.searchsorted(key), self.direct_keys.searchsorted(key, side='right')
+        best = None
+        for k in range(lo, hi):
+            r = int(self.direct_routes[k])
+            rows = self.get_rows(r)
+            row = rows[int(self.direct_from[k])]
+            trip = bisect.bisect_left(row, time)
+            if trip < len(row):
+                arrival = rows[int(self.direct_to[k])][trip]
+                if best is None or arrival < best[0]:
+                    best = (arrival, r, trip, row[trip])
+        return best
+
+    def earliest_arrival(self, source, target, departure):
+        '''
+        Самое раннее прибытие из узла source в узел target при выходе в departure по шаблонам:
+        (время, поездок, маршрут) как у Raptor.earliest_arrival; пути нет — (inf, None, None).
+        Выход вне окна [start, end] предподсчёта — ValueError: шаблоны там ничего не гарантируют
+        '''
+        window = self.meta.get('start', -math.inf), self.meta.get('end', math.inf)
+        if not window[0] <= departure <= window[1]:
+            raise ValueError(f'выход {departure} вне окна шаблонов [{window[0]}, {window[1]}]')
+        network = self.network
+        nodes = network.stop_nodes
+        access_stops, access_times, reached = network.get_access(source)
+        egress_stops, egress_times, _ = network.get_access(target)
+        egress = dict(zip(egress_stops.tolist(), egress_times.tolist()))
+        edges = self.get_query_graph(access_stops.tolist(), egress_stops.tolist())
+
+        bound = departure + reached.get(target, math.inf)
+        target_state = None
+        # метки — по (остановка, как пришли): 0 — поездкой, 1 — пешей пересадкой, 2 — пешком от старта.
+        # Как в RAPTOR, пешая пересадка — только после поездки, отход к цели — не сразу после подхода:
+        # две прогулки подряд дали бы путь пешком длиннее max_walk
+        dist = {}
+        prev = {}  # (остановка, как пришли) -> (откуда, участок); None — пришли пешком от старта
+        heap = []
+        for stop, walk_time in zip(access_stops.tolist(), access_times.tolist()):
+            dist[stop, 2] = departure + walk_time
+            prev[stop, 2] = (None, ('walk', source, nodes[stop], departure, departure + walk_time))
+            heapq.heappush(heap, (departure + walk_time, stop, 2))
+        settled = set()
+        while heap:
+            time, a, reach = heapq.heappop(heap)
+            if time >= bound:
+                break
+            if (a, reach) in settled:
+                continue
+            settled.add((a, reach))
+            # пешком без транспорта уже учтено в bound
+            if reach < 2 and a in egress and time + egress[a] < bound:
+                bound = time + egress[a]
+                target_state = (a, reach)
+            for b, walked in edges.get(a, ()):
+                if walked:
+                    if reach:
+                        continue
+                    others, walk_times = network.get_transfers(a)
+                    hit = np.flatnonzero(others == b)
+                    if not len(hit):
+                        continue
+                    arrival = time + float(walk_times[hit[0]])
+                    leg = ('walk', nodes[a], nodes[b], time, arrival)
+                else:
+                    found = self.ride(a, b, time)
+                    if found is None:
+                        continue
+                    arrival, r, trip, ride_departure = found
+                    leg = ('ride', network.route_ids[r], trip, nodes[a], nodes[b], float(ride_departure),
+                           float(arrival))
+                state = (b, 1 if walked else 0)
+                if arrival < dist.get(state, math.inf):
+                    dist[state] = arrival
+                    prev[state] = ((a, reach), leg)
+                    heapq.heappush(heap, (arrival, *state))
+
+        if bound == math.inf:
+            return math.inf, None, None
+        if target_state is None:
+            return bound, 0, [('walk', source, target, departure, bound)]
+        legs = [('walk', nodes[target_state[0]], target, dist[target_state], bound)]
+        state = target_state
+        while state is not None:
+            state, leg = prev[state]
+            legs.append(leg)
+        legs.reverse()
+        return bound, sum(1 for leg in legs if leg[0] == 'ride'), legs
+
+    def get_memory_report(self):
+        nodes = np.diff(self.node_indptr)
+        total_bytes = sum(getattr(self, name).nbytes for name in self.ARRAYS)
+        return {
+            'origins': len(nodes),
+            'nodes': int(nodes.sum()),
+            'patterns': len(self.end_nodes),
+            'avg_nodes': float(nodes.mean()) if len(nodes) else 0.0,
+            'max_nodes': int(nodes.max()) if len(nodes) else 0,
+            'direct_pairs': len(self.direct_keys),
+            'memory_mb': total_bytes / 2 ** 20,
+        }
+
+    # -----------------------
+    # хранение: каталог на город, как у HubLabels; расписания берутся из сети, с которой загружают
+    # -----------------------
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'patterns.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.meta, **self.get_memory_report()), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory, network, mmap_mode='r'):
+        with open(os.path.join(directory, 'patterns.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('route_ids') != list(network.route_ids):
+            raise ValueError('шаблоны пересадок посчитаны для другого набора маршрутов')
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(network, **arrays, meta=meta)
@@ -0,0 +1,132 @@
+import heapq
+import math
+
+import numpy as np
+
+from old_code.Graphs.FootpathTransfers import FootpathTransfers
+from old_code.Graphs.Timetable import StackedRows
+
+
+def walk(graph, source, max_walk):
+    '''
+    Ограниченная Дейкстра по пешеходным рёбрам графа кластеризатора (graph.nodes[u].edges):
+    {node_id: время пешком} для всех узлов не дальше max_walk
+    '''
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = {}
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = d
+        for edge in graph.nodes[u].edges:
+            nd = d + edge.weight
+            if nd <= max_walk and nd < dist.get(edge.to, math.inf):
+                dist[edge.to] = nd
+                heapq.heappush(heap, (nd, edge.to))
+    return settled
+
+
+class TransitNetwork:
+    '''
+    Транспортная модель кластеризатора (experements/my_clastarizator.py: Graph с Route) в плоском виде
+    для поисков по раундам (Raptor) и по связям. Остановки пронумерованы 0..S-1:
+      stop_nodes[i]              — node_id остановки, stop_index — обратно,
+      route_ids[r], route_stops[r] — остановки маршрута r по порядку (int32),
+      route_times[r]             — его расписание, матрица остановки x рейсы (Route.arrivals),
+      route_rows[r]              — она же в StackedRows: ближайший рейс на всех остановках — один searchsorted,
+      stop_routes_indptr/stop_routes/stop_positions — какие маршруты проходят через остановку и на какой позиции,
+      transfer_indptr/transfer_indices/transfer_times — пешие пересадки между остановками (CSR) до max_walk:
+                                   transfers — готовая FootpathTransfers или (indptr, indices, times) в этой
+                                   нумерации, иначе считаются здесь же в одном процессе.
+    Подходы от точки старта к остановкам и от остановок к цели считаются на запрос (get_access) по полному
+    пешеходному графу кластеризатора
+    '''
+
+    def __init__(self, graph, max_walk=600.0, transfers=None):
+        self.graph = graph
+        self.max_walk = max_walk
+        stops = self.get_stop_nodes(graph)
+        self.stop_nodes = stops
+        self.stop_index = {node: i for i, node in enumerate(stops)}
+
+        self.route_ids, self.route_stops, self.route_times, self.route_rows = [], [], [], []
+        serving = [[] for _ in stops]
+        for route_id, route in graph.routes.items():
+            r = len(self.route_ids)
+            self.route_ids.append(route_id)
+            self.route_stops.append(np.array([self.stop_index[stop] for stop in route.stops], dtype=np.int32))
+            self.route_times.append(route.arrivals)
+            self.route_rows.append(StackedRows(route.arrivals))
+            for pos, stop in enumerate(route.stops):
+                serving[self.stop_index[stop]].append((r, pos))
+        counts = np.array([len(items) for items in serving], dtype=np.int64)
+        self.stop_routes_indptr = np.zeros(len(stops) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.stop_routes_indptr[1:])
+        self.stop_routes = np.array([r for items in serving for r, _ in items], dtype=np.int32)
+        self.stop_positions = np.array([pos for items in serving for _, pos in items], dtype=np.int32)
+
+        if transfers is None:
+            transfers = self.build_transfers()
+        elif isinstance(transfers, FootpathTransfers):
+            transfers = transfers.get_arrays(self.stop_nodes)
+        self.transfer_indptr, self.transfer_indices, self.transfer_times = transfers
+
+    @staticmethod
+    def get_stop_nodes(graph):
+        '''node_id остановок графа по возрастанию — в этой нумерации и остановки сети, и таблица пересадок'''
+        return sorted({stop for route in graph.routes.values() for stop in route.stops})
+
+    def build_transfers(self):
+        '''Пешие пересадки от каждой остановки до остановок не дальше max_walk: (indptr, indices, times)'''
+        return FootpathTransfers.build(self.graph, self.stop_nodes, self.max_walk, workers=1).get_arrays()
+
+    def get_num_stops(self):
+        return len(self.stop_nodes)
+
+    def get_num_routes(self):
+        return len(self.route_ids)
+
+    def get_stop_routes(self, stop):
+        '''(номера маршрутов, позиции остановки в них)'''
+        lo, hi = self.stop_routes_indptr[stop], self.stop_routes_indptr[stop + 1]
+        return self.stop_routes[lo:hi], self.stop_positions[lo:hi]
+
+    def get_transfers(self, stop):
+        '''(остановки, время пешком) от остановки stop'''
+        lo, hi = self.transfer_indptr[stop], self.transfer_indptr[stop + 1]
+        return self.transfer_indices[lo:hi], self.transfer_times[lo:hi]
+
+    def get_access(self, node, max_walk=None):
+        '''
+        Подход пешком от узла node: (остановки int32, время float64, время до всех узлов {node_id: время}).
+        Граф неориентированный, так что это же — отход от остановок к node
+        '''
+        reached = walk(self.graph, node, self.max_walk if max_walk is None else max_walk)
+        stops = [(self.stop_index[other], time) for other, time in reached.items() if other in self.stop_index]
+        return (np.array([stop for stop, _ in stops], dtype=np.int32),
+                np.array([time for _, time in stops], dtype=np.float64), reached)
+
+    def get_departures(self, stops, walk_times, start, end):
+        '''
+        Все моменты выхода из точки старта в [start, end], с которыми можно успеть ровно к отправлению
+        какого-то рейса с остановки подхода (время отправления минус время подхода), по убыванию.
+        Возвращает (моменты выхода, для каждого — маршруты, на новый рейс которых он успевает)
+        '''
+        departures, sources = [], []
+        for stop, walk_time in zip(stops.tolist(), walk_times.tolist()):
+            routes, positions = self.get_stop_routes(stop)
+            for r, pos in zip(routes.tolist(), positions.tolist()):
+                row = self.route_times[r][pos]
+                lo, hi = row.searchsorted(start + walk_time), row.searchsorted(end + walk_time, side='right')
+                departures.append(row[lo:hi] - walk_time)
+                sources.append(np.full(hi - lo, r, dtype=np.int32))
+        if not departures:
+            return np.empty(0, dtype=np.float64), []
+        departures = np.concatenate(departures).astype(np.float64)
+        sources = np.concatenate(sources)
+        order = np.argsort(-departures, kind='stable')
+        departures, sources = departures[order], sources[order]
+        bounds = np.flatnonzero(np.r_[True, departures[1:] != departures[:-1], True])
+        return departures[bounds[:-1]], [np.unique(sources[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,135 @@
+import copy
+
+import numpy as np
+
+from old_code.Graphs.EdgeStore import HIGHWAY_CLASSES, HIGHWAY_CODES, SURFACE_CLASSES, SURFACE_CODES
+
+
+def get_class_table(values, default):
+    '''Таблица «класс дороги -> значение» длиной len(HIGHWAY_CLASSES), индексируется столбцом highway'''
+    table = np.full(len(HIGHWAY_CLASSES), default, dtype=np.float32)
+    for name, value in values.items():
+        table[HIGHWAY_CODES[name]] = value
+    return table
+
+
+def get_surface_table(values, default):
+    '''То же для покрытия: индексируется столбцом surface'''
+    table = np.full(len(SURFACE_CLASSES), default, dtype=np.float32)
+    for name, value in values.items():
+        table[SURFACE_CODES[name]] = value
+    return table
+
+
+def get_hour_table(values):
+    '''
+    Множители скорости по часам: {класс дороги: [24 множителя]}, '*' — для всех классов без своей строки.
+    Возвращает массив 24 x len(HIGHWAY_CLASSES), без values — все единицы. Множители строго больше нуля:
+    вес — длина / скорость, а закрыть дорогу на ночь — дело перекрытий (EdgeOverlay), не профиля
+    '''
+    table = np.ones((24, len(HIGHWAY_CLASSES)), dtype=np.float32)
+    values = values or {}
+    if '*' in values:
+        table[:] = np.asarray(values['*'], dtype=np.float32)[:, None]
+    for name, factors in values.items():
+        if name != '*':
+            table[:, HIGHWAY_CODES[name]] = factors
+    if not np.all(table > 0):
+        raise ValueError('множители скорости по часам должны быть больше нуля')
+    return table
+
+
+class WeightProfile:
+    '''Профиль считает массив весов всех рёбер по столбцам EdgeStore; номер ребра — индекс в массиве'''
+    name = 'base'
+
+    def compute(self, edges):
+        raise NotImplementedError
+
+
+class DistanceProfile(WeightProfile):
+    '''Вес — длина в метрах (как было до профилей)'''
+    name = 'distance'
+
+    def compute(self, edges):
+        return edges.get_columns()['length'].astype(np.float64)
+
+
+class WalkTimeProfile(WeightProfile):
+    '''Вес — время пешком в секундах; по лестницам медленнее'''
+    name = 'walk'
+
+    def __init__(self, speed=5.0, class_factors=None):
+        self.speed = speed  # км/ч
+        self.class_factors = get_class_table(class_factors or {'steps': 0.5}, 1.0)
+
+    def compute(self, edges):
+        columns = edges.get_columns()
+        speed = self.speed / 3.6 * self.class_factors[columns['highway']]
+        return columns['length'] / speed.astype(np.float64)
+
+
+class ScooterTimeProfile(WeightProfile):
+    '''
+    Вес — время на самокате в секундах: едем со скоростью класса дороги, но не быстрее
+    maxspeed улицы и speed_cap самого самоката; плохое покрытие замедляет (surface_factors).
+    Зависимость от времени суток — маленькая таблица множителей hour_factors[час][класс дороги]
+    (24 x len(HIGHWAY_CLASSES), пара килобайт на профиль), а не поле у каждого ребра: веса на конкретный
+    час — at_hour(), время в пути с учётом смены часа по дороге — get_eta()
+    '''
+    name = 'scooter'
+
+    def __init__(self, speed_cap=25.0, class_speeds=None, surface_factors=None, hour_factors=None, hour=None):
+        self.speed_cap = speed_cap  # км/ч
+        self.class_speeds = get_class_table(class_speeds or {
+            'pedestrian': 12, 'footway': 12, 'path': 12, 'living_street': 15, 'steps': 3, 'corridor': 5,
+        }, speed_cap)
+        self.surface_factors = get_surface_table(surface_factors or {
+            'paving_stones': 0.85, 'sett': 0.6, 'cobblestone': 0.5, 'unhewn_cobblestone': 0.4, 'compacted': 0.8,
+            'fine_gravel': 0.7, 'gravel': 0.5, 'pebblestone': 0.5, 'unpaved': 0.6, 'ground': 0.5, 'dirt': 0.5,
+            'grass': 0.3, 'sand': 0.2, 'mud': 0.2, 'wood': 0.8,
+        }, 1.0)
+        self.hour_factors = get_hour_table(hour_factors)
+        self.hour = hour  # None — без поправки на время суток
+
+    def at_hour(self, hour):
+        '''Тот же профиль для часа hour (0..23): Graph.set_weight_profile(profile.at_hour(8))'''
+        profile = copy.copy(self)
+        profile.hour = hour % 24
+        return profile
+
+    def get_speeds(self, columns, hour=None):
+        '''Скорость по рёбрам в км/ч (float32) по столбцам EdgeStore'''
+        speed = np.minimum(self.class_speeds[columns['highway']], self.speed_cap)
+        max_speed = columns['max_speed'].astype(np.float32)
+        speed = np.where(max_speed > 0, np.minimum(speed, max_speed), speed)
+        speed = speed * self.surface_factors[columns['surface']]
+        if hour is not None:
+            speed = speed * self.hour_factors[hour % 24][columns['highway']]
+        return speed
+
+    def compute(self, edges):
+        columns = edges.get_columns()
+        return columns['length'] / (self.get_speeds(columns, self.hour).astype(np.float64) / 3.6)
+
+    def get_eta(self, edges, edge_ids, departure):
+        '''
+        Время в пути в секундах по рёбрам edge_ids (в порядке маршрута) при выезде в departure —
+        секундах от полуночи. Множитель часа берётся на момент въезда на ребро
+        '''
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        columns = {name: column[edge_ids] for name, column in edges.get_columns().items()}
+        base = self.get_speeds(columns).astype(np.float64) / 3.6
+        factors = self.hour_factors[:, columns['highway']].astype(np.float64)  # час x ребро
+        lengths = columns['length'].astype(np.float64)
+        now = float(departure)
+        for i in range(len(edge_ids)):
+            now += lengths[i] / (base[i] * factors[int(now // 3600) % 24, i])
+        return now - departure
+
+
+PROFILES = {
+    DistanceProfile.name: DistanceProfile,
+    WalkTimeProfile.name: WalkTimeProfile,
+    ScooterTimeProfile.name: ScooterTimeProfile,
+}
@@ -1,6 +1,8 @@
 import networkx as nx
 from geopy.distance import geodesic
 
+from old_code.Graphs import InstrumentedSearch
+
 class aStarPath:
 
     def __init__(self, graph):
@@ -10,9 +12,15 @@ class aStarPath:
     def f_heuristic(a, b):
         return (abs(a[0]-b[0]) + abs(a[1]-b[1]))
 
+    # узлы графа — номера, эвристика считается по их координатам
+    def heuristic(self, a, b):
+        return aStarPath.f_heuristic(self.graph.get_node_coords(a), self.graph.get_node_coords(b))
 
-    def a_star_path(self, start, end):
-        shortest_route = nx.astar_path(G=self.graph.get_graph(), source=start, target=end, heuristic=aStarPath.f_heuristic, weight='weight')
+    def a_star_path(self, start, end, stats=None):
+        if stats is not None:
+            return InstrumentedSearch.astar_path(self.graph.get_graph(), start, end,
+                                                 self.heuristic, 'weight', stats)
+        shortest_route = nx.astar_path(G=self.graph.get_graph(), source=start, target=end, heuristic=self.heuristic, weight='weight')
         return shortest_route
 
 
@@ -1,9 +1,11 @@
 from old_code.Drawer import Drawer
+from old_code.Graphs.Geodesic import haversine
 from old_code.Modes.ScooterMode import ScooterMode
 from old_code.Modes.WalkMode import WalkMode
 
 from old_code.Modes.PublicTransportMode import PublicTransportMode
 import time
+from contextlib import nullcontext
 
 from old_code.Modes.DefaultMode import DefaultMode
 
@@ -19,17 +21,21 @@ class OSMHandler:
         self.graph = self.tag_finder.get_graph()
         print(self.graph.get_graph())
 
-    def handle(self):
-        self.start_coords, self.end_coords = self.get_node_by_coords(self.start_coords), self.get_node_by_coords(self.end_coords)
+    def handle(self, stats=None):
+        # stats - необязательный SearchStats, в него пишется работа запроса
+        with nullcontext() if stats is None else stats.timer('snap_time'):
+            self.start_coords, self.end_coords = self.get_node_by_coords(self.start_coords), self.get_node_by_coords(self.end_coords)
         print(self.graph.get_node_coords(self.start_coords), self.graph.get_node_coords(self.end_coords))
         #st, end = 5938255315, 763375415
         start_time = time.time()
-        path = self.tag_finder.get_shortest_route(self.start_coords, self.end_coords)
+        path = self.tag_finder.get_shortest_route(self.start_coords, self.end_coords, stats=stats)
         end_time = time.time()
         elapsed_time = end_time - start_time
         print(f"The task took {elapsed_time:.2f} seconds to complete.")
+        if stats is not None:
+            print(stats)
         drawer = Drawer()
-        drawer.draw_route(path)
+        drawer.draw_route(self.graph.get_list_of_nodes_coords(path))
 
 
 
@@ -57,7 +63,7 @@ class OSMHandler:
             coords = self.graph.get_node_coords(sorted_nodes[mid])
 
             # Вычисляем расстояние между текущими координатами и искомыми
-            distance = self.graph.haversine(coords, value)
+            distance = haversine(coords, value)
 
             # Если нашли более близкий узел, обновляем best_node
             if distance < best_distance:
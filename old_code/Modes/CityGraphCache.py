@@ -0,0 +1,208 @@
+import os
+import pickle
+import time
+
+import numpy as np
+import osmium
+
+from old_code.Graphs.SpatialIndex import SpatialIndex
+from old_code.Modes.DefaultMode import WayNode
+from old_code.Modes.ModeRegistry import CITY_GRAPHS_DIR, get_city_file, get_mode
+
+CACHE_DIR = os.path.join(CITY_GRAPHS_DIR, 'cache')
+
+
+class CityGraphCache:
+    '''
+    Граф города в одном режиме вместе с индексом привязки, сохранённый на диск, чтобы не строить его из
+    .pbf при каждом запуске. apply_changes() обновляет его файлом изменений OSM (.osc): добавляются,
+    удаляются и меняются только затронутые пути и узлы, остальной граф и индекс не трогаются.
+    '''
+
+    def __init__(self, city, mode, file, graph, index):
+        self.city = city
+        self.mode_name = mode
+        self.file = file
+        self.graph = graph
+        self.index = index
+        self.applied = []  # применённые файлы изменений: (имя, время применения)
+
+    @staticmethod
+    def get_path(city, mode):
+        return os.path.join(CACHE_DIR, f"{city.replace(' ', '_')}_{mode}.pickle")
+
+    @classmethod
+    def build(cls, city, mode, file=None, location_index=None, keep_components=None):
+        file = file or get_city_file(city)
+        graph = get_mode(mode, file).get_graph(location_index, keep_components)
+        return cls(city, mode, file, graph, SpatialIndex(graph))
+
+    @classmethod
+    def load(cls, city, mode):
+        with open(cls.get_path(city, mode), 'rb') as f:
+            return pickle.load(f)
+
+    @classmethod
+    def load_or_build(cls, city, mode, file=None, location_index=None, keep_components=None):
+        if os.path.exists(cls.get_path(city, mode)):
+            return cls.load(city, mode)
+        return cls.build(city, mode, file, location_index, keep_components)
+
+    def save(self):
+        path = self.get_path(self.city, self.mode_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)  # прерванная запись не портит прежний кэш
+
+    # -----------------------
+    # обновление из .osc
+    # -----------------------
+
+    def read_changes(self, change_file):
+        '''
+        Узлы: id -> (lat, lon) или None (удалён). Пути: id -> (refs, теги) или None — удалён
+        или больше не подходит режиму (для графа это одно и то же). Если объект в файле несколько раз,
+        остаётся последняя версия
+        '''
+        mode = get_mode(self.mode_name, self.file)
+        target_dict = mode.get_target_dict()
+        nodes, ways = {}, {}
+        for obj in osmium.FileProcessor(change_file, osmium.osm.NODE | osmium.osm.WAY):
+            if obj.is_node():
+                nodes[obj.id] = None if obj.deleted else (obj.location.lat, obj.location.lon)
+            elif obj.deleted or not mode.is_suitable(obj, target_dict):
+                ways[obj.id] = None
+            else:
+                ways[obj.id] = ([node.ref for node in obj.nodes], dict(obj.tags))
+        return nodes, ways
+
+    def get_base_locations(self, node_ids, location_index='sparse_mmap_array'):
+        '''
+        Координаты узлов, которых нет ни в графе, ни в .osc, — одним проходом по исходной выгрузке: узлы
+        складываются в индекс osmium без выхода в питон. osmium.filter.IdFilter тут не годится — его набор
+        id выделяет память кусками на весь диапазон id OSM (сотни МБ даже на сотню разбросанных id)
+        '''
+        locations = {}
+        if not node_ids:
+            return locations
+        processor = (osmium.FileProcessor(self.file, osmium.osm.NODE)
+                     .with_locations(location_index)
+                     .with_filter(osmium.filter.EntityFilter(osmium.osm.WAY)))
+        for _ in processor:
+            pass
+        storage = processor.node_location_storage
+        for node_id in node_ids:
+            try:
+                location = storage.get(node_id)
+            except KeyError:
+                continue
+            locations[node_id] = (location.lat, location.lon)
+        return locations
+
+    def is_inside(self, refs, locations, bounds):
+        '''
+        Новый путь относится к городу, если касается графа или хотя бы один его узел в рамке графа;
+        locations — известные координаты узлов не из графа (из .osc или исходной выгрузки)
+        '''
+        min_lat, max_lat, min_lon, max_lon = bounds
+        for ref in refs:
+            if self.graph.get_node_by_osm_id(ref) in self.graph.get_graph():
+                return True
+            location = locations.get(ref)
+            if location is not None and min_lat <= location[0] <= max_lat and min_lon <= location[1] <= max_lon:
+                return True
+        return False
+
+    def apply_changes(self, change_file):
+        '''Применяет файл изменений OSM к графу и индексу привязки; возвращает отчёт, что изменилось'''
+        start_time = time.perf_counter()
+        graph, nx_graph = self.graph, self.graph.get_graph()
+        node_changes, way_changes = self.read_changes(change_file)
+        report = {'file': os.path.basename(change_file), 'ways_added': 0, 'ways_modified': 0, 'ways_removed': 0,
+                  'nodes_added': 0, 'nodes_removed': 0, 'nodes_moved': 0, 'missing_locations': 0}
+        lats, lons = np.frombuffer(graph.lats, dtype=np.float64), np.frombuffer(graph.lons, dtype=np.float64)
+        bounds = (lats.min(), lats.max(), lons.min(), lons.max()) if len(lats) else (0.0, -1.0, 0.0, -1.0)
+        del lats, lons  # отпускаем буферы array, иначе в них нельзя будет добавлять узлы
+
+        # 1) сдвинутые узлы графа: меняем координаты и длины рёбер на месте, в индексе перекладываем
+        moves = {}
+        for osm_id, location in node_changes.items():
+            node = graph.get_node_by_osm_id(osm_id)
+            if node is None or location is None or location == graph.get_node_coords(node):
+                continue
+            if node in nx_graph:
+                moves[node] = location
+            else:
+                # узел когда-то был в графе; рёбер у него нет, но номер остался — обновим координаты для возврата
+                graph.lats[node], graph.lons[node] = location
+        for node in moves:
+            self.index.remove_node(node)
+        graph.move_nodes(moves)
+        for node in moves:
+            self.index.add_node(node)
+        report['nodes_moved'] = len(moves)
+
+        # 2) удалённые и изменённые пути убираем, новые и изменённые — добавляем заново
+        to_remove, to_add, new_ways = [], {}, {}
+        for way_id, change in way_changes.items():
+            if way_id in graph.ways:
+                to_remove.append(way_id)
+                report['ways_modified' if change is not None else 'ways_removed'] += 1
+                if change is not None:
+                    to_add[way_id] = change
+            elif change is not None:
+                new_ways[way_id] = change
+        # путь, который был в выгрузке, но только теперь подошёл режиму (например, перетегирован в footway),
+        # приходит в .osc без своих узлов: их координаты — из исходной выгрузки, тем же проходом, что
+        # и для узлов добавляемых путей. Иначе проверка рамки их не видит и путь теряется
+        unknown = {ref for refs, _ in list(to_add.values()) + list(new_ways.values()) for ref in refs
+                   if node_changes.get(ref) is None and graph.get_node_by_osm_id(ref) is None}
+        base_locations = self.get_base_locations(unknown)
+        known = dict(base_locations)
+        known.update((ref, location) for ref, location in node_changes.items() if location is not None)
+        for way_id, change in new_ways.items():
+            if self.is_inside(change[0], known, bounds):
+                report['ways_added'] += 1
+                to_add[way_id] = change
+        # узлы, которые могут появиться в графе или пропасть из него, и были ли они в нём до изменений
+        candidates = {node for way_id in to_remove for node in graph.ways[way_id][0]}
+        candidates.update(graph.get_node_by_osm_id(ref) for refs, _ in to_add.values() for ref in refs)
+        candidates.discard(None)
+        present = {node for node in candidates if node in nx_graph}
+        for way_id in to_remove:
+            graph.remove_way(way_id)
+
+        # 3) координаты узлов новых путей: из .osc, из графа, остальные — из исходной выгрузки (уже прочитаны)
+        locations = {}
+        for refs, _ in to_add.values():
+            for ref in refs:
+                if node_changes.get(ref) is not None:
+                    locations[ref] = node_changes[ref]
+                elif graph.get_node_by_osm_id(ref) is not None:
+                    locations[ref] = graph.get_node_coords(graph.get_node_by_osm_id(ref))
+                elif ref in base_locations:
+                    locations[ref] = base_locations[ref]
+        for way_id, (refs, tags) in to_add.items():
+            nodes = [WayNode(ref, *locations[ref]) for ref in refs if ref in locations]
+            report['missing_locations'] += len(refs) - len(nodes)
+            if nodes:
+                graph.add_way(nodes, tags, way_id)
+                candidates.update(graph.get_node_by_osm_id(node.ref) for node in nodes)
+        if to_remove:
+            # удалённые пути могли разрезать компоненту, а union-find умеет только объединять
+            graph.relabel_components()
+        if graph.weights is not None:
+            graph.set_weight_profile(graph.weight_profile)
+
+        # 4) индекс привязки: убираем пропавшие узлы, добавляем появившиеся
+        for node in candidates:
+            if node in present and node not in nx_graph:
+                self.index.remove_node(node)
+                report['nodes_removed'] += 1
+            elif node not in present and node in nx_graph:
+                self.index.add_node(node)
+                report['nodes_added'] += 1
+        report['time_s'] = time.perf_counter() - start_time
+        self.applied.append((report['file'], time.time()))
+        return report
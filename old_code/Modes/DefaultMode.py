@@ -1,7 +1,17 @@
+import os
+import tempfile
+from collections import namedtuple
+
 import osmium
 from old_code.DrawerInfo import DrawerInfo
 from old_code.Graphs.Graph import Graph
 
+# сколько путей копится перед вставкой в граф: длины рёбер пачки считаются одним вызовом numpy
+WAY_BATCH = 4096
+
+# узел пути с координатами - то, что читает Graph.read_way, когда координаты взяты не из osmium.osm.NodeRef
+WayNode = namedtuple('WayNode', ['ref', 'lat', 'lon'])
+
 
 class DefaultMode:
 
@@ -11,29 +21,128 @@ class DefaultMode:
         self.drawer_info = DrawerInfo()  # супер временная переменная для отрисовки
         # мб понадобится переменная с названием режима
         self.graph = Graph()
+        self.way_batch = []  # пути из Graph.read_way, ещё не добавленные в граф
 
 
     # надо оптимизировать, мб сразу все теги смотреть
-    def get_graph(self):
+    # location_index - см. get_graph_filtered; без него - прежний проход по всем объектам в питоне
+    # keep_components - выбросить обрывки графа (отдельные дорожки, коридоры зданий): 'largest' - оставить
+    # только самую большую компоненту, число - компоненты не меньше стольких узлов; см. Graph.prune_components
+    # node_order - 'hilbert' или 'morton': перенумеровать узлы вдоль кривой, см. Graph.reorder_nodes
+    def get_graph(self, location_index=None, keep_components=None, node_order=None):
+        if location_index is not None:
+            self.get_graph_filtered(location_index)
+        else:
+            target_dict = self.get_target_dict()
+            for obj in osmium.FileProcessor(self.area_file).with_locations():
+                if self.is_suitable(obj, target_dict):
+                    self.add_object(obj)
+            self.flush_ways()
+        if keep_components is not None:
+            self.graph.prune_components(keep_components)
+        if node_order is not None:
+            self.graph.reorder_nodes(node_order)
+        profile = self.get_weight_profile()
+        if profile is not None:
+            self.graph.set_weight_profile(profile)
+        return self.graph
+
+    # профиль весов режима (WeightProfiles); None - вес ребра остаётся длиной
+    def get_weight_profile(self):
+        return None
+
+    # для больших выгрузок: пути с нужными тегами отбираются фильтрами osmium, и питон видит только их,
+    # а не каждый узел файла. Координаты узлов лежат в индексе osmium.index выбранного типа:
+    # sparse_file_array - во временном файле на диске, sparse_mmap_array - в mmap, flex_mem - в памяти,
+    # можно и со своим путём: 'sparse_file_array,/data/nodes.idx'. drawer_info здесь не заполняется.
+    # 'referenced' - в индекс попадают только узлы подходящих путей, см. get_graph_referenced
+    def get_graph_filtered(self, location_index='sparse_file_array'):
+        if location_index == 'referenced':
+            return self.get_graph_referenced()
+        storage, tmp_file = location_index, None
+        if location_index in ('sparse_file_array', 'dense_file_array'):
+            fd, tmp_file = tempfile.mkstemp(suffix='.nodes')  # каталог - TMPDIR, если /tmp в памяти
+            os.close(fd)
+            storage = f'{location_index},{tmp_file}'
+        try:
+            processor = (osmium.FileProcessor(self.area_file, osmium.osm.NODE | osmium.osm.WAY)
+                         .with_locations(storage)
+                         .with_filter(osmium.filter.EntityFilter(osmium.osm.WAY))
+                         .with_filter(osmium.filter.TagFilter(*self.tags)))
+            for obj in processor:
+                # узлы за границей выгрузки остаются без координат - пропускаем их
+                nodes = [node for node in obj.nodes if node.location.valid()]
+                if nodes:
+                    self.add_way(nodes, obj.tags, obj.id)
+            self.flush_ways()
+        finally:
+            if tmp_file is not None:
+                os.remove(tmp_file)
+        return self.graph
+
+    # три прохода вместо одного: пути с нужными тегами (IdTracker запоминает их узлы), затем только эти узлы -
+    # в индекс flex_mem, затем снова пути. Индекс меньше - в нём нет узлов домов, границ и т.п., но сам
+    # IdTracker - битовая карта на весь диапазон id OSM: на выгрузке города ~1.3-1.5 ГБ памяти против
+    # ~150 МБ у sparse_file_array (Калининград, Владимир). Окупается на выгрузках страны, где индекс всех
+    # узлов - десятки ГБ; для города лучше sparse_file_array
+    def get_graph_referenced(self):
+        tracker = osmium.IdTracker()
+        ways = (osmium.FileProcessor(self.area_file, osmium.osm.WAY)
+                .with_filter(osmium.filter.TagFilter(*self.tags)))
+        for way in ways:
+            tracker.add_references(way)
+        locations = osmium.index.create_map('flex_mem')
+        nodes = (osmium.FileProcessor(self.area_file, osmium.osm.NODE)
+                 .with_filter(tracker.id_filter()))
+        for node in nodes:
+            locations.set(node.id, node.location)
+        del tracker
+        ways = (osmium.FileProcessor(self.area_file, osmium.osm.WAY)
+                .with_filter(osmium.filter.TagFilter(*self.tags)))
+        for way in ways:
+            nodes = []
+            for node in way.nodes:
+                try:
+                    location = locations.get(node.ref)
+                except KeyError:
+                    continue  # узел за границей выгрузки
+                nodes.append(WayNode(node.ref, location.lat, location.lon))
+            if nodes:
+                self.add_way(nodes, way.tags, way.id)
+        self.flush_ways()
+        return self.graph
+
+    def get_target_dict(self):
         target_dict = {}
         for key, value in self.tags:
             target_dict.setdefault(key, set()).add(value)
+        return target_dict
 
-        for obj in osmium.FileProcessor(self.area_file).with_locations():
-            for tag in obj.tags:
-                if (tag.k in target_dict and
-                        tag.v in target_dict[tag.k]):
-                    self.add_object(obj)
-                    break  # объект подходит, переходим к следующему
-        return self.graph
+    @staticmethod
+    def is_suitable(obj, target_dict):
+        for tag in obj.tags:
+            if (tag.k in target_dict and
+                    tag.v in target_dict[tag.k]):
+                return True  # объект подходит, остальные теги не смотрим
+        return False
 
     def add_object(self, obj):
         if obj.is_way():
             nodes = obj.nodes
             if len(nodes) > 0:
-                self.graph.add_way(nodes)
+                self.add_way(nodes, obj.tags, obj.id)
                 self.drawer_info.add_way(nodes)  # супер временная строчка для отрисовки
 
-    def get_shortest_route(self, start, end):
-        shortest_route = self.graph.get_shortest_route(start, end)
+    def add_way(self, nodes, tags, way_id):
+        self.way_batch.append(self.graph.read_way(nodes, tags, way_id))
+        if len(self.way_batch) >= WAY_BATCH:
+            self.flush_ways()
+
+    def flush_ways(self):
+        if self.way_batch:
+            self.graph.add_ways(self.way_batch)
+            self.way_batch = []
+
+    def get_shortest_route(self, start, end, stats=None):
+        shortest_route = self.graph.get_shortest_route(start, end, stats=stats)
         return shortest_route
\ No newline at end of file
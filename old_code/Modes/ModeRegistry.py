@@ -0,0 +1,17 @@
+import os
+
+from old_code.Modes.DefaultMode import DefaultMode
+from old_code.Modes.PublicTransportMode import PublicTransportMode
+from old_code.Modes.ScooterMode import ScooterMode
+from old_code.Modes.WalkMode import WalkMode
+
+MODES = {'walk': WalkMode, 'scooter': ScooterMode, 'PublicTransport': PublicTransportMode, 'default': DefaultMode}
+CITY_GRAPHS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'my_code', 'city_graphs')
+
+
+def get_mode(mode, file):
+    return MODES.get(mode, DefaultMode)(file=file)
+
+
+def get_city_file(city):
+    return os.path.join(CITY_GRAPHS_DIR, f"{city.replace(' ', '_')}_graph.osm.pbf")
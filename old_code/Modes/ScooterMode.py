@@ -1,3 +1,4 @@
+from old_code.Graphs.WeightProfiles import ScooterTimeProfile
 from old_code.Modes.DefaultMode import DefaultMode
 
 
@@ -7,6 +8,9 @@ class ScooterMode(DefaultMode):
         self.tags = [('highway', 'primary'), ('highway', 'secondary'), ('highway', 'tertiary'),
                      ('highway', 'residential'),
                      ('highway', 'pedestrian'), ('highway', 'service')]
+        # вес ребра - время в секундах: скорость по highway, maxspeed и surface, не выше speed_cap
+        self.speed_cap = 25.0  # км/ч
+        self.hour_factors = None  # {класс дороги или '*': [24 множителя]}, см. ScooterTimeProfile
 
-    # обязательно переопределить метод добавления тегов для самокатика - брать только подходящую скорость
-    # можно задать переменную с максимальной допустимой скоростью
+    def get_weight_profile(self):
+        return ScooterTimeProfile(speed_cap=self.speed_cap, hour_factors=self.hour_factors)
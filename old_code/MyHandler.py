@@ -1,7 +1,7 @@
 import statistics
 from collections import defaultdict, Counter
-import math
 
+from old_code.Graphs.Geodesic import haversine
 from old_code.Handler import OSMHandler
 
 
@@ -27,7 +27,7 @@ class OSMHandlerWithStats(OSMHandler):
             if u in self.node_coords and v in self.node_coords:
                 lat1, lon1 = self.node_coords[u]
                 lat2, lon2 = self.node_coords[v]
-                length = self.calculate_distance(lat1, lon1, lat2, lon2)
+                length = haversine((lat1, lon1), (lat2, lon2))
                 data['length'] = length
             else:
                 # Если координат нет, используем 0 или пропускаем
@@ -40,25 +40,6 @@ class OSMHandlerWithStats(OSMHandler):
         self.edge_lengths.append(length)
 
 
-    def calculate_distance(self, lat1, lon1, lat2, lon2):
-        """Вычисляет расстояние между двумя точками в метрах (формула гаверсинусов)"""
-        # Радиус Земли в метрах
-        R = 6371000
-
-        # Преобразуем градусы в радианы
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
-
-        # Формула гаверсинусов
-        a = (math.sin(delta_phi / 2) * math.sin(delta_phi / 2) +
-             math.cos(phi1) * math.cos(phi2) *
-             math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-        return R * c
-
     def print_statistics(self):
         """Вывод статистики по длинам рёбер"""
         if not self.edge_lengths:
@@ -0,0 +1,497 @@
+import asyncio
+import json
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+
+import networkx as nx
+
+from old_code.Graphs.AlternativeRoutes import AlternativeRoutes
+from old_code.Graphs.CSRGraph import CSRGraph
+from old_code.Graphs.EdgeOverlay import EdgeOverlay
+from old_code.Graphs.Geodesic import path_length
+from old_code.Graphs.RouteCache import RouteCache
+from old_code.Graphs.SharedGraphStore import SharedGraphStore
+from old_code.Graphs.SpatialIndex import SpatialIndex
+from old_code.Graphs.WeightProfiles import PROFILES
+from old_code.Modes.ModeRegistry import get_mode
+
+MAX_BODY = 2 ** 20
+MAX_ALTERNATIVES = 5
+
+# графы, подключённые к разделяемой памяти в процессе-воркере: (city, mode) -> SharedRouteGraph
+WORKER_GRAPHS = {}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(status, message)  # оба аргумента в args, чтобы ошибка переживала pickle из воркера
+        self.status = status
+        self.message = message
+
+
+class ReadWriteLock:
+    '''
+    Блокировка читатели/писатель: поиски (read) идут параллельно, перекрытия (write) ждут, пока они закончатся,
+    и пускаются вперёд новых поисков — поток перекрытий не голодает под нагрузкой
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class LoadedGraph:
+    '''Граф города в одном режиме, загруженный один раз при старте сервера, и его индекс привязки'''
+
+    def __init__(self, city, mode, file, cache=None, profile=None, keep_components=None, node_order=None):
+        self.city = city
+        self.mode_name = mode
+        self.file = file
+        self.cache = cache
+        start_time = time.perf_counter()
+        self.mode = get_mode(mode, file)
+        self.graph = self.mode.get_graph(keep_components=keep_components, node_order=node_order)
+        if profile is not None:
+            self.graph.set_weight_profile(PROFILES[profile]())
+        self.profile = self.graph.weight_profile.name
+        self.index = SpatialIndex(self.graph)
+        # для альтернативных маршрутов: поиски по массивам, перекрытия обновляют в нём веса
+        self.csr = CSRGraph.from_graph(self.graph)
+        self.overlay = EdgeOverlay(self.graph, self.index, city=city, mode=mode, preprocessed=[self.csr])
+        # перекрытия меняют граф на месте — поиски в потоках пула идут параллельно друг с другом, но не с ними
+        self.lock = ReadWriteLock()
+        self.load_time = time.perf_counter() - start_time
+
+    def snap(self, point, component=None):
+        node, distance = self.index.nearest(point, component=component)
+        if node is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, 'graph is empty')
+        return node, distance
+
+    def snap_many(self, points):
+        result = []
+        for point in points:
+            node, distance = self.snap(point)
+            result.append({'point': list(self.graph.get_node_coords(node)), 'distance': distance})
+        return result
+
+    def route(self, start, end):
+        start_node, start_distance = self.snap(start)
+        # конец — в той же компоненте, что и начало: иначе точку у обрывка графа привяжет к нему и пути не будет
+        end_node, end_distance = self.snap(end, component=self.graph.get_component(start_node))
+        key = RouteCache.get_key(self.city, self.mode_name, start_node, end_node, self.profile)
+        cached = self.cache.get(key, self.graph.version) if self.cache is not None else None
+        if cached is not None:
+            coords, distance = cached
+        elif not self.graph.is_reachable(start_node, end_node):
+            raise HttpError(HTTPStatus.NOT_FOUND, 'route not found')
+        else:
+            with self.lock.read():
+                try:
+                    path = self.mode.get_shortest_route(start_node, end_node)
+                except nx.NetworkXNoPath:
+                    raise HttpError(HTTPStatus.NOT_FOUND, 'route not found')
+                nx_graph = self.graph.get_graph()
+                edges = [nx_graph[a][b].get('edge_id') for a, b in zip(path, path[1:])]
+                coords = [self.graph.get_node_coords(node) for node in path]
+                distance = path_length([lat for lat, _ in coords], [lon for _, lon in coords])
+                # кладём в кэш под той же блокировкой: перекрытие, пришедшее после поиска, иначе успело бы
+                # сбросить кэш раньше, и маршрут через закрытое ребро остался бы в нём
+                if self.cache is not None:
+                    self.cache.put(key, self.graph.version, coords, distance,
+                                   edges=[edge_id for edge_id in edges if edge_id is not None])
+        return {
+            'path': [list(point) for point in coords],
+            'distance': distance,
+            'snap_distance': [start_distance, end_distance],
+            'cached': cached is not None,
+        }
+
+    def alternatives(self, start, end, k=3):
+        start_node, start_distance = self.snap(start)
+        end_node, end_distance = self.snap(end, component=self.graph.get_component(start_node))
+        with self.lock.read():
+            routes = AlternativeRoutes(self.csr).find(self.csr.node_index[start_node], self.csr.node_index[end_node], k)
+        if not routes:
+            raise HttpError(HTTPStatus.NOT_FOUND, 'route not found')
+        return {
+            'routes': [{'path': [list(self.csr.get_node_coords(node)) for node in path],
+                        'distance': self.csr.get_path_length(path), 'weight': weight} for path, weight in routes],
+            'snap_distance': [start_distance, end_distance],
+        }
+
+    def matrix(self, sources, targets):
+        # цели привязываются к компоненте источника, как конец маршрута в route; привязка — одна на компоненту
+        snapped = {}
+        rows = []
+        for point in sources:
+            source_node, _ = self.snap(point)
+            component = self.graph.get_component(source_node)
+            if component not in snapped:
+                snapped[component] = [self.snap(target, component=component)[0] for target in targets]
+            target_nodes = snapped[component]
+            with self.lock.read():
+                lengths = nx.single_source_dijkstra_path_length(self.graph.get_graph(), source_node, weight='weight')
+            rows.append([lengths.get(node) for node in target_nodes])
+        return {'distances': rows}
+
+    def closures(self, block=(), street=None, override=None, revert=None):
+        '''
+        Перекрытия: block — edge_id закрыть, street — закрыть улицу по названию, override — {edge_id: вес},
+        revert — edge_id вернуть (True — все). Возвращает отчёты EdgeOverlay и текущее состояние
+        '''
+        num_edges = len(self.graph.edges.u)
+        if override is not None and not isinstance(override, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'override must be an object {edge_id: weight}')
+        if revert is not None and revert is not True and not isinstance(revert, list):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'revert must be a list of edge ids or true')
+        if not isinstance(block, (list, tuple)):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'block must be a list of edge ids')
+        block = self.get_edge_ids(block, num_edges)
+        revert = revert if revert is None or revert is True else self.get_edge_ids(revert, num_edges)
+        weights = None
+        if override:
+            try:
+                weights = dict(zip(self.get_edge_ids(list(override), num_edges), map(float, override.values())))
+            except (TypeError, ValueError):
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'override weights must be numbers')
+        self.overlay.cache = self.cache
+        reports = []
+        with self.lock.write():
+            if revert is not None:
+                reports.append(self.overlay.revert(None if revert is True else revert))
+            if block:
+                reports.append(self.overlay.block(block))
+            if street:
+                reports.append(self.overlay.block_street(street))
+            if weights:
+                reports.append(self.overlay.override(weights))
+            state = self.overlay.get_state()
+        return {'reports': reports, 'blocked': state['blocked'],
+                'overridden': {str(e): w for e, w in state['overridden'].items()}}
+
+    @staticmethod
+    def get_edge_ids(values, num_edges):
+        '''edge_id из запроса (числа или строки-ключи override) с проверкой диапазона'''
+        try:
+            edge_ids = [int(e) for e in values]
+        except (TypeError, ValueError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'edge ids must be integers')
+        bad = [e for e in edge_ids if not 0 <= e < num_edges]
+        if bad:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f'unknown edge ids: {bad[:10]}')
+        return edge_ids
+
+
+class SharedRouteGraph:
+    '''То же, что LoadedGraph, но поверх CSRGraph из разделяемой памяти — работает в процессах-воркерах'''
+
+    def __init__(self, csr, key, version, cache=None, profile='distance'):
+        self.csr = csr
+        self.city, self.mode_name = key
+        self.version = version  # версия исходного графа на момент публикации в разделяемую память
+        self.cache = cache
+        self.profile = profile
+
+    def snap(self, point, component=None):
+        node, distance = self.csr.nearest(point, component=component)
+        if node is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, 'graph is empty')
+        return node, distance
+
+    def snap_many(self, points):
+        result = []
+        for point in points:
+            node, distance = self.snap(point)
+            result.append({'point': list(self.csr.get_node_coords(node)), 'distance': distance})
+        return result
+
+    def route(self, start, end):
+        start_node, start_distance = self.snap(start)
+        end_node, end_distance = self.snap(end, component=self.csr.components[start_node])
+        key = RouteCache.get_key(self.city, self.mode_name, start_node, end_node, self.profile)
+        cached = self.cache.get(key, self.version) if self.cache is not None else None
+        if cached is not None:
+            coords, distance = cached
+        else:
+            try:
+                path, _ = self.csr.shortest_path(start_node, end_node)
+            except nx.NetworkXNoPath:
+                raise HttpError(HTTPStatus.NOT_FOUND, 'route not found')
+            distance = self.csr.get_path_length(path)  # вес пути зависит от профиля, а отдаём метры
+            coords = [self.csr.get_node_coords(node) for node in path]
+            if self.cache is not None:
+                self.cache.put(key, self.version, coords, distance)
+        return {
+            'path': [list(point) for point in coords],
+            'distance': distance,
+            'snap_distance': [start_distance, end_distance],
+            'cached': cached is not None,
+        }
+
+    def alternatives(self, start, end, k=3):
+        start_node, start_distance = self.snap(start)
+        end_node, end_distance = self.snap(end, component=self.csr.components[start_node])
+        routes = AlternativeRoutes(self.csr).find(start_node, end_node, k)
+        if not routes:
+            raise HttpError(HTTPStatus.NOT_FOUND, 'route not found')
+        return {
+            'routes': [{'path': [list(self.csr.get_node_coords(node)) for node in path],
+                        'distance': self.csr.get_path_length(path), 'weight': weight} for path, weight in routes],
+            'snap_distance': [start_distance, end_distance],
+        }
+
+    def matrix(self, sources, targets):
+        snapped = {}
+        rows = []
+        for point in sources:
+            source_node, _ = self.snap(point)
+            component = int(self.csr.components[source_node])
+            if component not in snapped:
+                snapped[component] = [self.snap(target, component=component)[0] for target in targets]
+            dist, _ = self.csr.dijkstra(source_node)
+            rows.append([dist.get(node) for node in snapped[component]])
+        return {'distances': rows}
+
+
+def attach_worker_graphs(handles, cache_entries):
+    # у каждого процесса-воркера свой кэш маршрутов
+    cache = RouteCache(max_entries=cache_entries) if cache_entries else None
+    for key, (handle, version, profile) in handles.items():
+        WORKER_GRAPHS[key] = SharedRouteGraph(SharedGraphStore.attach(handle), key, version, cache=cache,
+                                              profile=profile)
+
+
+def run_in_worker(key, method, *args):
+    return getattr(WORKER_GRAPHS[key], method)(*args)
+
+
+class RouteServer:
+    '''
+    Локальный HTTP/JSON сервис маршрутов. Графы загружаются один раз при старте,
+    поиски идут в пуле потоков, чтобы не блокировать event loop.
+    Не больше queue_size запросов одновременно в работе или в очереди пула — сверх того отвечаем 503.
+    С processes=True поиски идут в пуле процессов: графы один раз перекладываются в CSR в разделяемой
+    памяти, и все воркеры читают одну копию, ничего не перестраивая при старте.
+
+    POST /route  {"city", "mode", "start": [lat, lon], "end": [lat, lon]}
+    POST /alternatives {"city", "mode", "start": [lat, lon], "end": [lat, lon], "k": 3} — до k разных маршрутов
+    POST /matrix {"city", "mode", "sources": [[lat, lon], ...], "targets": [[lat, lon], ...]}
+    POST /snap   {"city", "mode", "points": [[lat, lon], ...]}
+    POST /closures {"city", "mode", "block": [edge_id, ...], "street": "...", "override": {edge_id: вес},
+                    "revert": [edge_id, ...] или true} — только в режиме потоков
+    GET  /health
+    '''
+
+    def __init__(self, graphs, host='127.0.0.1', port=8080, workers=4, queue_size=64, processes=False,
+                 cache_entries=100000):
+        self.graphs = {(graph.city, graph.mode_name): graph for graph in graphs}
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processes = processes
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.store = None
+        self.cache = None
+        if processes:
+            self.store = SharedGraphStore()
+            handles = {key: (self.store.publish(CSRGraph.from_graph(graph.graph)), graph.graph.version, graph.profile)
+                       for key, graph in self.graphs.items()}
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=attach_worker_graphs,
+                                                initargs=(handles, cache_entries))
+        else:
+            # в режиме потоков один общий кэш на все графы
+            self.cache = RouteCache(max_entries=cache_entries) if cache_entries else None
+            for graph in self.graphs.values():
+                graph.cache = self.cache
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def serve_forever(self):
+        # по SIGTERM останавливаемся так же аккуратно, как по Ctrl+C: закрываем пул и разделяемую память
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+            print(f'Сервер маршрутов слушает http://{self.host}:{self.port}, графов: {len(self.graphs)}')
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.executor.shutdown()
+            if self.store is not None:
+                self.store.close()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    # тело не прочитано — дальше в потоке не начало следующего запроса, соединение закрываем
+                    await self.write_response(writer, e.status, {'error': e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = HTTPStatus.OK, await self.dispatch(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception as e:
+                    # запрос прочитан целиком, так что соединение живо — отвечаем, а не обрываем его
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'internal error: {e!r}'}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'invalid Content-Length')
+        if length < 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'invalid Content-Length')
+        if length > MAX_BODY:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'body is larger than {MAX_BODY} bytes')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path.split('?', 1)[0], headers, body
+
+    @staticmethod
+    async def write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                f'Content-Type: application/json; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += 'Retry-After: 1\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+
+    async def dispatch(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return self.get_health()
+        if method != 'POST':
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, 'use POST')
+        try:
+            data = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'invalid json')
+        if not isinstance(data, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'json body must be an object')
+        key = self.get_graph_key(data)
+        try:
+            if path == '/route':
+                return await self.run_in_pool(key, 'route', tuple(data['start']), tuple(data['end']))
+            if path == '/alternatives':
+                return await self.run_in_pool(key, 'alternatives', tuple(data['start']), tuple(data['end']),
+                                              min(int(data.get('k', 3)), MAX_ALTERNATIVES))
+            if path == '/matrix':
+                return await self.run_in_pool(key, 'matrix', [tuple(p) for p in data['sources']],
+                                              [tuple(p) for p in data['targets']])
+            if path == '/snap':
+                return await self.run_in_pool(key, 'snap_many', [tuple(p) for p in data['points']])
+            if path == '/closures':
+                if self.processes:
+                    # у каждого воркера своя копия весов — перекрытие в одном из них разошлось бы с остальными
+                    raise HttpError(HTTPStatus.BAD_REQUEST, 'closures are not supported with --processes')
+                return await self.run_in_pool(key, 'closures', data.get('block', ()), data.get('street'),
+                                              data.get('override'), data.get('revert'))
+        except (KeyError, TypeError, ValueError) as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f'bad request: {e!r}')
+        raise HttpError(HTTPStatus.NOT_FOUND, f'unknown path {path}')
+
+    def get_graph_key(self, data):
+        key = (data.get('city'), data.get('mode', 'walk'))
+        if key not in self.graphs:
+            raise HttpError(HTTPStatus.NOT_FOUND, f'graph {key[0]}/{key[1]} is not loaded')
+        return key
+
+    async def run_in_pool(self, key, method, *args):
+        # обратное давление: очередь пула ограничена, лишние запросы сразу отбиваем
+        if self.in_flight >= self.queue_size:
+            self.rejected += 1
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, 'server is overloaded')
+        self.in_flight += 1
+        try:
+            if self.processes:
+                func, args = run_in_worker, (key, method) + args
+            else:
+                func = getattr(self.graphs[key], method)
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            self.served += 1
+            return result
+        finally:
+            self.in_flight -= 1
+
+    def get_health(self):
+        return {
+            'graphs': [{'city': g.city, 'mode': g.mode_name, 'profile': g.profile, 'nodes': g.graph.get_graph().number_of_nodes(),
+                        'load_time_s': g.load_time} for g in self.graphs.values()],
+            'workers': self.workers,
+            'processes': self.processes,
+            'queue_size': self.queue_size,
+            'in_flight': self.in_flight,
+            'served': self.served,
+            'rejected': self.rejected,
+            # в режиме процессов кэши живут в воркерах и здесь не видны
+            'route_cache': self.cache.get_stats() if self.cache is not None else None,
+        }
@@ -0,0 +1,96 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from old_code.Benchmark.IngestionBenchmark import IngestionBenchmark
+from old_code.Benchmark.SyntheticCity import SyntheticCity
+from old_code.Modes.ModeRegistry import MODES, get_city_file, get_mode
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.benchmark_ingestion --city Seversk --city Kyzyl --mode walk
+    python -m old_code.benchmark_ingestion --synthetic 50x50 --synthetic 200x200 --tracemalloc
+    python -m old_code.benchmark_ingestion --city Kaliningrad --location-index sparse_file_array
+'''
+
+PHASES = ['decode', 'locations', 'tags', 'haversine', 'networkx', 'total']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Бенчмарк построения графа из pbf по фазам')
+    parser.add_argument('--city', action='append', default=[], help='город из my_code/city_graphs, можно несколько')
+    parser.add_argument('--file', action='append', default=[], help='произвольный .osm.pbf, можно несколько')
+    parser.add_argument('--synthetic', action='append', default=[], help='синтетический pbf ROWSxCOLS, можно несколько')
+    parser.add_argument('--mode', default='walk', choices=sorted(MODES))
+    parser.add_argument('--tracemalloc', action='store_true', help='пики tracemalloc по фазам (замедляет замеры)')
+    parser.add_argument('--location-index', help='total через get_graph_filtered с этим индексом координат: '
+                                                   'sparse_file_array, sparse_mmap_array, flex_mem, ...')
+    parser.add_argument('--output', default='bench_ingestion.json')
+    return parser.parse_args()
+
+
+def run_one(mode_name, file, use_tracemalloc, location_index):
+    # каждый файл в отдельном процессе, чтобы пиковый RSS относился только к нему
+    return IngestionBenchmark(get_mode(mode_name, file), use_tracemalloc=use_tracemalloc,
+                              location_index=location_index).run()
+
+
+def get_files(args, tmp_dir):
+    files = [(city, get_city_file(city)) for city in args.city]
+    files += [(os.path.basename(file), file) for file in args.file]
+    for size in args.synthetic:
+        rows, cols = map(int, size.lower().split('x'))
+        file = os.path.join(tmp_dir, f'synthetic_{rows}x{cols}.osm.pbf')
+        SyntheticCity(rows, cols).write_pbf(file)
+        files.append((f'synthetic-{rows}x{cols}', file))
+    return files
+
+
+def print_table(results):
+    header = ['city', 'objects', 'nodes', 'edges'] + [f'{p}, s' for p in PHASES] + ['obj/s', 'RSS, MB',
+                                                                                   'total RSS, MB']
+    rows = []
+    for name, result in results:
+        phases = result['phases_s']
+        rows.append([name, result['objects'], result['nodes'], result['edges']]
+                    + [f'{phases[p]:.3f}' for p in PHASES]
+                    + [f"{result['objects_per_s']:.0f}", f"{result['peak_rss_mb']:.1f}",
+                       f"{result['peak_rss_total_mb']:.1f}"])
+    widths = [max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))]
+    print(' | '.join(str(h).rjust(w) for h, w in zip(header, widths)))
+    print('-+-'.join('-' * w for w in widths))
+    for row in rows:
+        print(' | '.join(str(v).rjust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    args = parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = get_files(args, tmp_dir)
+        if not files:
+            raise SystemExit('нужно указать --city, --file или --synthetic')
+        context = multiprocessing.get_context('spawn')
+        for name, file in files:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_one, args.mode, file, args.tracemalloc, args.location_index).result()
+            results.append((name, result))
+
+    # сортируем по размеру, чтобы в таблице была видна кривая масштабирования
+    results.sort(key=lambda item: item[1]['objects'])
+    print_table(results)
+    if args.tracemalloc:
+        for name, result in results:
+            print(f'\n{name}: пики tracemalloc, МБ: ' +
+                  ', '.join(f'{phase} {peak:.1f}' for phase, peak in result['tracemalloc_peak_mb'].items()))
+            for line in result['top_allocations'][:5]:
+                print('   ', line)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({name: result for name, result in results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
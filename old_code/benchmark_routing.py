@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import time
+
+from old_code.Benchmark.QuerySet import QuerySet
+from old_code.Benchmark.RoutingBenchmark import RoutingBenchmark
+from old_code.Benchmark.RoutingEngines import ENGINES
+from old_code.Benchmark.SyntheticCity import SyntheticCity
+from old_code.Graphs.NodeOrder import CURVES
+from old_code.Modes.ModeRegistry import MODES, get_city_file, get_mode
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.benchmark_routing --synthetic 60x60
+    python -m old_code.benchmark_routing --city Kyzyl --mode walk --queries 200 --output kyzyl.json
+    python -m old_code.benchmark_routing --city Kyzyl --compare old.json
+    python -m old_code.benchmark_routing --city Kyzyl --output plain.json
+    python -m old_code.benchmark_routing --city Kyzyl --node-order hilbert --compare plain.json
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Бенчмарк движков маршрутизации')
+    parser.add_argument('--city', help='город из my_code/city_graphs, например Kyzyl')
+    parser.add_argument('--file', help='произвольный .osm.pbf вместо --city')
+    parser.add_argument('--synthetic', help='синтетический город-решётка ROWSxCOLS, например 50x50')
+    parser.add_argument('--mode', default='walk', choices=sorted(MODES))
+    parser.add_argument('--engines', default=','.join(ENGINES), help='через запятую: ' + ', '.join(ENGINES))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--query-file', help='готовый набор запросов (json); если файла нет — он будет создан')
+    parser.add_argument('--output', default='bench_routing.json')
+    parser.add_argument('--compare', help='json предыдущего прогона для сравнения')
+    parser.add_argument('--node-order', choices=CURVES, help='перенумеровать узлы вдоль кривой перед прогоном')
+    return parser.parse_args()
+
+
+def build_graph(args):
+    if args.synthetic:
+        rows, cols = map(int, args.synthetic.lower().split('x'))
+        return SyntheticCity(rows, cols, seed=args.seed).get_graph(), f'synthetic-{rows}x{cols}'
+    if args.file:
+        file, city = args.file, os.path.basename(args.file)
+    elif args.city:
+        file, city = get_city_file(args.city), args.city
+    else:
+        raise SystemExit('нужно указать --city, --file или --synthetic')
+    return get_mode(args.mode, file).get_graph(), city
+
+
+def main():
+    args = parse_args()
+    graph, city = build_graph(args)
+    if args.node_order:
+        start_time = time.perf_counter()
+        graph.reorder_nodes(args.node_order)
+        print(f'узлы перенумерованы по кривой {args.node_order} за {time.perf_counter() - start_time:.2f} с')
+
+    if args.query_file and os.path.exists(args.query_file):
+        query_set = QuerySet.load(args.query_file)
+    else:
+        query_set = QuerySet.generate(graph, args.queries, seed=args.seed, city=city, mode=args.mode)
+        if args.query_file:
+            query_set.save(args.query_file)
+
+    engines = [ENGINES[name]() for name in args.engines.split(',')]
+    result = RoutingBenchmark(graph, query_set, engines).run()
+    RoutingBenchmark.save(result, args.output)
+
+    print(f"{city} ({args.mode}): {result['meta']['nodes']} вершин, {result['meta']['edges']} рёбер, "
+          f"{len(query_set)} запросов")
+    for name, stats in result['engines'].items():
+        latency, settled = stats['latency_ms'], stats['settled_nodes']
+        print(f"{name:>16}: p50 {latency['p50']:.2f} мс, p95 {latency['p95']:.2f} мс, p99 {latency['p99']:.2f} мс, "
+              f"settled p50 {settled['p50']:.0f}, предобработка {stats['preprocessing_s']:.2f} с, "
+              f"память {stats['peak_memory_mb']:.1f} МБ, не найдено {stats['failed']}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old_result = json.load(f)
+        for name, metric, old_value, new_value, ratio in RoutingBenchmark.compare(old_result, result):
+            ratio = f'{ratio:.2f}x' if ratio is not None else '-'
+            print(f'{name:>16} {metric:>18}: {old_value} -> {new_value} ({ratio})')
+
+
+if __name__ == '__main__':
+    main()
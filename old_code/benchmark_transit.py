@@ -0,0 +1,355 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import statistics
+import time
+
+from experements import my_clastarizator as clusterizator
+from old_code.Benchmark.SyntheticTransit import SyntheticTransit
+from old_code.Graphs.ConnectionScan import ConnectionScan
+from old_code.Graphs.FootpathTransfers import FootpathTransfers
+from old_code.Graphs.GtfsFeed import GtfsFeed
+from old_code.Graphs.McRaptor import McRaptor
+from old_code.Graphs.Raptor import Raptor
+from old_code.Graphs.TransferPatterns import TransferPatterns
+from old_code.Graphs.TransitNetwork import TransitNetwork, walk
+from old_code.Modes.ModeRegistry import CITY_GRAPHS_DIR, get_city_file, get_mode
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.benchmark_transit --city Kaliningrad --synthetic-routes 60
+    python -m old_code.benchmark_transit --city Kaliningrad --gtfs feed.zip --date 2026-10-19 --window 07:00-09:00
+    python -m old_code.benchmark_transit --city Kaliningrad --engines mcraptor --rounds 6
+    python -m old_code.benchmark_transit --city Kaliningrad --engines csa --cluster-size 50
+    python -m old_code.benchmark_transit --city Kaliningrad --engines patterns --workers 8
+Пешеходный граф — режим walk города (самая большая компонента), время пешком — WalkTimeProfile.
+Транспорт — GTFS (--gtfs) или синтетические маршруты по тому же графу (SyntheticTransit).
+Пешие пересадки между остановками считаются в --workers процессах и лежат в my_code/city_graphs/transfers/<город>;
+при следующем запуске берутся оттуда, если пешеходный граф, остановки и --max-walk не поменялись.
+Шаблоны пересадок (--engines patterns, по умолчанию не запускается — предподсчёт долгий) лежат в
+my_code/city_graphs/transfer_patterns/<город>_<окно> и пересчитываются с --rebuild-patterns или если не
+подходят к сети.
+'''
+
+TRANSFERS_DIR = os.path.normpath(os.path.join(CITY_GRAPHS_DIR, 'transfers'))
+PATTERNS_DIR = os.path.normpath(os.path.join(CITY_GRAPHS_DIR, 'transfer_patterns'))
+
+
+def get_transfers_dir(city, max_walk):
+    return os.path.join(TRANSFERS_DIR, f"{city.replace(' ', '_')}_{max_walk:g}")
+
+
+def get_patterns_dir(city, window):
+    return os.path.join(PATTERNS_DIR, f"{city.replace(' ', '_')}_{window.replace(':', '')}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Бенчмарк транспортных поисков')
+    parser.add_argument('--city', required=True, help='город из my_code/city_graphs, например Kaliningrad')
+    parser.add_argument('--gtfs', help='GTFS .zip; без него — синтетические маршруты')
+    parser.add_argument('--date', help='день расписания GTFS, YYYY-MM-DD')
+    parser.add_argument('--synthetic-routes', type=int, default=40)
+    parser.add_argument('--max-walk', type=float, default=600.0, help='секунд пешком на подход и пересадку')
+    parser.add_argument('--workers', type=int, help='процессов для таблицы пересадок, по умолчанию — по числу ядер')
+    parser.add_argument('--rebuild-transfers', action='store_true', help='не брать таблицу пересадок с диска')
+    parser.add_argument('--rebuild-patterns', action='store_true', help='не брать шаблоны пересадок с диска')
+    parser.add_argument('--rounds', type=int, default=5, help='поездок в пути не больше')
+    parser.add_argument('--window', default='07:00-09:00', help='окно выхода для профиля')
+    parser.add_argument('--engines', default=','.join(DEFAULT_ENGINES), help='через запятую: ' + ', '.join(ENGINES))
+    parser.add_argument('--cluster-size', type=int, default=50, help='k кластеризатора для сравнения с csa')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_transit.json')
+    return parser.parse_args()
+
+
+ENGINES = ('profile', 'mcraptor', 'csa', 'patterns')
+DEFAULT_ENGINES = ('profile', 'mcraptor', 'csa')
+
+
+def parse_clock(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+def build_model(args):
+    '''Граф кластеризатора (пешком + маршруты) и TransitNetwork по нему; третье значение — время на пересадки'''
+    walk_graph = get_mode('walk', get_city_file(args.city)).get_graph(keep_components='largest')
+    if args.gtfs:
+        date = datetime.date.fromisoformat(args.date) if args.date else None
+        feed = GtfsFeed.load(args.gtfs, date=date)
+        stop_nodes, _ = feed.snap_stops(walk_graph)
+    else:
+        feed, stop_nodes = SyntheticTransit(walk_graph, routes=args.synthetic_routes, seed=args.seed).get_feed()
+    graph = clusterizator.add_walk_graph(clusterizator.Graph(), walk_graph)
+    clusterizator.add_gtfs_routes(graph, feed, stop_nodes)
+    start_time = time.perf_counter()
+    directory = get_transfers_dir(args.city, args.max_walk)
+    stops = TransitNetwork.get_stop_nodes(graph)
+    if args.rebuild_transfers:
+        transfers, loaded = FootpathTransfers.build(graph, stops, args.max_walk, workers=args.workers), False
+        transfers.save(directory)
+    else:
+        transfers, loaded = FootpathTransfers.load_or_build(directory, graph, stops, args.max_walk, workers=args.workers)
+    transfers_time = time.perf_counter() - start_time
+    print(f"  пересадки {'с диска' if loaded else 'посчитаны'} за {transfers_time:.1f} с -> {directory}")
+    network = TransitNetwork(graph, max_walk=args.max_walk, transfers=transfers)
+    return graph, network, transfers_time
+
+
+def get_queries(graph, network, count, max_walk, seed):
+    '''Пары узлов рядом с остановками (в пределах половины max_walk), чтобы транспорт был доступен'''
+    rnd = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        source, target = (rnd.choice(sorted(walk(graph, rnd.choice(network.stop_nodes), max_walk / 2)))
+                          for _ in range(2))
+        queries.append((source, target))
+    return queries
+
+
+def get_latency(values):
+    values = sorted(values)
+    return {'p50': statistics.median(values) * 1e3, 'p95': values[int(0.95 * (len(values) - 1))] * 1e3}
+
+
+def run_profile(network, queries, args, start, end):
+    '''RAPTOR: один поиск на начало окна, профиль на окно и то же окно отдельными поисками'''
+    raptor = Raptor(network, max_rounds=args.rounds)
+    single, profile, repeated, sizes, mismatches = [], [], [], [], 0
+    for source, target in queries:
+        start_time = time.perf_counter()
+        raptor.earliest_arrival(source, target, start)
+        single.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        journeys, walk_time = raptor.profile(source, target, start, end)
+        profile.append(time.perf_counter() - start_time)
+        sizes.append(len(journeys))
+
+        # то же окно отдельными поисками: по одному на каждый момент выхода, с которым успеваем на рейс
+        access_stops, access_times, _ = network.get_access(source)
+        departures = network.get_departures(access_stops, access_times, start, end)[0].tolist()
+        start_time = time.perf_counter()
+        arrivals = {departure: raptor.earliest_arrival(source, target, departure)[0] for departure in departures}
+        repeated.append(time.perf_counter() - start_time)
+        for departure, arrival, _ in journeys:
+            if abs(arrivals[departure] - arrival) > 1e-6:
+                mismatches += 1
+
+    result = {
+        'earliest_arrival_ms': get_latency(single),
+        'profile_ms': get_latency(profile),
+        'repeated_ms': get_latency(repeated),
+        'profile_size': {'p50': statistics.median(sizes), 'max': max(sizes)},
+        'profile_mismatches': mismatches,
+    }
+    for name in ('earliest_arrival_ms', 'profile_ms', 'repeated_ms'):
+        print(f"{name:>20}: p50 {result[name]['p50']:.1f} мс, p95 {result[name]['p95']:.1f} мс")
+    print(f"  профиль: p50 {result['profile_size']['p50']} поездок в Парето-множестве, "
+          f"расхождений с отдельными поисками {mismatches}")
+    return result
+
+
+def run_mcraptor(network, queries, args, start):
+    '''McRAPTOR на начало окна: задержки, размер Парето-множества и рост числа меток по раундам'''
+    mc_raptor = McRaptor(network, max_rounds=args.rounds)
+    latency, fronts, labels, label_bytes = [], [], [], []
+    created = [0] * (args.rounds + 1)
+    kept = [0] * (args.rounds + 1)
+    for source, target in queries:
+        stats = {}
+        start_time = time.perf_counter()
+        mc_raptor.search(source, target, start, stats=stats)
+        latency.append(time.perf_counter() - start_time)
+        fronts.append(stats['front'])
+        labels.append(stats['labels'])
+        label_bytes.append(stats['label_bytes'])
+        created = [a + b for a, b in zip(created, stats['created'])]
+        kept = [a + b for a, b in zip(kept, stats['kept'])]
+
+    result = {
+        'latency_ms': get_latency(latency),
+        'front': {'p50': statistics.median(fronts), 'max': max(fronts)},
+        'labels': {'p50': statistics.median(labels), 'max': max(labels),
+                   'max_kb': max(label_bytes) / 1024},
+        'created_per_round': [value / len(queries) for value in created],
+        'kept_per_round': [value / len(queries) for value in kept],
+    }
+    print(f"{'mcraptor_ms':>20}: p50 {result['latency_ms']['p50']:.1f} мс, p95 {result['latency_ms']['p95']:.1f} мс, "
+          f"Парето p50 {result['front']['p50']}, макс {result['front']['max']}, "
+          f"меток p50 {result['labels']['p50']}, макс {result['labels']['max']} ({result['labels']['max_kb']:.0f} КБ)")
+    print('  меток на запрос по раундам (проверено / осталось в мешках):')
+    for k, (a, b) in enumerate(zip(result['created_per_round'], result['kept_per_round'])):
+        print(f'    раунд {k}: {a:.0f} / {b:.0f}')
+    return result
+
+
+def run_csa(graph, network, args, start):
+    '''
+    Connection Scan против модифицированной Дейкстры кластеризатора на одних и тех же запросах. Дейкстре
+    нужны кластеры вокруг остановок, поэтому точки запросов — узлы кластеров
+    '''
+    start_time = time.perf_counter()
+    csa = ConnectionScan(network)
+    csa_build = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    route_stops_map = {route_id: route.stops for route_id, route in graph.routes.items()}
+    clusters = clusterizator.build_clusters(graph, route_stops_map, args.cluster_size)
+    cluster_dist = clusterizator.precompute_intra_cluster_distances(graph, clusters)
+    comp_graph = clusterizator.build_compressed_graph(graph, clusters, cluster_dist)
+    dijkstra_build = time.perf_counter() - start_time
+
+    rnd = random.Random(args.seed)
+    members = sorted({node for info in clusters.values() for node in info['members']})
+    queries = [tuple(rnd.sample(members, 2)) for _ in range(args.queries)]
+    csa_times, dijkstra_times, found = [], [], []
+    outcome = {'same': 0, 'csa_earlier': 0, 'dijkstra_earlier': 0, 'dijkstra_not_found': 0, 'csa_not_found': 0}
+    for source, target in queries:
+        start_time = time.perf_counter()
+        arrival, _, _ = csa.earliest_arrival(source, target, start)
+        csa_times.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        dijkstra_arrival, _ = clusterizator.modified_dijkstra_with_transit(graph, comp_graph, clusters, cluster_dist,
+                                                                           source, target, start)
+        dijkstra_times.append(time.perf_counter() - start_time)
+
+        if dijkstra_arrival is None:
+            outcome['dijkstra_not_found'] += 1
+            continue
+        found.append(len(csa_times) - 1)
+        if arrival == math.inf:
+            outcome['csa_not_found'] += 1
+        elif abs(arrival - dijkstra_arrival) < 1e-6:
+            outcome['same'] += 1
+        elif arrival < dijkstra_arrival:
+            outcome['csa_earlier'] += 1
+        else:
+            outcome['dijkstra_earlier'] += 1
+
+    result = {
+        'connections': csa.get_num_connections(),
+        'connections_kb': csa.get_memory_bytes() / 1024,
+        'csa_build_s': csa_build,
+        'clusters': len(clusters),
+        'dijkstra_build_s': dijkstra_build,
+        'csa_ms': get_latency(csa_times),
+        'dijkstra_ms': get_latency(dijkstra_times),
+        'outcome': outcome,
+    }
+    # Дейкстра, не нашедшая путь, обычно останавливается быстро — отдельно запросы, где ответ есть у обоих
+    if found:
+        result['csa_found_ms'] = get_latency([csa_times[i] for i in found])
+        result['dijkstra_found_ms'] = get_latency([dijkstra_times[i] for i in found])
+    print(f"  связей {result['connections']} ({result['connections_kb']:.0f} КБ) за {csa_build:.2f} с, "
+          f"кластеров {len(clusters)} (k={args.cluster_size}) за {dijkstra_build:.1f} с")
+    for name in ('csa_ms', 'dijkstra_ms', 'csa_found_ms', 'dijkstra_found_ms'):
+        if name in result:
+            print(f"{name:>20}: p50 {result[name]['p50']:.1f} мс, p95 {result[name]['p95']:.1f} мс")
+    print('  ответы: ' + ', '.join(f'{name} {count}' for name, count in outcome.items()))
+    return result
+
+
+def get_directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def run_patterns(graph, network, queries, args, start, end):
+    '''
+    Шаблоны пересадок на окно: время предподсчёта и размер на диске, затем запросы со случайным выходом
+    в окне — против RAPTOR с тем же числом поездок
+    '''
+    directory = get_patterns_dir(args.city, args.window)
+    patterns, build_time = None, None
+    if not args.rebuild_patterns and os.path.exists(os.path.join(directory, 'patterns.json')):
+        try:
+            patterns = TransferPatterns.load(directory, network)
+        except ValueError:
+            patterns = None  # посчитаны для другой сети
+        if patterns is not None and (patterns.meta.get('start'), patterns.meta.get('end'),
+                                     patterns.meta.get('max_rounds')) != (start, end, args.rounds):
+            patterns = None
+    if patterns is None:
+        start_time = time.perf_counter()
+        patterns = TransferPatterns.build(network, start, end, max_rounds=args.rounds, workers=args.workers,
+                                          meta={'city': args.city, 'window': args.window})
+        build_time = time.perf_counter() - start_time
+        patterns.meta['build_s'] = build_time
+        patterns.save(directory)
+    report = patterns.get_memory_report()
+
+    raptor = Raptor(network, max_rounds=args.rounds)
+    rnd = random.Random(args.seed)
+    raptor_times, pattern_times = [], []
+    outcome = {'same': 0, 'patterns_earlier': 0, 'patterns_later': 0}
+    for source, target in queries:
+        departure = rnd.randrange(start, end)
+        start_time = time.perf_counter()
+        arrival, _, _ = raptor.earliest_arrival(source, target, departure)
+        raptor_times.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        pattern_arrival, _, _ = patterns.earliest_arrival(source, target, departure)
+        pattern_times.append(time.perf_counter() - start_time)
+        if pattern_arrival == arrival or abs(pattern_arrival - arrival) < 1e-6:
+            outcome['same'] += 1
+        elif pattern_arrival < arrival:
+            outcome['patterns_earlier'] += 1
+        else:
+            outcome['patterns_later'] += 1
+
+    result = {
+        'build_s': build_time if build_time is not None else patterns.meta.get('build_s'),
+        'loaded': build_time is None,
+        'disk_mb': get_directory_size(directory) / 2 ** 20,
+        'report': report,
+        'raptor_ms': get_latency(raptor_times),
+        'patterns_ms': get_latency(pattern_times),
+        'outcome': outcome,
+        # шаблоны точны: любой другой ответ, раньше RAPTOR или позже, — ошибка
+        'patterns_mismatches': outcome['patterns_earlier'] + outcome['patterns_later'],
+    }
+    print(f"  шаблоны {'с диска' if result['loaded'] else 'посчитаны'} (предподсчёт {result['build_s']:.1f} с): "
+          f"{report['patterns']} шаблонов, {report['nodes']} узлов, в среднем {report['avg_nodes']:.0f} на остановку, "
+          f"прямых пар {report['direct_pairs']}, {report['memory_mb']:.1f} МБ, на диске {result['disk_mb']:.1f} МБ")
+    for name in ('raptor_ms', 'patterns_ms'):
+        print(f"{name:>20}: p50 {result[name]['p50']:.1f} мс, p95 {result[name]['p95']:.1f} мс")
+    print('  ответы: ' + ', '.join(f'{name} {count}' for name, count in outcome.items())
+          + f", расхождений с RAPTOR {result['patterns_mismatches']}")
+    return result
+
+
+def main():
+    args = parse_args()
+    graph, network, transfers_time = build_model(args)
+    start, end = map(parse_clock, args.window.split('-'))
+    queries = get_queries(graph, network, args.queries, args.max_walk, args.seed)
+    engines = args.engines.split(',')
+    print(f"{args.city}: {network.get_num_stops()} остановок, {network.get_num_routes()} шаблонов рейсов, "
+          f"{len(network.transfer_indices)} пересадок за {transfers_time:.1f} с, {len(queries)} запросов, "
+          f"окно {args.window}")
+
+    result = {
+        'meta': {'city': args.city, 'gtfs': args.gtfs, 'stops': network.get_num_stops(),
+                 'routes': network.get_num_routes(), 'transfers': len(network.transfer_indices),
+                 'transfers_s': transfers_time, 'queries': len(queries), 'window': args.window,
+                 'rounds': args.rounds},
+    }
+    if 'profile' in engines:
+        result['profile'] = run_profile(network, queries, args, start, end)
+    if 'mcraptor' in engines:
+        result['mcraptor'] = run_mcraptor(network, queries, args, start)
+    if 'csa' in engines:
+        result['csa'] = run_csa(graph, network, args, start)
+    if 'patterns' in engines:
+        result['patterns'] = run_patterns(graph, network, queries, args, start, end)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import time
+
+from old_code.Graphs.CSRGraph import CSRGraph
+from old_code.Graphs.ContractionHierarchy import ContractionHierarchy
+from old_code.Graphs.HubLabels import HubLabels
+from old_code.Graphs.WeightProfiles import PROFILES
+from old_code.Modes.ModeRegistry import CITY_GRAPHS_DIR, get_city_file, get_mode
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.build_hub_labels --city Kyzyl --city Seversk --mode walk --workers 8
+    python -m old_code.build_hub_labels --city Kyzyl --profile scooter --check 200
+Метки лежат в my_code/city_graphs/hub_labels/<город>_<режим>_<профиль>, открываются HubLabels.load (mmap).
+Отчёт по памяти печатается и сохраняется в labels.json — по нему решаем, каким городам метки нужны.
+'''
+
+LABELS_DIR = os.path.normpath(os.path.join(CITY_GRAPHS_DIR, 'hub_labels'))
+
+
+def get_labels_dir(city, mode, profile):
+    return os.path.join(LABELS_DIR, f"{city.replace(' ', '_')}_{mode}_{profile}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Построение меток хабов для запросов расстояний')
+    parser.add_argument('--city', action='append', required=True, help='можно несколько')
+    parser.add_argument('--mode', default='walk')
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='профиль весов, по умолчанию — длина')
+    parser.add_argument('--workers', type=int, help='процессов для сборки меток, по умолчанию — по числу ядер')
+    parser.add_argument('--check', type=int, default=0, help='сверить столько случайных пар с Дейкстрой')
+    return parser.parse_args()
+
+
+def check(labels, csr, count, seed=0):
+    '''Сверка с Дейкстрой по CSR: (расхождений, мкс на запрос по меткам, мс на Дейкстру)'''
+    rnd = random.Random(seed)
+    pairs = [(rnd.randrange(csr.get_num_nodes()), rnd.randrange(csr.get_num_nodes())) for _ in range(count)]
+    mismatches, labels_time, dijkstra_time = 0, 0.0, 0.0
+    for source, target in pairs:
+        start_time = time.perf_counter()
+        distance = labels.distance(source, target)
+        labels_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        dist, _ = csr.dijkstra(source, target)
+        dijkstra_time += time.perf_counter() - start_time
+        expected = dist.get(target, float('inf'))
+        if distance != expected and abs(distance - expected) > 1e-3 * max(1.0, expected):
+            mismatches += 1
+    return mismatches, labels_time / count * 1e6, dijkstra_time / count * 1e3
+
+
+def main():
+    args = parse_args()
+    for city in args.city:
+        start_time = time.perf_counter()
+        graph = get_mode(args.mode, get_city_file(city)).get_graph()
+        if args.profile:
+            graph.set_weight_profile(PROFILES[args.profile]())
+        csr = CSRGraph.from_graph(graph)
+        load_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        ch = ContractionHierarchy.build(csr)
+        ch_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        profile = graph.weight_profile.name
+        labels = HubLabels.build(csr, ch, workers=args.workers,
+                                 meta={'city': city, 'mode': args.mode, 'profile': profile})
+        labels_time = time.perf_counter() - start_time
+        directory = get_labels_dir(city, args.mode, profile)
+        labels.save(directory)
+
+        report = labels.get_memory_report()
+        print(f"{city}/{args.mode} ({profile}): граф {report['nodes']} вершин за {load_time:.1f} с, "
+              f"порядок сжатия {ch_time:.1f} с ({ch.shortcuts} сокращений), метки {labels_time:.1f} с")
+        print(f"  {report['entries']} записей, метка в среднем {report['avg_label']:.1f}, "
+              f"p95 {report['p95_label']:.0f}, макс {report['max_label']}, {report['memory_mb']:.1f} МБ -> {directory}")
+        if args.check:
+            mismatches, labels_us, dijkstra_ms = check(labels, csr, args.check)
+            print(f'  проверка {args.check} пар: расхождений {mismatches}, '
+                  f'метки {labels_us:.1f} мкс, Дейкстра {dijkstra_ms:.2f} мс на запрос')
+
+
+if __name__ == '__main__':
+    main()
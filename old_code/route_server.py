@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+
+from old_code.Graphs.NodeOrder import CURVES
+from old_code.Modes.ModeRegistry import get_city_file
+from old_code.Server.RouteServer import LoadedGraph, RouteServer
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.route_server --graph Kyzyl:walk --graph Kyzyl:scooter --port 8080
+    python -m old_code.route_server --config server.json
+    python -m old_code.route_server --graph Kyzyl:walk --workers 8 --processes
+где server.json: {"port": 8080, "workers": 4, "queue_size": 64, "processes": false, "cache_entries": 100000,
+                  "keep_components": "largest",
+                  "graphs": [{"city": "Kyzyl", "mode": "walk"}, {"city": "x", "mode": "walk", "file": "x.osm.pbf"}]}
+keep_components и node_order ("hilbert"/"morton") можно задать и у отдельного графа, он важнее общего
+Пример запроса:
+    curl -d '{"city": "Kyzyl", "mode": "walk", "start": [51.72, 94.44], "end": [51.70, 94.40]}' localhost:8080/route
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='HTTP/JSON сервер маршрутов с заранее загруженными графами')
+    parser.add_argument('--config', help='json с настройками и списком графов')
+    parser.add_argument('--graph', action='append', default=[], help='CITY:MODE[:PROFILE], можно несколько; PROFILE — distance/walk/scooter')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--cache-entries', type=int, default=100000, help='размер кэша маршрутов, 0 — без кэша')
+    parser.add_argument('--keep-components', help='largest — оставить только самую большую компоненту графа, '
+                                                  'число — компоненты не меньше стольких узлов')
+    parser.add_argument('--node-order', choices=CURVES,
+                        help='перенумеровать узлы вдоль кривой, чтобы соседи по карте лежали рядом в памяти')
+    parser.add_argument('--processes', action='store_true',
+                        help='воркеры-процессы над одной копией графа в разделяемой памяти вместо потоков')
+    return parser.parse_args()
+
+
+def parse_keep(value):
+    if value is None or value == 'largest':
+        return value
+    return int(value)
+
+
+def main():
+    args = parse_args()
+    config = {'host': args.host, 'port': args.port, 'workers': args.workers, 'queue_size': args.queue_size,
+              'processes': args.processes, 'cache_entries': args.cache_entries,
+              'keep_components': args.keep_components, 'node_order': args.node_order, 'graphs': []}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    for item in args.graph:
+        city, _, rest = item.partition(':')
+        mode, _, profile = rest.partition(':')
+        config['graphs'].append({'city': city, 'mode': mode or 'walk', 'profile': profile or None})
+
+    graphs = []
+    for item in config['graphs']:
+        mode = item.get('mode', 'walk')
+        graph = LoadedGraph(item['city'], mode, item.get('file') or get_city_file(item['city']),
+                            profile=item.get('profile'),
+                            keep_components=parse_keep(item.get('keep_components', config['keep_components'])),
+                            node_order=item.get('node_order', config['node_order']))
+        print(f"Загружен {item['city']}/{mode} ({graph.profile}): {graph.graph.get_graph().number_of_nodes()} вершин "
+              f'за {graph.load_time:.1f} с')
+        graphs.append(graph)
+
+    server = RouteServer(graphs, host=config['host'], port=config['port'],
+                         workers=config['workers'], queue_size=config['queue_size'],
+                         processes=config['processes'], cache_entries=config['cache_entries'])
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
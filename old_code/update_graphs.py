@@ -0,0 +1,52 @@
+import argparse
+import time
+
+from old_code.Modes.CityGraphCache import CityGraphCache
+
+'''
+Запуск из корня репозитория:
+    python -m old_code.update_graphs --city Kyzyl --city Seversk --mode walk --changes 251027.osc.gz
+    python -m old_code.update_graphs --city Kyzyl --rebuild
+Графы лежат в my_code/city_graphs/cache; если кэша ещё нет, граф один раз строится из .pbf города.
+Файлы изменений применяются по порядку, после всех — кэш сохраняется.
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Обновление сохранённых графов городов файлами изменений OSM')
+    parser.add_argument('--city', action='append', required=True, help='можно несколько')
+    parser.add_argument('--mode', default='walk')
+    parser.add_argument('--changes', action='append', default=[], help='.osc/.osc.gz, по порядку, можно несколько')
+    parser.add_argument('--rebuild', action='store_true', help='построить граф из .pbf заново, а не брать кэш')
+    parser.add_argument('--location-index', help='строить через фильтры osmium с индексом координат '
+                                                   '(sparse_file_array, sparse_mmap_array, ...), см. DefaultMode')
+    parser.add_argument('--keep-components', help='при построении: largest — только самая большая компонента, '
+                                                  'число — компоненты не меньше стольких узлов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    keep = args.keep_components
+    keep = int(keep) if keep is not None and keep != 'largest' else keep
+    for city in args.city:
+        start_time = time.perf_counter()
+        if args.rebuild:
+            cache = CityGraphCache.build(city, args.mode, location_index=args.location_index, keep_components=keep)
+        else:
+            cache = CityGraphCache.load_or_build(city, args.mode, location_index=args.location_index,
+                                                 keep_components=keep)
+        nx_graph = cache.graph.get_graph()
+        print(f'{city}/{args.mode}: {nx_graph.number_of_nodes()} вершин, {nx_graph.number_of_edges()} рёбер, '
+              f'загружен за {time.perf_counter() - start_time:.1f} с')
+        for change_file in args.changes:
+            report = cache.apply_changes(change_file)
+            print(f"  {report['file']}: путей +{report['ways_added']} ~{report['ways_modified']} "
+                  f"-{report['ways_removed']}, вершин +{report['nodes_added']} -{report['nodes_removed']} "
+                  f"сдвинуто {report['nodes_moved']}, без координат {report['missing_locations']}, "
+                  f"{report['time_s']:.2f} с")
+        cache.save()
+
+
+if __name__ == '__main__':
+    main()